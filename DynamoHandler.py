@@ -1,16 +1,49 @@
 """
 Module to manage dynamodb queries
 """
+import base64
+import binascii
+import json
 import logging
-import boto3
-import dateutil.parser
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ddb_metrics import bind
+from dynamo_client import get_client
+from dynamo_codec import Schema, compile_schema, from_epoch, parse_datetime, to_epoch
 
 logger = logging.getLogger(__name__)
 
+# marks the end of a segment in a parallel scan
+_SCAN_DONE = object()
+
+# shard counts of the counters seen by the container, (env, counter) -> (shards, time read)
+_counter_shards = {}
+_counter_shards_lock = threading.Lock()
+
+def _put_unless_stopped(pages, page, stop):
+    """
+    Puts page on the queue, waiting for space unless stop is set, returns False if it was stopped
+    """
+    while not stop.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
 class DynamoDBException(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
 
+class ConflictException(DynamoDBException):
+    def __init__(self, *args, **kwargs):
+        DynamoDBException.__init__(self, *args, **kwargs)
+
 class InconsistencyException(DynamoDBException):
     def __init__(self, *args, **kwargs):
         DynamoDBException.__init__(self, *args, **kwargs)
@@ -19,22 +52,116 @@ class IntegrityException(DynamoDBException):
     def __init__(self, *args, **kwargs):
         DynamoDBException.__init__(self, *args, **kwargs)
 
+class InvalidCursorException(DynamoDBException):
+    def __init__(self, *args, **kwargs):
+        DynamoDBException.__init__(self, *args, **kwargs)
+
+class ItemNotFoundException(DynamoDBException):
+    def __init__(self, *args, **kwargs):
+        DynamoDBException.__init__(self, *args, **kwargs)
+
+class MultipleItemsFoundException(DynamoDBException):
+    def __init__(self, *args, **kwargs):
+        DynamoDBException.__init__(self, *args, **kwargs)
+
+class QueryResults(object):
+    """
+    Lazily iterates over the flattened items from a query, only asking for the next page when it is needed
+
+    The results can only be iterated over once.
+    """
+    def __init__(self, pages, max_items=None):
+        """
+        Constructor
+        """
+        self._pages = pages
+        self._max_items = max_items
+
+    def __iter__(self):
+        count = 0
+        for page in self._pages:
+            for item in page:
+                yield item
+                count += 1
+                if self._max_items and count >= self._max_items:
+                    self._pages.close()
+                    return
+
+    def first(self):
+        """
+        Returns the first item or None if there are no items
+        """
+        for item in self:
+            return item
+        return None
+
+    def exactly_one(self):
+        """
+        Returns the only item, raising ItemNotFoundException or MultipleItemsFoundException otherwise
+        """
+        items = []
+        for item in self:
+            items.append(item)
+            if len(items) > 1:
+                raise MultipleItemsFoundException("Found more than one item")
+        if len(items) == 0:
+            raise ItemNotFoundException("No item found")
+        return items[0]
+
 class DynamoHandler(object):
     DEFAULT_ITEM_LIMIT = 100
+    BATCH_WRITE_SIZE = 25
+    BATCH_GET_SIZE = 100
+    BATCH_WORKERS = 4
+    BATCH_MAX_ATTEMPTS = 8
+    BATCH_BACKOFF_BASE = 0.05
+    BATCH_BACKOFF_CAP = 2.0
+    COUNTER_MAX_SHARDS = 64
+    COUNTER_SHARDS_TTL = 60
 
     """
     Object which all data classes will extend
     """
+    # the compiled encoders and decoders, each data class gets its own when it is created
+    _dh_schema = Schema({}, {})
+
     def __init__(self):
         """
         Constructor
         """
         a = 1
 
+    def __init_subclass__(cls, **kwargs):
+        """
+        Compiles the field mappings of each data class once, rather than working out field types for every value
+        """
+        super(DynamoHandler, cls).__init_subclass__(**kwargs)
+        cls._dh_compile_schema()
+
+    @classmethod
+    def _dh_compile_schema(cls):
+        """
+        Compiles the field mappings, this needs calling again if a class changes its mappings after it is created
+        """
+        cls._dh_schema = compile_schema(
+            field_mapping=getattr(cls, "_dh_field_mapping", {}),
+            id_fields=getattr(cls, "_dh_id_fields", []),
+            sub_obj_mapping=getattr(cls, "_dh_sub_obj_mapping", {}),
+            general_decoder=lambda attribute, value: cls._dh_flatten_single_item(
+                item_type=attribute.split("_")[0].lower(),
+                item_value=value,
+                item_name=attribute
+            )
+        )
+
     def _dh_prepare_field(self, field_name, field_value, parent_name=None):
         """
         Prepares a field to be saved to dynamodb
         """
+        if parent_name is None:
+            encoder = self._dh_schema.encoders.get(field_name)
+            if encoder is not None:
+                return encoder(field_value)
         field_type = field_name.split("_")[0].lower()
         if field_type == "s":
             return {"S": field_value}
@@ -42,6 +169,9 @@ class DynamoHandler(object):
             return {"N": str(field_value)}
         elif field_type == "dt":
             return {"S": field_value.isoformat()}
+        elif field_type == "ttl":
+            # seconds since the epoch, so the attribute can be the table's time to live
+            return {"N": str(to_epoch(field_value))}
         elif field_type == "l":
             new_list = []
             if field_name.split("_")[1].lower() == "m":
@@ -79,14 +209,46 @@ class DynamoHandler(object):
             # catch all if we don't know what to do
             return DynamoHandler._dh_wrap_field(field_value)
 
+    def _dh_prepare_item(self):
+        """
+        Prepares all the mapped fields on the object to be saved to dynamodb, the key fields must be present
+        """
+        # need to check we have the keys available
+        backward_mapping = self._dh_backward_field_mapping
+        if not all(self._dh_field_mapping[key] in self.__dict__ for key in self._dh_id_fields):
+            raise DynamoDBException("Calls to _dh_create_item need all the key fields on the object including {f}".format(f=",".join(self._dh_id_fields)))
+        # prep the fields for dynamo in one pass, using the compiled encoders where there are some
+        encoders = self._dh_schema.encoders
+        attributes = {}
+        for (field, value) in self.__dict__.items():
+            key = backward_mapping.get(field)
+            # the same values _dh_save_changes treats as removing a field, so zero numbers are kept
+            if key is None or value is None or value == "":
+                continue
+            encoder = encoders.get(key)
+            if encoder is not None:
+                attributes[key] = encoder(value)
+            else:
+                attributes[key] = self._dh_prepare_field(
+                    field_name=key,
+                    field_value=value
+                )
+        return attributes
+
+    def _dh_item_keys(self):
+        """
+        Gets the key fields of the object, wrapped for dynamodb
+        """
+        return {k:DynamoHandler._dh_wrap_field(self.__dict__[self._dh_field_mapping[k]]) for k in self._dh_id_fields}
+
     def _dh_delete_item(self, env):
         """
         Deletes the item
         """
-        ddb = boto3.client("dynamodb")
-        logger.info("In delete method")
+        ddb = get_client()
+        logger.debug("In delete method")
         # get keys for update
-        keys = {k:DynamoHandler._dh_wrap_field(self.__dict__[self._dh_field_mapping[k]]) for k in self._dh_id_fields}
+        keys = self._dh_item_keys()
         params = {
             "TableName": "{t}_{e}".format(e=env, t=self._dh_table_name),
             "Key": keys
@@ -97,24 +259,11 @@ class DynamoHandler(object):
         """
         Creates the item in the database for the first time, fails if the key is duplicated
         """
-        ddb = boto3.client("dynamodb")
-        logger.info("In create method")
-        # need to check we have the keys available
-        mapped_fields = {self._dh_backward_field_mapping[k]:v for (k,v) in self.__dict__.items() if k in self._dh_backward_field_mapping.keys()}
-        if not all(key in mapped_fields.keys() for key in self._dh_id_fields):
-            raise DynamoDBException("Calls to _dh_create_item need all the key fields on the object including {f}".format(f=",".join(self._dh_id_fields)))
-        # prep the fields for dynamo
-        attributes = {}
-        for key in mapped_fields:
-            logger.info("Working on field {f}".format(f=key))
-            if mapped_fields[key]:
-                attributes.update({
-                    key: self._dh_prepare_field(
-                        field_name=key,
-                        field_value=mapped_fields[key]
-                    )
-                })
-        logger.info("Prepared object to be saved", extra={"item": attributes})
+        ddb = get_client()
+        logger.debug("In create method")
+        attributes = self._dh_prepare_item()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Prepared object to be saved", extra={"item": attributes})
         params = {
             "TableName": "{t}_{e}".format(e=env, t=self._dh_table_name),
             "Item": attributes
@@ -122,25 +271,26 @@ class DynamoHandler(object):
         if check_uniqueness:
             # we need to ensure a field is unique
             if check_uniqueness in self._dh_backward_field_mapping:
-                logger.info("Checking for uniqueness of '{field}'".format(field=check_uniqueness))
+                logger.debug("Checking for uniqueness of '%s'", check_uniqueness)
                 params.update({
                     "ConditionExpression": "attribute_not_exists({attr})".format(attr=self._dh_backward_field_mapping[check_uniqueness])
                 })
-                logger.info("Updated parameters are", extra={"params": params})
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Updated parameters are", extra={"params": params})
             else:
                 raise DynamoDBException("Cannot check uniqueness on a field which does not exist")
         try:
             ddb.put_item(**params)
-            logging.info("Item created")
+            logger.debug("Item created")
         except ddb.exceptions.ConditionalCheckFailedException as err:
-            logging.info("Uniqueness check failed, raising")
+            logger.debug("Uniqueness check failed, raising")
             raise IntegrityException("Uniqueness check failed")
 
     def _dh_save_changes(self, env):
         """
         Saves the in memory changes
         """
-        logger.info("In save changes method")
+        logger.debug("In save changes method")
         if len(self._dh_modified_fields) == 0:
             raise DynamoDBException("No modified fields")
         else:
@@ -155,11 +305,12 @@ class DynamoHandler(object):
                         field_name=self._dh_backward_field_mapping[mod_field],
                         field_value=self.__dict__[mod_field]
                     )})
-            logger.info("Fields that will be changed are", extra={
-                "added": fields_added,
-                "updated": fields_changed,
-                "removed": fields_removed
-            })
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Fields that will be changed are", extra={
+                    "added": fields_added,
+                    "updated": fields_changed,
+                    "removed": fields_removed
+                })
             update_map = {}
             for f in fields_added:
                 update_map.update({
@@ -182,9 +333,9 @@ class DynamoHandler(object):
                     }
                 })
             # get keys for update
-            keys = {k:DynamoHandler._dh_wrap_field(self.__dict__[self._dh_field_mapping[k]]) for k in self._dh_id_fields}
+            keys = self._dh_item_keys()
             # perform update
-            ddb = boto3.client("dynamodb")
+            ddb = get_client()
             params = {
                 "TableName": "{t}_{e}".format(e=env, t=self._dh_table_name),
                 "Key": keys,
@@ -192,10 +343,86 @@ class DynamoHandler(object):
             }
             ddb.update_item(**params)
             # reset updated fields
-            logger.info("Changes saved, resetting changes list")
-            logger.info(self)
+            logger.debug("Changes saved, resetting changes list")
+            logger.debug(self)
             self._dh_modified_fields[:] = []
 
+    def _dh_exists_condition(self, condition=None):
+        """
+        Builds a condition which holds if the item exists, and condition holds as well if it is given
+
+        condition = clauses joined by AND
+        """
+        exists = "attribute_exists({k})".format(k=self._dh_id_fields[0])
+        if condition:
+            return "{e} AND {c}".format(e=exists, c=condition)
+        return exists
+
+    def _dh_condition_failure(self, env):
+        """
+        Works out why a conditional write of the item failed, returning ItemNotFoundException if the item does not
+        exist and ConflictException if it does but did not match the condition
+        """
+        item = self._dh_get_item(
+            env=env,
+            consistent=True,
+            **{self._dh_field_mapping[k]: self.__dict__[self._dh_field_mapping[k]] for k in self._dh_id_fields}
+        )
+        if not item:
+            return ItemNotFoundException("Item does not exist")
+        return ConflictException("Item does not match the condition")
+
+    def _dh_conditional_update(self, env, condition=None, values=None, names=None, increment=None, return_values="ALL_NEW"):
+        """
+        Saves the in memory changes with one UpdateExpression, only if the item exists and condition holds
+
+        condition = clauses joined by AND, using values and names
+        increment = fields which are moved on by one, starting from zero if they are not set
+        Returns the item as given by return_values, flattened, which is the item after the update by default.  Raises
+        ItemNotFoundException if the item does not exist and ConflictException if condition does not hold.
+        """
+        ddb = get_client()
+        expression, update_names, update_values = self._dh_build_update_expression(increment=increment)
+        update_names.update(names or {})
+        update_values.update(values or {})
+        params = DynamoHandler._dh_with_condition({
+            "TableName": self._dh_table(env),
+            "Key": self._dh_item_keys(),
+            "UpdateExpression": expression,
+            "ReturnValues": return_values
+        }, self._dh_exists_condition(condition), update_values, update_names)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Conditional update with parameters", extra={"params": params})
+        try:
+            response = ddb.update_item(**params)
+        except ddb.exceptions.ConditionalCheckFailedException:
+            logger.debug("Update condition failed")
+            raise self._dh_condition_failure(env)
+        self._dh_modified_fields[:] = []
+        return self._dh_flatten_item(response.get("Attributes", {}))
+
+    def _dh_conditional_delete(self, env, condition=None, values=None, names=None):
+        """
+        Deletes the item, only if it exists and condition holds
+
+        Returns the item as it was before it was deleted, flattened.  Raises ItemNotFoundException if the item does
+        not exist and ConflictException if condition does not hold.
+        """
+        ddb = get_client()
+        params = DynamoHandler._dh_with_condition({
+            "TableName": self._dh_table(env),
+            "Key": self._dh_item_keys(),
+            "ReturnValues": "ALL_OLD"
+        }, self._dh_exists_condition(condition), values, names)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Conditional delete with parameters", extra={"params": params})
+        try:
+            response = ddb.delete_item(**params)
+        except ddb.exceptions.ConditionalCheckFailedException:
+            logger.debug("Delete condition failed")
+            raise self._dh_condition_failure(env)
+        return self._dh_flatten_item(response.get("Attributes", {}))
+
     def _dh_update_field(self, field_name, field_value, ignore_inconsistency=False):
         """
         Updates the in memory representation of a field and then 
@@ -213,15 +440,207 @@ class DynamoHandler(object):
                     field_name: field_value
                 })
             else:
-                logger.info(self)
+                logger.debug(self)
                 raise InconsistencyException("{field} is already modified and not yet saved".format(field=field_name))
 
+    def _dh_table(self, env):
+        """
+        Gets the full name of the table for the environment
+        """
+        return "{t}_{e}".format(e=env, t=self._dh_table_name)
+
+    def _dh_put_operation(self, env, condition=None, values=None, names=None):
+        """
+        Builds a Put for _dh_transact_write, optionally only applied if condition holds
+        """
+        operation = {
+            "TableName": self._dh_table(env),
+            "Item": self._dh_prepare_item()
+        }
+        return {"Put": DynamoHandler._dh_with_condition(operation, condition, values, names)}
+
+    def _dh_delete_operation(self, env, condition=None, values=None, names=None):
+        """
+        Builds a Delete for _dh_transact_write, optionally only applied if condition holds
+        """
+        operation = {
+            "TableName": self._dh_table(env),
+            "Key": self._dh_item_keys()
+        }
+        return {"Delete": DynamoHandler._dh_with_condition(operation, condition, values, names)}
+
+    def _dh_condition_check_operation(self, env, condition, values=None, names=None):
+        """
+        Builds a ConditionCheck for _dh_transact_write, which fails the transaction unless the item matches condition
+        """
+        operation = {
+            "TableName": self._dh_table(env),
+            "Key": self._dh_item_keys()
+        }
+        return {"ConditionCheck": DynamoHandler._dh_with_condition(operation, condition, values, names)}
+
+    def _dh_update_operation(self, env, condition=None, values=None, names=None, increment=None):
+        """
+        Builds an Update of the modified fields for _dh_transact_write, optionally only applied if condition holds
+
+        increment = fields which are moved on by one, starting from zero if they are not set
+        """
+        expression, update_names, update_values = self._dh_build_update_expression(increment=increment)
+        update_names.update(names or {})
+        update_values.update(values or {})
+        operation = {
+            "TableName": self._dh_table(env),
+            "Key": self._dh_item_keys(),
+            "UpdateExpression": expression
+        }
+        return {"Update": DynamoHandler._dh_with_condition(operation, condition, update_values, update_names)}
+
+    def _dh_build_update_expression(self, increment=None):
+        """
+        Builds the update expression, names and values which save the modified fields and increment any fields given
+        """
+        increment = increment or []
+        if len(self._dh_modified_fields) == 0 and not increment:
+            raise DynamoDBException("No modified fields")
+        set_bits = []
+        remove_bits = []
+        names = {}
+        values = {}
+        for (i, mod_field) in enumerate(self._dh_modified_fields):
+            attribute = self._dh_backward_field_mapping[mod_field]
+            names.update({"#u{i}".format(i=i): attribute})
+            if self.__dict__[mod_field] == "" or self.__dict__[mod_field] == None:
+                remove_bits.append("#u{i}".format(i=i))
+            else:
+                set_bits.append("#u{i} = :u{i}".format(i=i))
+                values.update({":u{i}".format(i=i): self._dh_prepare_field(
+                    field_name=attribute,
+                    field_value=self.__dict__[mod_field]
+                )})
+        for (i, field) in enumerate(increment):
+            names.update({"#i{i}".format(i=i): self._dh_backward_field_mapping[field]})
+            set_bits.append("#i{i} = if_not_exists(#i{i}, :zero) + :one".format(i=i))
+            values.update({":zero": {"N": "0"}, ":one": {"N": "1"}})
+        expression = ""
+        if set_bits:
+            expression = "SET " + ", ".join(set_bits)
+        if remove_bits:
+            expression = (expression + " REMOVE " + ", ".join(remove_bits)).strip()
+        return expression, names, values
+
+    @staticmethod
+    def _dh_with_condition(operation, condition, values, names):
+        """
+        Adds a condition expression and its values and names to an operation
+        """
+        if condition:
+            operation.update({
+                "ConditionExpression": condition
+            })
+        if values:
+            operation.update({
+                "ExpressionAttributeValues": values
+            })
+        if names:
+            operation.update({
+                "ExpressionAttributeNames": names
+            })
+        return operation
+
+    @staticmethod
+    def _dh_transact_write(operations):
+        """
+        Applies the operations, which can be for different tables, all together or not at all
+
+        Raises IntegrityException if the transaction was cancelled because a condition did not hold.
+        """
+        ddb = get_client()
+        logger.info("Writing transaction of %d operations", len(operations))
+        try:
+            ddb.transact_write_items(TransactItems=operations)
+        except ddb.exceptions.TransactionCanceledException as err:
+            reasons = [r.get("Code") for r in err.response.get("CancellationReasons", [])]
+            logger.info("Transaction cancelled", extra={"reasons": reasons})
+            if "ConditionalCheckFailed" in reasons:
+                raise IntegrityException("Transaction condition failed")
+            raise
+
+    @classmethod
+    def _dh_batch_write(cls, env, put_items=None, delete_items=None):
+        """
+        Writes and deletes many items using BatchWriteItem
+
+        put_items = objects to be saved
+        delete_items = objects to be deleted, only the key fields are needed
+
+        Requests are sent in chunks of BATCH_WRITE_SIZE on a pool of BATCH_WORKERS threads, unprocessed items are
+        retried with jittered backoff.  Returns a tuple of two lists, one per put item and one per delete item, 
+        which are True where the write succeeded.
+        """
+        put_items = put_items or []
+        delete_items = delete_items or []
+        table_name = "{t}_{e}".format(e=env, t=cls._dh_table_name)
+        requests = []
+        for item in put_items:
+            requests.append({"PutRequest": {"Item": item._dh_prepare_item()}})
+        for item in delete_items:
+            requests.append({"DeleteRequest": {"Key": item._dh_item_keys()}})
+        chunks = [
+            list(range(start, min(start + cls.BATCH_WRITE_SIZE, len(requests))))
+            for start in range(0, len(requests), cls.BATCH_WRITE_SIZE)
+        ]
+        logger.info("Writing %d requests in %d chunks", len(requests), len(chunks))
+        results = [False] * len(requests)
+        with ThreadPoolExecutor(max_workers=cls.BATCH_WORKERS) as executor:
+            for chunk, failed in zip(chunks, executor.map(bind(lambda c: cls._dh_write_chunk(table_name, [requests[i] for i in c])), chunks)):
+                for position, index in enumerate(chunk):
+                    results[index] = position not in failed
+        return results[:len(put_items)], results[len(put_items):]
+
+    @classmethod
+    def _dh_write_chunk(cls, table_name, requests):
+        """
+        Sends a single chunk of write requests, retrying unprocessed items, returns the set of positions which failed
+        """
+        ddb = get_client()
+        positions = {cls._dh_request_key(r): i for (i, r) in enumerate(requests)}
+        pending = requests
+        attempt = 0
+        while pending:
+            try:
+                response = ddb.batch_write_item(RequestItems={table_name: pending})
+            except Exception as err:
+                logger.error("Batch write failed: {e}".format(e=err))
+                break
+            pending = response.get("UnprocessedItems", {}).get(table_name, [])
+            attempt += 1
+            if not pending or attempt >= cls.BATCH_MAX_ATTEMPTS:
+                break
+            # full jitter backoff before retrying what dynamo did not process
+            delay = random.uniform(0, min(cls.BATCH_BACKOFF_CAP, cls.BATCH_BACKOFF_BASE * (2 ** attempt)))
+            logger.info("%d items unprocessed, retrying in %.3fs", len(pending), delay)
+            time.sleep(delay)
+        if pending:
+            logger.warning("Giving up on {n} items".format(n=len(pending)))
+        return set(positions[cls._dh_request_key(r)] for r in pending)
+
+    @classmethod
+    def _dh_request_key(cls, request):
+        """
+        Gets a hashable version of the key for a batch write request
+        """
+        if "PutRequest" in request:
+            item = request["PutRequest"]["Item"]
+            return ("put", json.dumps({k: item[k] for k in cls._dh_id_fields}, sort_keys=True))
+        return ("delete", json.dumps(request["DeleteRequest"]["Key"], sort_keys=True))
+
     @classmethod
     def _dh_flatten_field(cls, item_name, item_value):
         """
         Flattens a single field
         """
-        logger.debug("Flattening field", extra={"item_name": item_name, "item_value": item_value})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Flattening field", extra={"item_name": item_name, "item_value": item_value})
         # check if field is an ID field
         if item_name in cls._dh_id_fields:
             if "N" in item_value:
@@ -270,8 +689,10 @@ class DynamoHandler(object):
             return string
         elif item_type == "dt":
             string = item_value["S"]
-            date = dateutil.parser.parse(string)
+            date = parse_datetime(string)
             return date
+        elif item_type == "ttl":
+            return from_epoch(item_value["N"])
         elif item_type == "l":
             # need to know what the subtype of the item is
             item_sub_type = item_name.split("_")[1].lower()
@@ -302,11 +723,19 @@ class DynamoHandler(object):
         """
         Flattens a single item
         """
-        logger.debug("Flattening this item", extra={"item": item})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Flattening this item", extra={"item": item})
+        decoders = cls._dh_schema.decoders
         new_item = {}
-        for key in item:
-            if not key == "_meta":
-                new_item.update(cls._dh_flatten_field(key, item[key]))
+        for (key, value) in item.items():
+            if key == "_meta":
+                continue
+            decoder = decoders.get(key)
+            if decoder is not None:
+                name, decode = decoder
+                new_item[name] = decode(value)
+            else:
+                new_item.update(cls._dh_flatten_field(key, value))
         return new_item
 
     @classmethod
@@ -314,10 +743,7 @@ class DynamoHandler(object):
         """
         Flattens all the items returned from Dynamo
         """
-        new_items = []
-        for i in range(0, len(items)):
-            new_items.append(cls._dh_flatten_item(items[i]))
-        return new_items
+        return [cls._dh_flatten_item(item) for item in items]
 
     @classmethod
     def _dh_get_and_filter_with_index(cls, env, index=None, consistent=False, custom_key_filter=None, custom_filter_args=None, **kwargs):
@@ -330,7 +756,133 @@ class DynamoHandler(object):
         custom_filter_args = dict of values for custom key filter
         **kwargs = the values to filter on
         """
-        ddb = boto3.client("dynamodb")
+        items = list(cls._dh_query_iter(
+            env=env,
+            index=index,
+            consistent=consistent,
+            custom_key_filter=custom_key_filter,
+            custom_filter_args=custom_filter_args,
+            **kwargs
+        ))
+        logger.debug("Finished query, got %d items", len(items))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Flattened items are", extra={"items": items})
+        return items
+
+    @classmethod
+    def _dh_query_iter(cls, env, index=None, consistent=False, custom_key_filter=None, custom_filter_args=None, max_items=None, page_size=None, **kwargs):
+        """
+        Same as _dh_get_and_filter_with_index but returns QueryResults, which only queries for pages as they are needed
+
+        max_items = stop after this many items
+        page_size = number of items to read per page, defaults to DEFAULT_ITEM_LIMIT
+        """
+        params = cls._dh_build_query_params(
+            env=env,
+            index=index,
+            consistent=consistent,
+            custom_key_filter=custom_key_filter,
+            custom_filter_args=custom_filter_args,
+            **kwargs
+        )
+        if page_size:
+            params.update({
+                "Limit": page_size
+            })
+        if max_items and "FilterExpression" not in params:
+            # the limit is applied before any filter, so it can only be lowered when there is no filter
+            params.update({
+                "Limit": min(params["Limit"], max_items)
+            })
+        return QueryResults(cls._dh_query_pages(params), max_items=max_items)
+
+    @classmethod
+    def _dh_query_page(cls, env, index=None, page_size=None, cursor=None, scan_forward=True, **kwargs):
+        """
+        Reads a single page of a query, returning the flattened items and a cursor for the next page
+
+        page_size = number of items in the page, defaults to DEFAULT_ITEM_LIMIT
+        cursor = the cursor returned with the previous page, None for the first page
+        scan_forward = False to read the index sort key in descending order
+
+        The cursor is None when there are no more pages.
+        """
+        ddb = get_client()
+        params = cls._dh_build_query_params(
+            env=env,
+            index=index,
+            **kwargs
+        )
+        params.update({
+            "Limit": page_size or cls.DEFAULT_ITEM_LIMIT,
+            "ScanIndexForward": scan_forward
+        })
+        if cursor:
+            start_key = cls._dh_decode_cursor(cursor)
+            # a cursor can only continue the query it came from
+            for (field, value) in kwargs.items():
+                key = cls._dh_backward_field_mapping[field]
+                if key in start_key and start_key[key] != cls._dh_wrap_field(value):
+                    raise InvalidCursorException("Cursor does not belong to this query")
+            params.update({
+                "ExclusiveStartKey": start_key
+            })
+        response = ddb.query(**params)
+        items = cls._dh_flatten_items(response["Items"])
+        next_cursor = None
+        if "LastEvaluatedKey" in response:
+            next_cursor = cls._dh_encode_cursor(response["LastEvaluatedKey"])
+        logger.debug("Got page of %d items", len(items))
+        return items, next_cursor
+
+    @staticmethod
+    def _dh_encode_cursor(last_evaluated_key):
+        """
+        Turns a LastEvaluatedKey into an opaque cursor string
+        """
+        return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, sort_keys=True).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _dh_decode_cursor(cursor):
+        """
+        Turns a cursor string back into an ExclusiveStartKey
+        """
+        try:
+            start_key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        except (ValueError, TypeError, AttributeError, binascii.Error):
+            raise InvalidCursorException("Cursor is not valid")
+        if not isinstance(start_key, dict):
+            raise InvalidCursorException("Cursor is not valid")
+        return start_key
+
+    @classmethod
+    def _dh_query_pages(cls, params):
+        """
+        Generator which runs a query, yielding each page of flattened items
+        """
+        ddb = get_client()
+        params = dict(params)
+        keep_scanning = True
+        logger.debug("Starting query...")
+        while keep_scanning:
+            response = ddb.query(**params)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Items are", extra={"items": response["Items"]})
+            yield cls._dh_flatten_items(response["Items"])
+            if "LastEvaluatedKey" in response:
+                # there is still more to go
+                params.update({
+                    "ExclusiveStartKey": response["LastEvaluatedKey"]
+                })
+            else:
+                # we are done
+                keep_scanning = False
+
+    @classmethod
+    def _dh_build_query_params(cls, env, index=None, consistent=False, custom_key_filter=None, custom_filter_args=None, **kwargs):
+        """
+        Builds the parameters for a query using the index and index keys, filtering on the other values provided in kwargs
+        """
         # check that we have the fields we need
         mapped_fields = {cls._dh_backward_field_mapping[k]:v for (k,v) in kwargs.items()}
         if index and not all(key in mapped_fields.keys() for key in cls._dh_indexes[index]):
@@ -349,7 +901,7 @@ class DynamoHandler(object):
         if custom_key_filter:
             expression_bits.append(custom_key_filter)
         key_expression = " AND ".join(expression_bits)
-        logger.info("Key expression: {expr}".format(expr=key_expression))
+        logger.debug("Key expression: %s", key_expression)
         # create filter expression, if we have anything in kwargs which is not a key
         expression_bits = []
         if index:
@@ -360,12 +912,13 @@ class DynamoHandler(object):
                 expression_bits.append("{key} = :{val}".format(key=key, val=cls._dh_field_mapping[key]))
         filter_expression = " AND ".join(expression_bits)
         if filter_expression:
-            logger.info("Filter expression: {expr}".format(expr=filter_expression))
+            logger.debug("Filter expression: %s", filter_expression)
         # create attribute expression dict
         attributes = {":{key}".format(key=k):cls._dh_wrap_field(v) for (k,v) in kwargs.items()}
         if custom_filter_args:
             attributes.update(custom_filter_args)
-        logger.info("Expression attribute list", extra={"attributes": attributes})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Expression attribute list", extra={"attributes": attributes})
         # create parameters for query
         params = {
             "TableName": "{t}_{e}".format(e=env, t=cls._dh_table_name),
@@ -387,31 +940,10 @@ class DynamoHandler(object):
             params.update({
                 "FilterExpression": filter_expression
             })
-        # run query
-        keep_scanning = True
-        logger.info("Starting query...")
-        items = []
-        while keep_scanning:
-            response = ddb.query(**params)
-            items = items + response["Items"]
-            if "LastEvaluatedKey" in response:
-                # there is still more to go
-                params.update({
-                    "ExclusiveStartKey": response["LastEvaluatedKey"]
-                })
-            else:
-                # we are done
-                keep_scanning = False
-        logger.info("Finished query, got {n} items".format(n=len(items)))
-        logger.debug("Items are", extra={"items": items})
-        # flatten items
-        items = cls._dh_flatten_items(items)
-        logger.debug("Flattened items are", extra={"items": items})
-        return items
-        
+        return params
 
     @classmethod
-    def _dh_get_items(cls, env, consistent=False, **kwargs):
+    def _dh_get_items(cls, env, consistent=False, segments=1, page_size=None, **kwargs):
         """
         Gets a list of items filtering using attributes in kwargs if provided
 
@@ -419,10 +951,30 @@ class DynamoHandler(object):
 
         Rather use _dh_get_and_filter_with_index or _dh_get_and_filter
         """
-        ddb = boto3.client("dynamodb")
+        items = list(cls._dh_scan_iter(
+            env=env,
+            consistent=consistent,
+            segments=segments,
+            page_size=page_size,
+            **kwargs
+        ))
+        logger.debug("Finished scan, got %d items", len(items))
+        return items
+
+    @classmethod
+    def _dh_scan_iter(cls, env, consistent=False, segments=1, page_size=None, **kwargs):
+        """
+        Generator which scans the table, yielding flattened items as the pages arrive
+
+        env = environment to scan
+        consistent = do a consistent read
+        segments = number of segments to scan in parallel, each on its own thread
+        page_size = number of items to read per page, defaults to DEFAULT_ITEM_LIMIT
+        **kwargs = the values to filter on
+        """
         params = {
             "TableName": "{t}_{e}".format(e=env, t=cls._dh_table_name),
-            "Limit": cls.DEFAULT_ITEM_LIMIT
+            "Limit": page_size or cls.DEFAULT_ITEM_LIMIT
         }
         if consistent:
             params.update({
@@ -431,32 +983,86 @@ class DynamoHandler(object):
         if len(kwargs) == 0:
             # get all the items
             # no further parameters to add here
-            logger.info("Request for all items in table")
+            logger.debug("Request for all items in table")
         else:
-            # need to filter the items
-            logger.info("Request to filter on...")
-            # need to add filters here
-            for field in kwargs:
-                pass
+            # need to filter the items, names are used as some attribute names are reserved words
+            logger.debug("Request to filter on...")
+            expression_bits = []
+            names = {}
+            values = {}
+            for (i, (field, value)) in enumerate(kwargs.items()):
+                expression_bits.append("#f{i} = :f{i}".format(i=i))
+                names.update({"#f{i}".format(i=i): cls._dh_backward_field_mapping[field]})
+                values.update({":f{i}".format(i=i): cls._dh_wrap_field(value)})
+            params.update({
+                "FilterExpression": " AND ".join(expression_bits),
+                "ExpressionAttributeNames": names,
+                "ExpressionAttributeValues": values
+            })
+            logger.debug("Filter expression: %s", params["FilterExpression"])
         # now run scan
+        logger.debug("Starting scan with %d segments...", segments)
+        if segments <= 1:
+            for page in cls._dh_scan_pages(params):
+                for item in page:
+                    yield item
+            return
+        pages = queue.Queue(maxsize=segments * 2)
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=segments)
+        for segment in range(segments):
+            segment_params = dict(params)
+            segment_params.update({
+                "Segment": segment,
+                "TotalSegments": segments
+            })
+            executor.submit(bind(cls._dh_scan_segment), segment_params, pages, stop)
+        try:
+            running = segments
+            while running > 0:
+                page = pages.get()
+                if page is _SCAN_DONE:
+                    running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for item in page:
+                        yield item
+        finally:
+            # stops the other segments if the caller stopped early or a segment failed
+            stop.set()
+            executor.shutdown(wait=False)
+
+    @classmethod
+    def _dh_scan_segment(cls, params, pages, stop):
+        """
+        Scans one segment onto the pages queue, finishing with _SCAN_DONE
+        """
+        try:
+            for page in cls._dh_scan_pages(params):
+                if not _put_unless_stopped(pages, page, stop):
+                    return
+        except Exception as err:
+            _put_unless_stopped(pages, err, stop)
+        _put_unless_stopped(pages, _SCAN_DONE, stop)
+
+    @classmethod
+    def _dh_scan_pages(cls, params):
+        """
+        Generator which runs a scan, yielding each page of flattened items
+        """
+        ddb = get_client()
+        params = dict(params)
         keep_scanning = True
-        logger.info("Starting scan...")
-        items = []
         while keep_scanning:
             response = ddb.scan(**params)
-            items = items + response["Items"]
+            yield cls._dh_flatten_items(response["Items"])
             if "LastEvaluatedKey" in response:
                 params.update({
                     "ExclusiveStartKey": response["LastEvaluatedKey"]
                 })
             else:
                 keep_scanning = False
-        logger.info("Finished scan, got {n} items".format(n=len(items)))
-        logger.debug("Items are", extra={"items": items})
-        # flatten items
-        items = cls._dh_flatten_items(items)
-        logger.debug("Flattened items are", extra={"items": items})
-        return items
 
     @classmethod
     def _dh_wrap_field(cls, field):
@@ -473,14 +1079,16 @@ class DynamoHandler(object):
         """
         Method to get a single item, this only works where the ID fields is specified in kwargs
         """
-        ddb = boto3.client("dynamodb")
+        ddb = get_client()
         mapped_fields = {cls._dh_backward_field_mapping[k]:v for (k,v) in kwargs.items()}
-        logger.info("Input fields have been mapped", extra={"original": kwargs, "mapped_fields": mapped_fields})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Input fields have been mapped", extra={"original": kwargs, "mapped_fields": mapped_fields})
         if not all(key in mapped_fields.keys() for key in cls._dh_id_fields):
             raise DynamoDBException("Calls to _dh_get_item need all the key fields including {f}".format(f=",".join(cls._dh_id_fields)))
         # if we get past this we have the id fields
         keys_for_dynamo = {k: cls._dh_wrap_field(v) for (k,v) in mapped_fields.items() if k in cls._dh_id_fields}
-        logger.info("Keys for query are", extra={"keys": keys_for_dynamo})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Keys for query are", extra={"keys": keys_for_dynamo})
         params = {
             "TableName": "{t}_{e}".format(e=env, t=cls._dh_table_name),
             "Key": keys_for_dynamo
@@ -489,61 +1097,299 @@ class DynamoHandler(object):
             params.update({
                 "ConsistentRead": True
             })
-        logger.info("Getting item with parameters", extra={"params": params})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Getting item with parameters", extra={"params": params})
         response = ddb.get_item(**params)
         if "Item" in response:
             # we got an item back from dynamo
             item = cls._dh_flatten_item(response["Item"])
-            logger.info("Got an item, fields have been mapped", extra={"item": item})
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Got an item, fields have been mapped", extra={"item": item})
             # now we need to check if the rest of the attributes match
-            if kwargs.viewitems() <= item.viewitems():
+            if kwargs.items() <= item.items():
                 return item
             else:
                 return False
         else:
             # we did not get an item
-            logger.info("No item found")
+            logger.debug("No item found")
             # return false so the caller can handle this.
             return False
     
     @classmethod
-    def _dh_get_next_counter(cls, env):
+    def _dh_get_next_counter(cls, env, amount=1):
         """
-        Gets the next counter value for this table
+        Gets the next counter value for this table, amount reserves that many values ending at the one returned
+
+        Unlike _dh_increment_any_counter this counter is never sharded, as the values it hands out have to be unique
+        and consecutive.  Reserving values in blocks is how to keep it from getting hot.
         """
-        ddb = boto3.client("dynamodb")
+        ddb = get_client()
         params = {
             "TableName": "{e}_RycCounters".format(e=env),
             "Key": {
                 "Counter_id": {"S": cls._dh_table_name}
             },
-            "UpdateExpression": "set CounterVal = CounterVal + :val",
+            "UpdateExpression": "set CounterVal = if_not_exists(CounterVal, :zero) + :val",
             "ExpressionAttributeValues": {
-                ":val": {"N": "1"}
+                ":val": {"N": str(amount)},
+                ":zero": {"N": "0"}
             },
             "ReturnValues": "UPDATED_NEW"
         }
         resp = ddb.update_item(**params)
-        logger.info("Got counter increment response", extra={"response": resp})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Got counter increment response", extra={"response": resp})
         return int(resp["Attributes"]["CounterVal"]["N"])
     
+    @classmethod
+    def _dh_get_current_counter(cls, env):
+        """
+        Gets the last value handed out by the counter for this table without moving it on, 0 if it has not been used
+        """
+        ddb = get_client()
+        resp = ddb.get_item(
+            TableName="{e}_RycCounters".format(e=env),
+            Key={"Counter_id": {"S": cls._dh_table_name}},
+            ConsistentRead=True
+        )
+        return int(resp.get("Item", {}).get("CounterVal", {"N": "0"})["N"])
+
+    @classmethod
+    def _dh_add_counts(cls, env, counts, **kwargs):
+        """
+        Adds to number fields of a single item with one ADD update, creating the item and fields if they do not exist
+
+        counts = dict of field name to the amount to add to it
+        **kwargs = the key fields of the item
+        """
+        ddb = get_client()
+        mapped_fields = {cls._dh_backward_field_mapping[k]:v for (k,v) in kwargs.items()}
+        if not all(key in mapped_fields.keys() for key in cls._dh_id_fields):
+            raise DynamoDBException("Calls to _dh_add_counts need all the key fields including {f}".format(f=",".join(cls._dh_id_fields)))
+        names = {}
+        values = {}
+        add_bits = []
+        for (i, (field, amount)) in enumerate(sorted(counts.items())):
+            names.update({"#a{i}".format(i=i): cls._dh_backward_field_mapping[field]})
+            values.update({":a{i}".format(i=i): {"N": str(amount)}})
+            add_bits.append("#a{i} :a{i}".format(i=i))
+        params = {
+            "TableName": "{t}_{e}".format(e=env, t=cls._dh_table_name),
+            "Key": {k: cls._dh_wrap_field(v) for (k,v) in mapped_fields.items() if k in cls._dh_id_fields},
+            "UpdateExpression": "ADD " + ", ".join(add_bits),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values
+        }
+        ddb.update_item(**params)
+
     @staticmethod
-    def _dh_increment_any_counter(env, counter):
+    def _dh_increment_any_counter(env, counter, amount=1, return_total=True):
         """
         Static method used to increment any counter
+
+        A busy counter is spread over several shard items so no single item takes all the writes.  Each increment goes
+        to a shard picked at random, and the number of shards doubles whenever an increment is throttled.  Returns the
+        counter's total after the increment, which needs a read of every shard once there is more than one, or None
+        if return_total is False.
+        """
+        ddb = get_client()
+        shards = DynamoHandler._dh_counter_shards(env, counter)
+        try:
+            value = DynamoHandler._dh_add_to_counter_shard(env, counter, random.randrange(shards), amount)
+        except ddb.exceptions.ProvisionedThroughputExceededException:
+            logger.warning("Counter '{name}' is throttled with {n} shards".format(name=counter, n=shards))
+            shards = DynamoHandler._dh_grow_counter(env, counter, shards)
+            # try again, most likely on a new shard which nothing else is writing to yet
+            value = DynamoHandler._dh_add_to_counter_shard(env, counter, random.randrange(shards), amount)
+        if not return_total:
+            return None
+        if shards == 1:
+            return value
+        return DynamoHandler._dh_get_counter(env, counter)
+
+    @staticmethod
+    def _dh_get_counter(env, counter):
+        """
+        Static method which gets the total of a counter, reading all its shards with one BatchGetItem
+        """
+        shards = DynamoHandler._dh_counter_shards(env, counter)
+        seen = 0
+        total = 0
+        while seen < shards:
+            keys = [{"Counter_id": {"S": DynamoHandler._dh_counter_shard_id(counter, shard)}} for shard in range(seen, shards)]
+            keys.append({"Counter_id": {"S": DynamoHandler._dh_counter_shards_id(counter)}})
+            items = DynamoHandler._dh_batch_get_keys(
+                table_name="{e}_RycCounters".format(e=env),
+                keys=keys,
+                consistent=True
+            )
+            seen = shards
+            for item in items:
+                if "Shards" in item:
+                    # the count may have grown since it was cached, any new shards are read next time round
+                    shards = max(shards, int(item["Shards"]["N"]))
+                else:
+                    total += int(item.get("CounterVal", {"N": "0"})["N"])
+        DynamoHandler._dh_cache_counter_shards(env, counter, shards)
+        return total
+
+    @staticmethod
+    def _dh_counter_shard_id(counter, shard):
+        """
+        Static method which gets the key of a counter shard, shard 0 is the counter's original item
+        """
+        if shard == 0:
+            return counter
+        return "{c}#{s}".format(c=counter, s=shard)
+
+    @staticmethod
+    def _dh_counter_shards_id(counter):
+        """
+        Static method which gets the key of the item holding a counter's shard count
+
+        It is kept apart from the shards so growing a counter is not a write to the item which is already too busy.
+        """
+        return "{c}#shards".format(c=counter)
+
+    @staticmethod
+    def _dh_add_to_counter_shard(env, counter, shard, amount):
+        """
+        Static method which adds to a single shard of a counter, returning the shard's new value
         """
-        ddb = boto3.client("dynamodb")
+        ddb = get_client()
         params = {
             "TableName": "{e}_RycCounters".format(e=env),
             "Key": {
-                "Counter_id": {"S": counter}
+                "Counter_id": {"S": DynamoHandler._dh_counter_shard_id(counter, shard)}
             },
-            "UpdateExpression": "set CounterVal = CounterVal + :val",
+            "UpdateExpression": "set CounterVal = if_not_exists(CounterVal, :zero) + :val",
             "ExpressionAttributeValues": {
-                ":val": {"N": "1"}
+                ":val": {"N": str(amount)},
+                ":zero": {"N": "0"}
             },
             "ReturnValues": "UPDATED_NEW"
         }
         resp = ddb.update_item(**params)
-        logger.info("Got counter increment response for custom counter '{name}'".format(name=counter), extra={"response": resp})
-        return int(resp["Attributes"]["CounterVal"]["N"])
\ No newline at end of file
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Got counter increment response for custom counter '%s'", counter, extra={"response": resp})
+        return int(resp["Attributes"]["CounterVal"]["N"])
+
+    @staticmethod
+    def _dh_counter_shards(env, counter):
+        """
+        Static method which gets how many shards a counter has, the count is cached for COUNTER_SHARDS_TTL seconds
+        """
+        now = time.monotonic()
+        cached = _counter_shards.get((env, counter))
+        if cached is not None and now - cached[1] < DynamoHandler.COUNTER_SHARDS_TTL:
+            return cached[0]
+        ddb = get_client()
+        resp = ddb.get_item(
+            TableName="{e}_RycCounters".format(e=env),
+            Key={"Counter_id": {"S": DynamoHandler._dh_counter_shards_id(counter)}},
+            ProjectionExpression="#shards",
+            ExpressionAttributeNames={"#shards": "Shards"}
+        )
+        shards = int(resp.get("Item", {}).get("Shards", {"N": "1"})["N"])
+        DynamoHandler._dh_cache_counter_shards(env, counter, shards)
+        return shards
+
+    @staticmethod
+    def _dh_cache_counter_shards(env, counter, shards):
+        """
+        Static method which remembers a counter's shard count
+        """
+        with _counter_shards_lock:
+            _counter_shards[(env, counter)] = (shards, time.monotonic())
+
+    @staticmethod
+    def _dh_grow_counter(env, counter, shards):
+        """
+        Static method which doubles the number of shards a counter has, up to COUNTER_MAX_SHARDS, returning the new count
+
+        Shards are never taken away, as their values would be lost.
+        """
+        new_shards = min(shards * 2, DynamoHandler.COUNTER_MAX_SHARDS)
+        if new_shards <= shards:
+            return shards
+        ddb = get_client()
+        try:
+            ddb.update_item(
+                TableName="{e}_RycCounters".format(e=env),
+                Key={"Counter_id": {"S": DynamoHandler._dh_counter_shards_id(counter)}},
+                UpdateExpression="set #shards = :shards",
+                ConditionExpression="attribute_not_exists(#shards) OR #shards < :shards",
+                ExpressionAttributeNames={"#shards": "Shards"},
+                ExpressionAttributeValues={":shards": {"N": str(new_shards)}}
+            )
+            logger.info("Counter '%s' now has %d shards", counter, new_shards)
+        except ddb.exceptions.ConditionalCheckFailedException:
+            # another container has already grown it, so pick up its count
+            _counter_shards.pop((env, counter), None)
+            return DynamoHandler._dh_counter_shards(env, counter)
+        DynamoHandler._dh_cache_counter_shards(env, counter, new_shards)
+        return new_shards
+
+    @classmethod
+    def _dh_batch_get_keys(cls, table_name, keys, consistent=False):
+        """
+        Gets raw items by key using BatchGetItem, keys which are not found are left out
+
+        Keys are sent in chunks of BATCH_GET_SIZE, on a pool of BATCH_WORKERS threads when there is more than one,
+        and keys dynamo does not process are retried with jittered backoff.  The keys must not repeat.
+        """
+        chunks = [keys[start:start + cls.BATCH_GET_SIZE] for start in range(0, len(keys), cls.BATCH_GET_SIZE)]
+        if len(chunks) <= 1:
+            return cls._dh_get_chunk(table_name, keys, consistent)
+        logger.debug("Reading %d keys in %d chunks", len(keys), len(chunks))
+        with ThreadPoolExecutor(max_workers=cls.BATCH_WORKERS) as executor:
+            return [item for items in executor.map(bind(lambda c: cls._dh_get_chunk(table_name, c, consistent)), chunks) for item in items]
+
+    @classmethod
+    def _dh_get_chunk(cls, table_name, keys, consistent=False):
+        """
+        Gets up to BATCH_GET_SIZE raw items in one BatchGetItem, retrying any keys dynamo does not process
+        """
+        ddb = get_client()
+        request = {"Keys": keys}
+        if consistent:
+            request.update({"ConsistentRead": True})
+        items = []
+        attempt = 0
+        while request["Keys"]:
+            response = ddb.batch_get_item(RequestItems={table_name: request})
+            items.extend(response.get("Responses", {}).get(table_name, []))
+            request = response.get("UnprocessedKeys", {}).get(table_name, {"Keys": []})
+            attempt += 1
+            if request["Keys"]:
+                if attempt >= cls.BATCH_MAX_ATTEMPTS:
+                    raise DynamoDBException("Could not read {n} keys from {t}".format(n=len(request["Keys"]), t=table_name))
+                time.sleep(random.uniform(0, min(cls.BATCH_BACKOFF_CAP, cls.BATCH_BACKOFF_BASE * (2 ** attempt))))
+        return items
+
+    @classmethod
+    def _dh_batch_get(cls, env, keys, consistent=False):
+        """
+        Gets many items by key, returning the flattened items which were found in no particular order
+
+        keys = list of dicts with values for all the ID fields, using the object's field names
+        """
+        wrapped = []
+        seen = set()
+        for key in keys:
+            mapped_fields = {cls._dh_backward_field_mapping[k]:v for (k,v) in key.items()}
+            if not all(field in mapped_fields for field in cls._dh_id_fields):
+                raise DynamoDBException("Calls to _dh_batch_get need all the key fields including {f}".format(f=",".join(cls._dh_id_fields)))
+            # dynamo rejects a batch which asks for the same key twice
+            identity = tuple(str(mapped_fields[field]) for field in cls._dh_id_fields)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            wrapped.append({field: cls._dh_wrap_field(mapped_fields[field]) for field in cls._dh_id_fields})
+        items = cls._dh_batch_get_keys(
+            table_name="{t}_{e}".format(e=env, t=cls._dh_table_name),
+            keys=wrapped,
+            consistent=consistent
+        )
+        return cls._dh_flatten_items(items)
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Module to log the links which have been changed or deleted, so copies of links held outside DynamoDB can be dropped
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from DynamoHandler import DynamoHandler
+
+logger = logging.getLogger(__name__)
+
+# seconds changes are kept for before DynamoDB deletes them, snapshots older than this cannot be kept current
+CHANGE_RETENTION = 30 * 86400
+
+def hot_links_mode():
+    """
+    Gets whether hot link snapshots are used, 'on' also logs link changes so snapshots can be kept current
+    """
+    return os.environ.get("hot_links", "off").lower()
+
+def changes_enabled():
+    """
+    Returns True if changes to links should be logged
+    """
+    return hot_links_mode() == "on"
+
+def _change_time(timestamp):
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+class LinkChange(DynamoHandler):
+    """
+    A change to a link, changes are kept a partition per UTC day and ordered on when they were made
+    """
+    _dh_field_mapping = {
+        "Day_id": "day",
+        "Change_id": "change",
+        "s_LinkId": "linkid",
+        "ttl_ExpiresAt": "expires_at"
+    }
+    _dh_backward_field_mapping = {v:k for (k,v) in _dh_field_mapping.items()}
+
+    _dh_sub_obj_mapping = {}
+
+    _dh_id_fields = [
+        "Day_id",
+        "Change_id"
+    ]
+
+    _dh_table_name = "UrlShortenerLinkChanges"
+
+    _dh_indexes = {}
+
+    def __init__(self, **kwargs):
+        self.__dict__ = kwargs
+        self._dh_modified_fields = []
+        super(LinkChange, self).__init__()
+
+    @staticmethod
+    def at(timestamp, linkid):
+        """
+        Static method which makes the change to a link at a unix timestamp
+        """
+        change_time = _change_time(timestamp)
+        return LinkChange(
+            day=change_time[:10],
+            change="{t}#{l}".format(t=change_time, l=linkid),
+            linkid=linkid,
+            expires_at=datetime.utcfromtimestamp(timestamp + CHANGE_RETENTION)
+        )
+
+def record_changes(env, linkids, timestamp):
+    """
+    Logs that links have changed, if changes are being logged
+    """
+    if not changes_enabled() or not linkids:
+        return
+    created, deleted = LinkChange._dh_batch_write(
+        env=env,
+        put_items=[LinkChange.at(timestamp, linkid) for linkid in linkids]
+    )
+    if not all(created):
+        # a copy of the link could now be served after it has changed, so this needs to be seen
+        logger.error("Could not log changes to {n} links".format(n=created.count(False)))
+
+def changes_since(env, since, until):
+    """
+    Gets the IDs of the links changed between two unix timestamps
+    """
+    start = _change_time(since)
+    day = datetime.utcfromtimestamp(since).date()
+    linkids = set()
+    while day <= datetime.utcfromtimestamp(until).date():
+        for change in LinkChange._dh_query_iter(
+            env=env,
+            consistent=True,
+            custom_key_filter="Change_id >= :since",
+            custom_filter_args={":since": {"S": start}},
+            day=day.isoformat()
+        ):
+            linkids.add(change["linkid"])
+        day += timedelta(days=1)
+    return linkids
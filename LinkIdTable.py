@@ -0,0 +1,78 @@
+"""
+Module for the copy of the links table keyed on the link ID alone, kept in step with transactions
+"""
+import os
+
+from DynamoHandler import DynamoHandler
+
+def link_id_table_mode():
+    """
+    Gets how the link ID table is used, 'off', 'dual' to keep it in step only or 'on' to also read from it
+    """
+    return os.environ.get("link_id_table", "off").lower()
+
+def dual_write_enabled():
+    """
+    Returns True if writes to the links table should also be made to the link ID table
+    """
+    return link_id_table_mode() in ["dual", "on"]
+
+def lookup_enabled():
+    """
+    Returns True if links should be looked up by ID in the link ID table rather than through the index
+    """
+    return link_id_table_mode() == "on"
+
+class LinkById(DynamoHandler):
+    """
+    A link keyed on its ID, the owner is an ordinary attribute
+
+    Every link ID can only be stored once, so a conditional put here guarantees a new ID is unique across all users.
+    """
+    _dh_field_mapping = {
+        "Link_id": "linkid",
+        "s_UserId": "id",
+        "s_Url": "url",
+        "dt_CreationDate": "creation_date",
+        "dt_ModifiedDate": "modified_date",
+        "n_RedirectStatus": "redirect_status",
+        "n_CacheTtl": "cache_ttl",
+        "n_Version": "version",
+        "ttl_ExpiresAt": "expires_at"
+    }
+    _dh_backward_field_mapping = {v:k for (k,v) in _dh_field_mapping.items()}
+
+    _dh_sub_obj_mapping = {}
+
+    _dh_id_fields = [
+        "Link_id"
+    ]
+
+    _dh_table_name = "UrlShortenerLinkIds"
+
+    _dh_indexes = {}
+
+    def __init__(self, **kwargs):
+        self.__dict__ = kwargs
+        self._dh_modified_fields = []
+        super(LinkById, self).__init__()
+
+    @staticmethod
+    def from_link(link):
+        """
+        Static method which copies the mapped fields of a link
+        """
+        return LinkById(**{
+            field: value for (field, value) in link.__dict__.items()
+            if field in LinkById._dh_backward_field_mapping
+        })
+
+    @staticmethod
+    def owner_condition(userid):
+        """
+        Static method which builds a condition that holds if the item is missing or belongs to userid
+        """
+        return (
+            "attribute_not_exists(Link_id) OR s_UserId = :owner",
+            {":owner": DynamoHandler._dh_wrap_field(userid)}
+        )
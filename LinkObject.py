@@ -1,6 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-from DynamoHandler import DynamoHandler, DynamoDBException
+import logging
+import os
+import time
+
+from DynamoHandler import DynamoHandler, ConflictException, DynamoDBException, IntegrityException, ItemNotFoundException, MultipleItemsFoundException
+from ddb_metrics import bind
+from link_cache import LinkCache, cache_from_environment
+from link_filter import filter_from_environment
+from hot_links import hot_links_from_environment
+from link_id_allocator import allocator_from_environment
+from LinkChanges import CHANGE_RETENTION, changes_enabled, changes_since, record_changes
+from LinkIdTable import LinkById, dual_write_enabled, lookup_enabled
+from LinkResultSet import LinkResultSet
+from LinkSearchIndex import index_enabled, index_link, index_links, unindex_links, update_postings
+from redirect_policy import expired, redirect_from_link
+
+logger = logging.getLogger(__name__)
+
+# the index on link ID which projects the redirect policy, and the one it replaces which only projects the url
+LINK_ID_INDEX = "LinkIdRedirectIndex"
+URL_LINK_ID_INDEX = "UrlLinkIdIndex"
+
+def link_id_index():
+    """
+    Gets the index links are looked up on by ID, a new index is only used once it has been backfilled
+    """
+    return os.environ.get("link_id_index", URL_LINK_ID_INDEX)
 
 class LinkNotFoundException(DynamoDBException):
     def __init__(self, *args, **kwargs):
@@ -17,7 +44,11 @@ class Link(DynamoHandler):
         "Link_id": "linkid",
         "s_Url": "url",
         "dt_CreationDate": "creation_date",
-        "dt_ModifiedDate": "modified_date"
+        "dt_ModifiedDate": "modified_date",
+        "n_RedirectStatus": "redirect_status",
+        "n_CacheTtl": "cache_ttl",
+        "n_Version": "version",
+        "ttl_ExpiresAt": "expires_at"
     }
     _dh_backward_field_mapping = {v:k for (k,v) in _dh_field_mapping.items()}
 
@@ -33,9 +64,35 @@ class Link(DynamoHandler):
     _dh_indexes = {
         "UrlLinkIdIndex": [
             "Link_id"
+        ],
+        "LinkIdRedirectIndex": [
+            "Link_id"
+        ],
+        "UserCreationDateIndex": [
+            "User_id"
         ]
     }
 
+    # most links written in one transaction, each link is two of the 25 items a transaction can hold
+    TRANSACT_LINKS = 12
+
+    # cache of linkid -> Redirect used by the redirect path, shared by the container
+    _link_cache = cache_from_environment()
+
+    # hands out new link IDs from blocks of the counter for this table
+    _id_allocator = allocator_from_environment(
+        lease=lambda env, count: Link._dh_get_next_counter(env=env, amount=count)
+    )
+
+    # bloom filter of the link IDs which exist, None when no filter has been built
+    _link_filter = filter_from_environment(
+        counter_value=_id_allocator.counter_value,
+        current_counter=lambda env: Link._dh_get_current_counter(env=env)
+    )
+
+    # memory mapped snapshot of the most clicked links, None when there is no snapshot
+    _hot_links = hot_links_from_environment(changes_since=changes_since, max_age=CHANGE_RETENTION) if changes_enabled() else None
+
     def __init__(self, **kwargs):
         self.__dict__ = kwargs
         self._dh_modified_fields = []
@@ -44,66 +101,501 @@ class Link(DynamoHandler):
     def __getitem__(self, key):
         return self.__dict__[key]
     
-    def update_record(self, env, **kwargs):
+    def update_record(self, env, bump_version=False, expected_modified=None, **kwargs):
         """
-        Instance method to update a link record in the database
+        Instance method to update a link record in the database with a single conditional write, the object only needs
+        the key fields and is filled in from the saved link afterwards
+
+        bump_version = move the link on to its next version, which changes the ETag of its redirect so caches holding
+                       the old redirect fetch it again once they next check it
+        expected_modified = only update the link if it was last modified at this date, to the second
+        Raises LinkNotFoundException if the user has no such link and ConflictException if it has been modified since
+        expected_modified.
         """
+        Link._record_changes(env=env, linkids=[self.linkid])
+        old_url = None
+        if index_enabled() and "url" in kwargs:
+            # the postings for the old url have to be removed, and neither write can return the old and new link
+            self._load_missing_fields(env=env)
+            old_url = self.__dict__.get("url")
         for field in kwargs:
             self._dh_update_field(
                 field_name=field,
                 field_value=kwargs[field]
             )
-        self._dh_save_changes(env=env)
+        increment = ["version"] if bump_version else None
+        condition, values, names = Link.modified_condition(expected_modified) if expected_modified else (None, None, None)
+        try:
+            if dual_write_enabled():
+                mirror = LinkById(linkid=self.linkid)
+                for field in list(kwargs) + ["id"]:
+                    mirror._dh_update_field(
+                        field_name=field,
+                        field_value=self.__dict__[field]
+                    )
+                owner, owner_values = LinkById.owner_condition(self.id)
+                try:
+                    Link._dh_transact_write([
+                        # the link must still exist, otherwise the update would bring back a deleted link
+                        self._dh_update_operation(
+                            env=env,
+                            condition=self._dh_exists_condition(condition),
+                            values=values,
+                            names=names,
+                            increment=increment
+                        ),
+                        mirror._dh_update_operation(env=env, condition=owner, values=owner_values, increment=increment)
+                    ])
+                except IntegrityException:
+                    raise self._dh_condition_failure(env)
+                self._dh_modified_fields[:] = []
+                # a transaction does not return the items it writes
+                saved = Link._dh_get_item(env=env, consistent=True, id=self.id, linkid=self.linkid) or {}
+            else:
+                saved = self._dh_conditional_update(
+                    env=env,
+                    condition=condition,
+                    values=values,
+                    names=names,
+                    increment=increment
+                )
+        except ItemNotFoundException:
+            raise LinkNotFoundException("No Link found which matches query parameters.")
+        except ConflictException:
+            raise Link.modified_conflict(expected_modified)
+        self.__dict__.update(saved)
+        Link._link_cache.invalidate((env, self.linkid))
+        if "url" in kwargs:
+            index_link(
+                env=env,
+                link=self,
+                old_url=old_url if old_url != self.url else None
+            )
+        else:
+            # the tokens only change with the url, so the postings just need the new values
+            update_postings(
+                env=env,
+                link=self,
+                fields=list(kwargs) + (increment or [])
+            )
     
-    def delete_record(self, env):
+    def delete_record(self, env, expected_modified=None):
+        """
+        Instance method to delete a link record with a single conditional write, the object only needs the key fields
+
+        expected_modified = only delete the link if it was last modified at this date, to the second
+        Raises LinkNotFoundException if the user has no such link and ConflictException if it has been modified since
+        expected_modified.
+        """
+        Link._record_changes(env=env, linkids=[self.linkid])
+        condition, values, names = Link.modified_condition(expected_modified) if expected_modified else (None, None, None)
+        try:
+            if dual_write_enabled():
+                if index_enabled():
+                    # the url is needed to find the search postings, and a transaction does not return the old item
+                    self._load_missing_fields(env=env)
+                try:
+                    Link._dh_transact_write(self._delete_operations(
+                        env=env,
+                        condition=self._dh_exists_condition(condition),
+                        values=values,
+                        names=names
+                    ))
+                except IntegrityException:
+                    raise self._dh_condition_failure(env)
+            else:
+                self.__dict__.update(self._dh_conditional_delete(
+                    env=env,
+                    condition=condition,
+                    values=values,
+                    names=names
+                ))
+        except ItemNotFoundException:
+            raise LinkNotFoundException("No Link found which matches query parameters.")
+        except ConflictException:
+            raise Link.modified_conflict(expected_modified)
+        Link._link_cache.invalidate((env, self.linkid))
+        unindex_links(env=env, links=[self])
+
+    @staticmethod
+    def modified_conflict(expected_modified=None):
+        """
+        Static method which builds the error for a conditional write which failed, the condition may be on another
+        table when there is no expected_modified
+        """
+        if expected_modified is None:
+            return ConflictException("Link has been modified")
+        return ConflictException("Link has been modified since {d}".format(d=expected_modified.isoformat()))
+
+    @staticmethod
+    def modified_condition(modified_date):
+        """
+        Static method which builds a condition that holds if the link was last modified in the same second as
+        modified_date, which is the precision the API gives dates to
+        """
+        start = modified_date.replace(microsecond=0)
+        return (
+            "#modified >= :modified_from AND #modified < :modified_to",
+            {
+                ":modified_from": {"S": start.isoformat()},
+                ":modified_to": {"S": (start + timedelta(seconds=1)).isoformat()}
+            },
+            {"#modified": "dt_ModifiedDate"}
+        )
+
+    def _create_operations(self, env):
+        """
+        Instance method which builds the transaction items to create the link in both tables
+        """
+        return [
+            self._dh_put_operation(env=env, condition="attribute_not_exists(Link_id)"),
+            # the put fails if any user already has the link ID
+            LinkById.from_link(self)._dh_put_operation(env=env, condition="attribute_not_exists(Link_id)")
+        ]
+
+    def _delete_operations(self, env, condition=None, values=None, names=None):
+        """
+        Instance method which builds the transaction items to delete the link from both tables, optionally only if the
+        link matches condition
         """
-        Instance method to delete a link record
+        owner, owner_values = LinkById.owner_condition(self.id)
+        return [
+            self._dh_delete_operation(env=env, condition=condition, values=values, names=names),
+            LinkById(linkid=self.linkid)._dh_delete_operation(env=env, condition=owner, values=owner_values)
+        ]
+
+    def _load_missing_fields(self, env):
+        """
+        Instance method which fills in any fields missing from the object using the links table
+        """
+        item = Link._dh_get_item(
+            env=env,
+            consistent=True,
+            id=self.id,
+            linkid=self.linkid
+        )
+        if item:
+            for (field, value) in item.items():
+                self.__dict__.setdefault(field, value)
+
+    @staticmethod
+    def new_link_ids(env, count=1):
+        """
+        Static method which allocates count new, unique link IDs
         """
-        self._dh_delete_item(env=env)
+        return Link._id_allocator.allocate_many(env, count)
 
     @staticmethod
-    def create_link(env, userid, linkid, url):
-        """Static method to create a new a Link"""
+    def create_link(env, userid, linkid, url, redirect_status=None, cache_ttl=None, expires_at=None):
+        """
+        Static method to create a new a Link, links without a redirect status or cache TTL use the defaults
+
+        expires_at = naive UTC date the link stops redirecting, after which DynamoDB deletes it
+        """
         params = {
             "id": userid,
             "linkid": linkid,
             "url": url,
             "creation_date": datetime.utcnow(),
-            "modified_date": datetime.utcnow()
+            "modified_date": datetime.utcnow(),
+            "redirect_status": redirect_status,
+            "cache_ttl": cache_ttl,
+            "expires_at": expires_at
         }
         link = Link(**params)
-        link._dh_create_item(env=env)
+        if dual_write_enabled():
+            # raises IntegrityException if the link ID is already used
+            Link._dh_transact_write(link._create_operations(env=env))
+        else:
+            link._dh_create_item(env=env)
+        Link._link_cache.invalidate((env, linkid))
+        index_link(env=env, link=link)
+        if dual_write_enabled():
+            # the write has succeeded in full, there is nothing more to read back
+            return link
         new_link = Link.get_link_by_id(
             env=env,
             linkid=linkid
         )
         return new_link
     
+    @staticmethod
+    def create_links(env, userid, links):
+        """
+        Static method to create many links at once, links is a list of dicts with linkid and url
+
+        Returns a result per link in the same order, the created links are not read back from the database
+        """
+        now = datetime.utcnow()
+        new_links = [Link(
+            id=userid,
+            linkid=link["linkid"],
+            url=link["url"],
+            creation_date=now,
+            modified_date=now
+        ) for link in links]
+        if dual_write_enabled():
+            created = Link._transact_links(new_links, lambda link: link._create_operations(env=env))
+        else:
+            created, deleted = Link._dh_batch_write(
+                env=env,
+                put_items=new_links
+            )
+        results = []
+        for link, ok in zip(new_links, created):
+            if ok:
+                Link._link_cache.invalidate((env, link.linkid))
+                result = dict(link.__dict__)
+                result.update({"status": "created"})
+            else:
+                result = {"linkid": link.linkid, "url": link.url, "status": "failed"}
+            results.append(result)
+        index_links(
+            env=env,
+            links=[link for (link, ok) in zip(new_links, created) if ok]
+        )
+        return results
+
+    @staticmethod
+    def delete_links(env, userid, linkids):
+        """
+        Static method to delete many of a user's links at once
+
+        The user is part of the key so only their own links can be deleted, deleting a link which does not exist
+        is not an error.  Returns a result per unique link ID.
+        """
+        # the same key cannot appear twice in one batch
+        linkids = list(dict.fromkeys(linkids))
+        old_links = [Link(id=userid, linkid=linkid) for linkid in linkids]
+        if index_enabled():
+            # the urls are needed to find the search postings
+            with ThreadPoolExecutor(max_workers=Link.BATCH_WORKERS) as executor:
+                list(executor.map(bind(lambda link: link._load_missing_fields(env=env)), old_links))
+        Link._record_changes(env=env, linkids=linkids)
+        if dual_write_enabled():
+            deleted = Link._transact_links(old_links, lambda link: link._delete_operations(env=env))
+        else:
+            created, deleted = Link._dh_batch_write(
+                env=env,
+                delete_items=old_links
+            )
+        results = []
+        for linkid, ok in zip(linkids, deleted):
+            if ok:
+                Link._link_cache.invalidate((env, linkid))
+            results.append({"linkid": linkid, "status": "deleted" if ok else "failed"})
+        unindex_links(
+            env=env,
+            links=[link for (link, ok) in zip(old_links, deleted) if ok and "url" in link.__dict__]
+        )
+        return results
+
+    @staticmethod
+    def _transact_links(links, operations):
+        """
+        Static method which writes the operations for each link in transactions of TRANSACT_LINKS links
+
+        If a transaction fails its links are tried again one at a time, so one bad link does not fail the rest.
+        Returns whether each link was written, in the same order as links.
+        """
+        def write(chunk):
+            try:
+                Link._dh_transact_write([op for link in chunk for op in operations(link)])
+                return [True] * len(chunk)
+            except Exception as err:
+                if len(chunk) == 1:
+                    logger.error("Transaction for link {l} failed: {e}".format(l=chunk[0].linkid, e=err))
+                    return [False]
+                logger.warning("Transaction for {n} links failed, retrying them one by one: {e}".format(n=len(chunk), e=err))
+                return [ok for link in chunk for ok in write([link])]
+        chunks = [links[i:i + Link.TRANSACT_LINKS] for i in range(0, len(links), Link.TRANSACT_LINKS)]
+        with ThreadPoolExecutor(max_workers=Link.BATCH_WORKERS) as executor:
+            return [ok for results in executor.map(bind(write), chunks) for ok in results]
+
     @staticmethod
     def get_link_by_id(env, linkid, **kwargs):
         """
-        Static method which gets a single link by its ID
+        Static method which gets a single link by its ID, kwargs are further fields which must match
         """
-        links = Link._dh_get_and_filter_with_index(
+        if lookup_enabled():
+            # a strongly consistent read of a single item, so a link is found as soon as it is created
+            item = LinkById._dh_get_item(
+                env=env,
+                consistent=True,
+                linkid="{id}".format(id=linkid),
+                **kwargs
+            )
+            if not item:
+                raise LinkNotFoundException("No Link found which matches query parameters.")
+            return Link(**item)
+        index = link_id_index()
+        links = Link._dh_query_iter(
             env=env,
-            index="UrlLinkIdIndex",
+            index=index,
+            max_items=2,
             linkid="{id}".format(id=linkid),
             **kwargs
         )
-        if len(links) == 0:
+        try:
+            item = links.exactly_one()
+            if index == URL_LINK_ID_INDEX:
+                # the old index does not project the redirect policy, so the link is read from the table
+                item = Link._dh_get_item(env=env, id=item["id"], linkid=item["linkid"]) or item
+            return Link(**item)
+        except ItemNotFoundException:
             raise LinkNotFoundException("No Link found which matches query parameters.")
-        elif len(links) == 1:
-            return_link = Link(**links[0])
-            return return_link
-        else:
+        except MultipleItemsFoundException:
             raise MultipleRecordsFoundException("Found multiple PDFs for the query parameters.")
     
+    @staticmethod
+    def get_redirect_by_id(env, linkid):
+        """
+        Static method which gets the url and redirect policy for a link, using the in-process cache where possible
+        """
+        redirect = Link._known_redirect(env, linkid)
+        if redirect is LinkCache.NOT_FOUND:
+            raise LinkNotFoundException("No Link found which matches query parameters.")
+        if redirect is not None:
+            return redirect
+        key = (env, linkid)
+        try:
+            link = Link.get_link_by_id(
+                env=env,
+                linkid=linkid
+            )
+        except LinkNotFoundException:
+            Link._link_cache.put(key, LinkCache.NOT_FOUND)
+            raise
+        redirect = redirect_from_link(link.__dict__)
+        Link._link_cache.put(key, redirect)
+        if expired(redirect):
+            # DynamoDB has not deleted it yet
+            raise LinkNotFoundException("No Link found which matches query parameters.")
+        return redirect
+
+    @staticmethod
+    def _known_redirect(env, linkid):
+        """
+        Static method which gets a redirect without reading DynamoDB, LinkCache.NOT_FOUND if the link is known not
+        to exist or has expired and None if it has to be read
+        """
+        if Link._link_filter is not None and not Link._link_filter.might_exist(env, linkid):
+            # nothing is cached for these, so made up IDs cannot push real links out of the cache
+            return LinkCache.NOT_FOUND
+        redirect = None
+        if Link._hot_links is not None:
+            redirect = Link._hot_links.get(env, linkid)
+        if redirect is None:
+            redirect = Link._link_cache.get((env, linkid))
+        if redirect is not None and redirect is not LinkCache.NOT_FOUND and expired(redirect):
+            return LinkCache.NOT_FOUND
+        return redirect
+
+    @staticmethod
+    def get_redirects_by_ids(env, linkids):
+        """
+        Static method which gets the redirects for many links at once, returns a dict of link ID to Redirect for
+        the links found and a list of the IDs which were not
+
+        Links are looked up in the caches first.  With the link ID table in use the rest are read with eventually
+        consistent BatchGetItem, otherwise each is a query on the index and BATCH_WORKERS of them are run at once.
+        A link ID which is on more than one record is logged and treated as missing.
+        """
+        found = {}
+        missing = []
+        to_read = []
+        for linkid in dict.fromkeys(linkids):
+            redirect = Link._known_redirect(env, linkid)
+            if redirect is LinkCache.NOT_FOUND:
+                missing.append(linkid)
+            elif redirect is not None:
+                found[linkid] = redirect
+            else:
+                to_read.append(linkid)
+        read = {}
+        if to_read and lookup_enabled():
+            items = LinkById._dh_batch_get(
+                env=env,
+                keys=[{"linkid": linkid} for linkid in to_read]
+            )
+            read = {item["linkid"]: redirect_from_link(item) for item in items}
+        elif to_read:
+            def lookup(linkid):
+                try:
+                    return redirect_from_link(Link.get_link_by_id(env=env, linkid=linkid).__dict__)
+                except LinkNotFoundException:
+                    return None
+                except MultipleRecordsFoundException:
+                    logger.error("Link {l} is on more than one record, treating it as missing".format(l=linkid))
+                    return False
+            with ThreadPoolExecutor(max_workers=Link.BATCH_WORKERS) as executor:
+                read = dict(zip(to_read, executor.map(bind(lookup), to_read)))
+        for linkid in to_read:
+            redirect = read.get(linkid)
+            if redirect is False:
+                # not cached, so it is read again once the duplicate records are fixed
+                missing.append(linkid)
+                continue
+            Link._link_cache.put((env, linkid), LinkCache.NOT_FOUND if redirect is None else redirect)
+            if redirect is None or expired(redirect):
+                missing.append(linkid)
+            else:
+                found[linkid] = redirect
+        return found, missing
+
+    @staticmethod
+    def get_url_by_id(env, linkid):
+        """
+        Static method which gets the url for a link, using the in-process cache where possible
+        """
+        return Link.get_redirect_by_id(env=env, linkid=linkid).url
+
+    @staticmethod
+    def _record_changes(env, linkids):
+        """
+        Static method which logs that links are about to change, so they are no longer served from hot link snapshots
+        """
+        record_changes(env=env, linkids=linkids, timestamp=time.time())
+        if Link._hot_links is not None:
+            for linkid in linkids:
+                Link._hot_links.tombstone(linkid)
+
+    @staticmethod
+    def get_cache_stats():
+        """
+        Static method which returns the counters for the link cache
+        """
+        return Link._link_cache.stats()
+
+    @staticmethod
+    def get_hot_link_stats():
+        """
+        Static method which returns the counters for the hot link snapshot, None if there is no snapshot
+        """
+        if Link._hot_links is None:
+            return None
+        return Link._hot_links.stats()
+
+    @staticmethod
+    def get_lookup_counters():
+        """
+        Static method which returns the running totals of link cache and hot link lookups, named as request metrics
+        """
+        cache = Link._link_cache.stats()
+        hot = Link._hot_links.stats() if Link._hot_links is not None else {"hits": 0, "misses": 0}
+        return {
+            "LinkCacheHits": cache["hits"],
+            "LinkCacheMisses": cache["misses"],
+            "HotLinkHits": hot["hits"],
+            "HotLinkMisses": hot["misses"]
+        }
+
     @staticmethod
     def get_links_for_user(env, userid):
         """
         Static method which gets a list of links for a single user
         """
-        links = Link._dh_get_and_filter_with_index(
+        links = Link._dh_query_iter(
             env=env,
             index=None,
             consistent=False,
@@ -111,7 +603,49 @@ class Link(DynamoHandler):
             custom_filter_args=None,
             id=userid
         )
-        resp = []
-        for link in links:
-            resp = resp + [Link(**link)]
-        return resp
\ No newline at end of file
+        return [Link(**link) for link in links]
+    
+    @staticmethod
+    def get_link_results(env, userid):
+        """
+        Static method which gets all of a user's links as a LinkResultSet, without making an object per link
+        """
+        links = Link._dh_query_iter(
+            env=env,
+            index=None,
+            consistent=False,
+            custom_key_filter=None,
+            custom_filter_args=None,
+            id=userid
+        )
+        return LinkResultSet.from_dicts(links)
+
+    @staticmethod
+    def get_links_page(env, userid, page_size, cursor=None):
+        """
+        Static method which gets one page of a user's links, newest first
+
+        Returns the links as a LinkResultSet and the cursor for the next page, which is None on the last page
+        """
+        links, next_cursor = Link._dh_query_page(
+            env=env,
+            index="UserCreationDateIndex",
+            page_size=page_size,
+            cursor=cursor,
+            scan_forward=False,
+            id=userid
+        )
+        return LinkResultSet.from_dicts(links), next_cursor
+
+    @staticmethod
+    def iter_all_links(env, segments=4, page_size=None, **kwargs):
+        """
+        Static method which scans every link in the table, filtering on kwargs, intended for offline jobs
+        """
+        for link in Link._dh_scan_iter(
+            env=env,
+            segments=segments,
+            page_size=page_size,
+            **kwargs
+        ):
+            yield Link(**link)
@@ -0,0 +1,170 @@
+"""
+Module providing compact containers for reading many links at once
+"""
+from datetime import timezone
+from json.encoder import encode_basestring_ascii
+
+FIELDS = ["id", "linkid", "url", "creation_date", "modified_date", "expires_at", "redirect_status", "cache_ttl", "version"]
+DATE_FIELDS = ["creation_date", "modified_date", "expires_at"]
+NUMBER_FIELDS = ["redirect_status", "cache_ttl", "version"]
+
+_WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def _http_date(date):
+    """
+    Formats a date the way Flask's jsonify does, naive dates are taken to be UTC
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc)
+    return "{w}, {d:02d} {m} {y:04d} {H:02d}:{M:02d}:{S:02d} GMT".format(
+        w=_WEEKDAYS[date.weekday()],
+        d=date.day,
+        m=_MONTHS[date.month - 1],
+        y=date.year,
+        H=date.hour,
+        M=date.minute,
+        S=date.second
+    )
+
+def _json_string(value):
+    """
+    Encodes a string field as JSON, escaping the same way json.dumps does
+    """
+    if value is None:
+        return "null"
+    return encode_basestring_ascii(value)
+
+def _json_number(value):
+    """
+    Encodes a number field as JSON
+    """
+    if value is None:
+        return "null"
+    return str(value)
+
+def _json_date(value):
+    """
+    Encodes a date field as JSON
+    """
+    if value is None:
+        return "null"
+    return '"' + _http_date(value) + '"'
+
+class LinkRecord(object):
+    """
+    A read only link without the per object dict a Link has
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, id=None, linkid=None, url=None, creation_date=None, modified_date=None, expires_at=None,
+                 redirect_status=None, cache_ttl=None, version=None):
+        """
+        Constructor
+        """
+        self.id = id
+        self.linkid = linkid
+        self.url = url
+        self.creation_date = creation_date
+        self.modified_date = modified_date
+        self.expires_at = expires_at
+        self.redirect_status = redirect_status
+        self.cache_ttl = cache_ttl
+        self.version = version
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def to_dict(self):
+        """
+        Returns the fields as a dict
+        """
+        return {field: getattr(self, field) for field in FIELDS}
+
+class LinkResultSet(object):
+    """
+    Links stored a column per field rather than an object per link
+
+    Sorting, filtering and slicing work on a list of row numbers and share the columns, so no per link objects are
+    made until rows are iterated over, and to_json writes the rows without making any.
+    """
+    def __init__(self, columns, rows=None):
+        """
+        Constructor
+
+        columns = dict of field name to a list of values, all the lists are the same length
+        rows = the row numbers in the set, in order, defaults to every row
+        """
+        self._columns = columns
+        self._rows = rows if rows is not None else range(len(columns[FIELDS[0]]))
+
+    @staticmethod
+    def from_dicts(links, **defaults):
+        """
+        Static method which builds a result set from an iterable of link dicts, reading it only once
+
+        defaults = values for fields which are missing from the dicts, such as the user for search postings
+        """
+        columns = {field: [] for field in FIELDS}
+        appends = [(field, columns[field].append, defaults.get(field)) for field in FIELDS]
+        for link in links:
+            for (field, append, default) in appends:
+                append(link.get(field, default))
+        return LinkResultSet(columns)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        columns = [self._columns[field] for field in FIELDS]
+        for row in self._rows:
+            yield LinkRecord(*[column[row] for column in columns])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LinkResultSet(self._columns, self._rows[index])
+        row = self._rows[index]
+        return LinkRecord(*[self._columns[field][row] for field in FIELDS])
+
+    def column(self, field):
+        """
+        Gets the values of one field for the rows in the set
+        """
+        values = self._columns[field]
+        return [values[row] for row in self._rows]
+
+    def sorted(self, field, reverse=False):
+        """
+        Returns a new result set ordered on a field, rows with equal values keep their order
+        """
+        values = self._columns[field]
+        return LinkResultSet(self._columns, sorted(self._rows, key=values.__getitem__, reverse=reverse))
+
+    def filter_contains(self, field, value):
+        """
+        Returns a new result set of the rows where a string field contains value
+        """
+        if not value:
+            return self
+        values = self._columns[field]
+        return LinkResultSet(self._columns, [row for row in self._rows if value in (values[row] or "")])
+
+    def to_json(self):
+        """
+        Writes the rows as a JSON list of objects, with keys in the same order jsonify uses
+        """
+        fields = sorted(FIELDS)
+        columns = [
+            (
+                '"{f}":'.format(f=field),
+                self._columns[field],
+                _json_date if field in DATE_FIELDS else _json_number if field in NUMBER_FIELDS else _json_string
+            )
+            for field in fields
+        ]
+        rows = []
+        for row in self._rows:
+            rows.append("{" + ",".join(
+                prefix + encode(column[row]) for (prefix, column, encode) in columns
+            ) + "}")
+        return "[" + ",".join(rows) + "]"
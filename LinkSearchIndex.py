@@ -0,0 +1,220 @@
+"""
+Module to maintain and query the per user n-gram index used to filter the list of links
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+
+from DynamoHandler import DynamoHandler, ItemNotFoundException
+from ddb_metrics import bind
+
+logger = logging.getLogger(__name__)
+
+GRAM_SIZE = 3
+
+URL_FIELD = "u"
+LINKID_FIELD = "l"
+
+# grams which appear in most urls, their posting lists are as long as the user's list of links
+COMMON_URL_GRAMS = set(
+    gram
+    for part in ["https://www.", "http://www.", ".com/", ".com.au/", ".org/", ".net/", ".html", "index", "?utm_source=", "&utm_medium=", "&utm_campaign="]
+    for gram in (part[i:i + GRAM_SIZE] for i in range(len(part) - GRAM_SIZE + 1))
+)
+
+def search_index_mode():
+    """
+    Gets how the search index is used, 'off', 'write' to maintain it only or 'on' to also serve filtered lists
+    """
+    return os.environ.get("search_index", "off").lower()
+
+def index_enabled():
+    """
+    Returns True if the search index should be maintained
+    """
+    return search_index_mode() in ["write", "on"]
+
+def search_enabled():
+    """
+    Returns True if the search index should be used to filter lists
+    """
+    return search_index_mode() == "on"
+
+def grams(value):
+    """
+    Gets the set of n-grams in value
+    """
+    return set(value[i:i + GRAM_SIZE] for i in range(len(value) - GRAM_SIZE + 1))
+
+def link_tokens(userid, linkid, url):
+    """
+    Gets the set of tokens a link is indexed under
+    """
+    tokens = set(LinkSearchPosting.token(userid, URL_FIELD, gram) for gram in grams(url or ""))
+    tokens.update(LinkSearchPosting.token(userid, LINKID_FIELD, gram) for gram in grams(linkid))
+    return tokens
+
+class LinkSearchPosting(DynamoHandler):
+    """
+    An entry in the posting list for one n-gram of one of a user's links
+
+    The posting carries the fields shown in the list so a search does not need to read the links table.
+    """
+    _dh_field_mapping = {
+        "Token_id": "token",
+        "Link_id": "linkid",
+        "s_Url": "url",
+        "dt_CreationDate": "creation_date",
+        "dt_ModifiedDate": "modified_date",
+        "ttl_ExpiresAt": "expires_at",
+        "n_RedirectStatus": "redirect_status",
+        "n_CacheTtl": "cache_ttl",
+        "n_Version": "version"
+    }
+    _dh_backward_field_mapping = {v:k for (k,v) in _dh_field_mapping.items()}
+
+    _dh_sub_obj_mapping = {}
+
+    _dh_id_fields = [
+        "Token_id",
+        "Link_id"
+    ]
+
+    _dh_table_name = "UrlShortenerLinkSearch"
+
+    _dh_indexes = {}
+
+    def __init__(self, **kwargs):
+        self.__dict__ = kwargs
+        self._dh_modified_fields = []
+        super(LinkSearchPosting, self).__init__()
+
+    @staticmethod
+    def token(userid, field, gram):
+        """
+        Static method which builds the partition key for a gram of a field of a user's links
+        """
+        return "{u}#{f}#{g}".format(u=userid, f=field, g=gram)
+
+def index_link(env, link, old_url=None):
+    """
+    Writes the postings for a link, removing the ones for old_url which are no longer needed
+    """
+    index_links(env, [link], old_urls=[old_url])
+
+def index_links(env, links, old_urls=None):
+    """
+    Writes the postings for many links in one batch, old_urls lines up with links when urls have changed
+    """
+    if not index_enabled():
+        return
+    old_urls = old_urls or [None] * len(links)
+    puts = []
+    deletes = []
+    for (link, old_url) in zip(links, old_urls):
+        tokens = link_tokens(link.id, link.linkid, link.url)
+        puts.extend(LinkSearchPosting(
+            token=token,
+            linkid=link.linkid,
+            url=link.url,
+            creation_date=link.creation_date,
+            modified_date=link.modified_date,
+            # the postings are deleted by DynamoDB along with the link
+            expires_at=link.__dict__.get("expires_at"),
+            redirect_status=link.__dict__.get("redirect_status"),
+            cache_ttl=link.__dict__.get("cache_ttl"),
+            version=link.__dict__.get("version")
+        ) for token in tokens)
+        if old_url:
+            deletes.extend(
+                LinkSearchPosting(token=token, linkid=link.linkid)
+                for token in link_tokens(link.id, link.linkid, old_url) - tokens
+            )
+    _write_postings(env, puts, deletes)
+
+def update_postings(env, link, fields):
+    """
+    Updates the fields carried on a link's postings in place, for when its url has not changed so its tokens have not
+    """
+    if not index_enabled():
+        return
+    fields = [field for field in fields if field in LinkSearchPosting._dh_backward_field_mapping and field not in ["token", "linkid", "url"]]
+    if not fields:
+        return
+    def update(token):
+        posting = LinkSearchPosting(token=token, linkid=link.linkid)
+        for field in fields:
+            posting._dh_update_field(field_name=field, field_value=link.__dict__.get(field))
+        try:
+            posting._dh_conditional_update(env=env, return_values="NONE")
+        except ItemNotFoundException:
+            # the link was created before the index was maintained, updates do not add it
+            return False
+        return True
+    with ThreadPoolExecutor(max_workers=LinkSearchPosting.BATCH_WORKERS) as executor:
+        missing = list(executor.map(bind(update), link_tokens(link.id, link.linkid, link.url))).count(False)
+    if missing:
+        logger.warning("{n} search postings for link {l} were not found, the search index is out of step".format(n=missing, l=link.linkid))
+
+def unindex_links(env, links):
+    """
+    Removes all the postings for the links, the links need their url
+    """
+    if not index_enabled():
+        return
+    deletes = [
+        LinkSearchPosting(token=token, linkid=link.linkid)
+        for link in links
+        for token in link_tokens(link.id, link.linkid, link.url)
+    ]
+    _write_postings(env, [], deletes)
+
+def _write_postings(env, puts, deletes):
+    """
+    Sends the posting changes, logging any which could not be written
+    """
+    put_results, delete_results = LinkSearchPosting._dh_batch_write(
+        env=env,
+        put_items=puts,
+        delete_items=deletes
+    )
+    failed = put_results.count(False) + delete_results.count(False)
+    if failed:
+        logger.error("{n} search postings could not be written, the search index is out of step".format(n=failed))
+
+def _gram_cost(field, gram):
+    """
+    Estimates how long the posting list for a gram is, lower is shorter
+    """
+    if field == LINKID_FIELD:
+        # link IDs are random so their grams are close to unique
+        return 0
+    if gram in COMMON_URL_GRAMS:
+        return 3
+    if any(c.isdigit() or c.isupper() for c in gram):
+        return 1
+    return 2
+
+def search_links(env, userid, url_filter="", linkid_filter=""):
+    """
+    Finds the postings for a user's links whose url and link ID contain the filters
+
+    Only the posting list of the most selective gram is read, the matches are then checked against the full filters.
+    Returns None if neither filter is long enough to use the index, otherwise the matching postings newest first.
+    """
+    candidates = [(URL_FIELD, gram) for gram in grams(url_filter)]
+    candidates.extend((LINKID_FIELD, gram) for gram in grams(linkid_filter))
+    if len(candidates) == 0:
+        return None
+    field, gram = min(candidates, key=lambda c: _gram_cost(*c))
+    logger.info("Searching using gram '%s' of field '%s'", gram, field)
+    postings = LinkSearchPosting._dh_query_iter(
+        env=env,
+        token=LinkSearchPosting.token(userid, field, gram)
+    )
+    matches = [
+        posting for posting in postings
+        if url_filter in posting["url"] and linkid_filter in posting["linkid"]
+    ]
+    matches.sort(key=lambda p: p["creation_date"], reverse=True)
+    return matches
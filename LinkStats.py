@@ -0,0 +1,131 @@
+"""
+Module to store and read the click counts for links
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from click_analytics import aggregator_from_environment, analytics_enabled, minute_of
+from DynamoHandler import DynamoHandler
+
+logger = logging.getLogger(__name__)
+
+# longest histogram which can be asked for, a day of minutes
+MAX_STATS_MINUTES = 1440
+
+class LinkClickCount(DynamoHandler):
+    """
+    The clicks on a link in one minute, the running total is kept in a sharded counter
+    """
+    _dh_field_mapping = {
+        "Link_id": "linkid",
+        "Bucket_id": "bucket",
+        "n_Clicks": "clicks"
+    }
+    _dh_backward_field_mapping = {v:k for (k,v) in _dh_field_mapping.items()}
+
+    _dh_sub_obj_mapping = {}
+
+    _dh_id_fields = [
+        "Link_id",
+        "Bucket_id"
+    ]
+
+    _dh_table_name = "UrlShortenerLinkStats"
+
+    _dh_indexes = {}
+
+    def __init__(self, **kwargs):
+        self.__dict__ = kwargs
+        self._dh_modified_fields = []
+        super(LinkClickCount, self).__init__()
+
+def total_counter(linkid):
+    """
+    Gets the name of the counter holding a link's total clicks, it is sharded when the link gets busy
+    """
+    return "LinkClicks_{l}".format(l=linkid)
+
+def write_click_deltas(deltas):
+    """
+    Adds the clicks for each link to its minute buckets and its total, returns the number of clicks not written
+    """
+    def write(entry):
+        (env, linkid), minutes = entry
+        failed = 0
+        for (minute, clicks) in minutes.items():
+            try:
+                LinkClickCount._dh_add_counts(
+                    env=env,
+                    counts={"clicks": clicks},
+                    linkid=linkid,
+                    bucket=minute
+                )
+            except Exception as err:
+                logger.error("Could not add {n} clicks to {l} for {m}: {e}".format(n=clicks, l=linkid, m=minute, e=err))
+                failed += clicks
+        try:
+            LinkClickCount._dh_increment_any_counter(
+                env=env,
+                counter=total_counter(linkid),
+                amount=sum(minutes.values()),
+                return_total=False
+            )
+        except Exception as err:
+            logger.error("Could not add to the total clicks for {l}: {e}".format(l=linkid, e=err))
+        return failed
+    logger.info("Writing clicks for %d links", len(deltas))
+    with ThreadPoolExecutor(max_workers=LinkClickCount.BATCH_WORKERS) as executor:
+        return sum(executor.map(write, deltas.items()))
+
+_aggregator = aggregator_from_environment(write=write_click_deltas)
+
+def record_click(env, linkid):
+    """
+    Counts a click on a link in memory, if click analytics are on
+    """
+    if analytics_enabled():
+        _aggregator.record(env, linkid)
+
+def flush_clicks_if_due():
+    """
+    Writes the clicks counted so far if they are due, to be called once a response has been built
+    """
+    _aggregator.flush_if_due()
+
+def flush_clicks():
+    """
+    Writes the clicks counted so far
+    """
+    _aggregator.flush()
+
+def get_aggregator_stats():
+    """
+    Gets the counters for the clicks counted by this container
+    """
+    return _aggregator.stats()
+
+def get_link_stats(env, linkid, minutes=60, now=None):
+    """
+    Gets a link's total clicks and its clicks per minute over the last few minutes, minutes with no clicks are left out
+
+    Clicks are counted in memory before they are written, so the figures lag behind by up to click_flush_interval.
+    """
+    now = now or time.time()
+    total = LinkClickCount._dh_get_counter(
+        env=env,
+        counter=total_counter(linkid)
+    )
+    since = minute_of(now - (minutes - 1) * 60)
+    buckets = LinkClickCount._dh_query_iter(
+        env=env,
+        custom_key_filter="Bucket_id >= :since",
+        custom_filter_args={":since": {"S": since}},
+        linkid=linkid
+    )
+    return {
+        "linkid": linkid,
+        "total_clicks": total,
+        "since": since,
+        "minutes": [{"minute": b["bucket"], "clicks": b["clicks"]} for b in buckets]
+    }
@@ -0,0 +1,93 @@
+"""
+Benchmark for the cost click counting adds to redirects
+
+Redirects are served by the redirect handler against the in-memory DynamoDB stand-in with a fixed latency per call,
+with a warm link cache so a redirect does not normally touch the database.  Clicks are counted three ways: not at
+all, with an update per click before the response, and with the in-memory aggregator.
+
+Usage: python benchmarks/bench_click_analytics.py [--redirects N] [--links N] [--latency SECONDS]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["environment_name"] = "bench"
+os.environ["click_analytics"] = "on"
+
+# the handlers log at debug level, which would swamp the timings
+logging.disable(logging.CRITICAL)
+
+import dynamo_client
+import LinkStats
+import redirect_function
+from click_analytics import ClickAggregator, minute_of
+from fake_dynamodb import FakeDynamoDB, Table
+
+ENV = "bench"
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def run(name, fake, redirects, links, record):
+    """
+    Serves the redirects one after another, timing each one
+    """
+    LinkStats.record_click = record
+    redirect_function.record_click = record
+    rnd = random.Random(1)
+    fake.reset_counters()
+    timings = []
+    for i in range(redirects):
+        start = time.perf_counter()
+        response = redirect_function.redirect_handler({"httpMethod": "GET", "path": "/l{n}".format(n=rnd.randrange(links))}, None)
+        timings.append(time.perf_counter() - start)
+        assert response["statusCode"] == 301
+    # write the clicks still pending before counting the writes
+    LinkStats._aggregator.flush()
+    print("{n:<22} mean {m:7.3f}ms  p50 {p50:7.3f}ms  p99 {p99:7.3f}ms  updates {u}".format(
+        n=name,
+        m=sum(timings) / len(timings) * 1000,
+        p50=percentile(timings, 50) * 1000,
+        p99=percentile(timings, 99) * 1000,
+        u=fake.calls["update_item"]
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks click counting on the redirect path")
+    parser.add_argument("--redirects", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds each DynamoDB call takes")
+    args = parser.parse_args()
+
+    fake = FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id", indexes={"UrlLinkIdIndex": {"hash": "Link_id"}}),
+        Table("UrlShortenerLinkStats_{e}".format(e=ENV), "Link_id", "Bucket_id"),
+        Table("{e}_RycCounters".format(e=ENV), "Counter_id")
+    ], latency=args.latency)
+    fake.load("UrlShortenerLinks_{e}".format(e=ENV), [
+        {"User_id": {"S": "user"}, "Link_id": {"S": "l{n}".format(n=i)}, "s_Url": {"S": "https://example.com/{n}".format(n=i)}}
+        for i in range(args.links)
+    ])
+    dynamo_client.set_client(fake)
+    # fill the link cache so the redirects themselves do not call dynamo
+    for i in range(args.links):
+        redirect_function.redirect_response("l{n}".format(n=i))
+
+    def synchronous(env, linkid):
+        LinkStats.write_click_deltas({(env, linkid): {minute_of(time.time()): 1}})
+
+    LinkStats._aggregator = ClickAggregator(write=LinkStats.write_click_deltas, flush_interval=1, max_links=100)
+
+    print("{r} redirects over {l} links, {d}ms per DynamoDB call".format(r=args.redirects, l=args.links, d=args.latency * 1000))
+    run("not counted", fake, args.redirects, args.links, lambda env, linkid: None)
+    run("update per click", fake, args.redirects, args.links, synchronous)
+    run("aggregated", fake, args.redirects, args.links, LinkStats._aggregator.record)
+    print("aggregator: {s}".format(s=LinkStats.get_aggregator_stats()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark comparing the per call cost of creating a DynamoDB client against the shared client pool
+
+No requests are sent to AWS, this only measures the client management overhead paid by each DynamoHandler call.
+
+Usage: python benchmarks/bench_client_pool.py [iterations]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+
+import boto3
+
+import dynamo_client
+
+def time_calls(fn, iterations):
+    """
+    Returns the mean time in microseconds for a call to fn
+    """
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000000
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    before = time_calls(lambda: boto3.client("dynamodb"), iterations)
+    dynamo_client.reset_clients()
+    first = time_calls(dynamo_client.get_client, 1)
+    after = time_calls(dynamo_client.get_client, iterations)
+    print("iterations: {n}".format(n=iterations))
+    print("boto3.client per call:       {t:10.1f} us".format(t=before))
+    print("pooled client, first call:   {t:10.1f} us".format(t=first))
+    print("pooled client, warm call:    {t:10.1f} us".format(t=after))
+    print("speedup:                     {s:10.0f}x".format(s=before / after))
+
+if __name__ == '__main__':
+    main()
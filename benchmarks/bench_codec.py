@@ -0,0 +1,97 @@
+"""
+Micro-benchmark for encoding Link objects into DynamoDB items and decoding them back
+
+The compiled per-class codecs are compared with the general code which works out each field's type from its name.
+Dates are also parsed on their own, comparing the ISO-8601 fast path with dateutil.
+
+Usage: python benchmarks/bench_codec.py [--items N] [--repeat N]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import dateutil.parser
+
+from dynamo_codec import Schema, parse_datetime
+from LinkObject import Link
+
+class GeneralLink(Link):
+    """
+    A Link which always goes through the general code
+    """
+    pass
+
+GeneralLink._dh_schema = Schema({}, {})
+
+def make_links(count):
+    """
+    Generates links with the fields a created link has
+    """
+    start = datetime(2020, 1, 1, 12, 0, 0, 123456)
+    return [Link(
+        id="user{n}".format(n=i % 100),
+        linkid="l{n:07d}".format(n=i),
+        url="https://example.com/some/path/{n}?utm_source=news".format(n=i),
+        creation_date=start + timedelta(seconds=i),
+        modified_date=start + timedelta(seconds=i, microseconds=i % 1000)
+    ) for i in range(count)]
+
+def best_of(repeat, f):
+    """
+    Runs f repeat times and returns the fastest time and the result
+    """
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def report(name, count, elapsed, baseline=None):
+    line = "{n:<32} {t:8.3f}s {u:8.2f}us/item".format(n=name, t=elapsed, u=elapsed / count * 1e6)
+    if baseline:
+        line += "  {x:5.1f}x".format(x=baseline / elapsed)
+    print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the DynamoHandler field codecs")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # the codecs log at info level, which would swamp the timings
+    logging.disable(logging.INFO)
+
+    links = make_links(args.items)
+    general_links = [GeneralLink(**dict(link.__dict__)) for link in links]
+    for link in general_links:
+        del link.__dict__["_dh_modified_fields"]
+
+    general_encode, general_items = best_of(args.repeat, lambda: [link._dh_prepare_item() for link in general_links])
+    compiled_encode, items = best_of(args.repeat, lambda: [link._dh_prepare_item() for link in links])
+    assert items == general_items
+
+    general_decode, general_flat = best_of(args.repeat, lambda: GeneralLink._dh_flatten_items(items))
+    compiled_decode, flat = best_of(args.repeat, lambda: Link._dh_flatten_items(items))
+    assert flat == general_flat
+
+    dates = [item["dt_CreationDate"]["S"] for item in items]
+    dateutil_parse, parsed = best_of(1, lambda: [dateutil.parser.parse(d) for d in dates])
+    fast_parse, fast_parsed = best_of(args.repeat, lambda: [parse_datetime(d) for d in dates])
+    assert parsed == fast_parsed
+
+    print("{n} Link items, best of {r}".format(n=args.items, r=args.repeat))
+    report("encode, general", args.items, general_encode)
+    report("encode, compiled", args.items, compiled_encode, general_encode)
+    report("decode, general", args.items, general_decode)
+    report("decode, compiled", args.items, compiled_decode, general_decode)
+    report("parse date, dateutil", args.items, dateutil_parse)
+    report("parse date, fast path", args.items, fast_parse, dateutil_parse)
+
+if __name__ == '__main__':
+    main()
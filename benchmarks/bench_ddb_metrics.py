@@ -0,0 +1,72 @@
+"""
+Benchmark for the per request DynamoDB metrics
+
+Measures what the metrics wrapper adds to a DynamoDB call, with no request being measured and with one, and what a
+whole request costs to summarise and write out.  The calls go to the in-memory DynamoDB stand-in, so the times are
+the client side cost alone, which a real call adds to milliseconds of network time.
+
+Usage: python benchmarks/bench_ddb_metrics.py [--calls N] [--requests N]
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+logging.disable(logging.CRITICAL)
+
+from ddb_metrics import InstrumentedClient, finish_request, start_request
+from fake_dynamodb import FakeDynamoDB, Table
+
+TABLE = "UrlShortenerLinks_bench"
+
+def per_call(f, calls):
+    start = time.perf_counter()
+    for n in range(calls):
+        f()
+    return (time.perf_counter() - start) / calls * 1000000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the DynamoDB request metrics")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    fake = FakeDynamoDB([Table(TABLE, "User_id", "Link_id", indexes={"UrlLinkIdIndex": {"hash": "Link_id"}})])
+    fake.load(TABLE, [{"User_id": {"S": "user"}, "Link_id": {"S": "abc12"}, "s_Url": {"S": "https://example.com/"}}])
+    instrumented = InstrumentedClient(fake)
+    params = {
+        "TableName": TABLE,
+        "IndexName": "UrlLinkIdIndex",
+        "KeyConditionExpression": "Link_id = :l",
+        "ExpressionAttributeValues": {":l": {"S": "abc12"}}
+    }
+
+    bare = per_call(lambda: fake.query(**params), args.calls)
+    unmeasured = per_call(lambda: instrumented.query(**params), args.calls)
+    start_request("bench", "query")
+    measured = per_call(lambda: instrumented.query(**params), args.calls)
+    finish_request(out=io.StringIO())
+    print("query, stand-in client     {u:>8.2f}us per call".format(u=bare))
+    print("wrapped, not measuring     {u:>8.2f}us per call, +{d:.2f}us".format(u=unmeasured, d=unmeasured - bare))
+    print("wrapped, measuring         {u:>8.2f}us per call, +{d:.2f}us".format(u=measured, d=measured - bare))
+
+    # a redirect makes one call, an api request a handful
+    out = io.StringIO()
+    for calls in [1, 5]:
+        def request():
+            start_request("bench", "list")
+            for n in range(calls):
+                instrumented.query(**params)
+            finish_request(status=200, out=out)
+            out.seek(0)
+            out.truncate()
+        plain = per_call(lambda: [fake.query(**params) for n in range(calls)], args.requests)
+        elapsed = per_call(request, args.requests)
+        print("request of {c} calls         {u:>8.2f}us, +{d:.2f}us for the metrics".format(c=calls, u=elapsed, d=elapsed - plain))
+
+if __name__ == '__main__':
+    main()
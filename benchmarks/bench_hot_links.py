@@ -0,0 +1,109 @@
+"""
+Benchmark for the hot link snapshot
+
+Clicks are drawn from a Zipf distribution over the links, like real traffic where a few links get most clicks.  For
+snapshots of different sizes this reports the share of clicks served from the snapshot, the size of the file, the
+heap the mapped snapshot takes compared with the same links held in a dict, and the time per lookup compared with
+the link cache and a read from the in-memory DynamoDB stand-in.
+
+Usage: python benchmarks/bench_hot_links.py [--links N] [--top N [N ...]] [--clicks N] [--skew S]
+"""
+import argparse
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+logging.disable(logging.CRITICAL)
+
+import dynamo_client
+from fake_dynamodb import FakeDynamoDB, Table
+from hot_links import HotLinkSnapshot, HotLinks, write_snapshot
+from link_cache import LinkCache
+from link_id_allocator import _encode
+from LinkObject import Link
+from redirect_policy import Redirect
+
+ENV = "bench"
+
+def make_redirects(count):
+    """
+    Redirects for count links, the most popular first
+    """
+    return [
+        (_encode(n * 7919 % (62 ** 6), 6), Redirect("https://example.com/articles/{n}?utm_source=short".format(n=n), 301, 300, 1))
+        for n in range(count)
+    ]
+
+def per_lookup(f, linkids):
+    start = time.perf_counter()
+    for linkid in linkids:
+        f(linkid)
+    return (time.perf_counter() - start) / len(linkids) * 1000000
+
+def heap_of(build):
+    tracemalloc.start()
+    kept = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, kept
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the hot link snapshot")
+    parser.add_argument("--links", type=int, default=100000)
+    parser.add_argument("--top", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--clicks", type=int, default=200000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of the clicks")
+    args = parser.parse_args()
+
+    redirects = make_redirects(args.links)
+    weights = list(itertools.accumulate(1.0 / (rank + 1) ** args.skew for rank in range(args.links)))
+    rnd = random.Random(1)
+    clicks = [redirects[i][0] for i in (rnd.choices(range(args.links), cum_weights=weights, k=args.clicks))]
+    directory = tempfile.mkdtemp()
+
+    print("{l} links, {c} clicks with Zipf exponent {s}".format(l=args.links, c=args.clicks, s=args.skew))
+    print("{t:>8} {h:>9} {f:>10} {m:>12} {d:>12} {u:>12}".format(
+        t="top", h="hit rate", f="file", m="mapped heap", d="dict heap", u="per lookup"
+    ))
+    for top in args.top:
+        path = os.path.join(directory, "hot_links_{t}.bin".format(t=top))
+        write_snapshot(path, ENV, time.time(), dict(redirects[:top]))
+        mapped_heap, hot_links = heap_of(lambda: HotLinks(HotLinkSnapshot(path), changes_since=lambda env, since, until: set(), background=False))
+        dict_heap, kept = heap_of(lambda: {linkid: Redirect(*redirect) for (linkid, redirect) in redirects[:top]})
+        hot_links.refresh()
+        elapsed = per_lookup(lambda linkid: hot_links.get(ENV, linkid), clicks)
+        print("{t:>8} {h:>9.1%} {f:>8.1f}KB {m:>10.1f}KB {d:>10.1f}KB {u:>10.2f}us".format(
+            t=top,
+            h=hot_links.stats()["hit_rate"],
+            f=os.path.getsize(path) / 1024.0,
+            m=mapped_heap / 1024.0,
+            d=dict_heap / 1024.0,
+            u=elapsed
+        ))
+
+    # the other ways of finding a hot link, for comparison
+    hot = [linkid for (linkid, redirect) in redirects[:1000]]
+    sample = [hot[i % len(hot)] for i in range(20000)]
+    cache = LinkCache(max_size=len(hot), ttl=3600)
+    for (linkid, redirect) in redirects[:1000]:
+        cache.put((ENV, linkid), redirect)
+    fake = FakeDynamoDB([Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id", indexes={"UrlLinkIdIndex": {"hash": "Link_id"}})])
+    fake.load("UrlShortenerLinks_{e}".format(e=ENV), [
+        {"User_id": {"S": "user"}, "Link_id": {"S": linkid}, "s_Url": {"S": redirect.url}} for (linkid, redirect) in redirects[:1000]
+    ])
+    dynamo_client.set_client(fake)
+    print("")
+    print("link cache hit        {u:>8.2f}us per lookup".format(u=per_lookup(lambda linkid: cache.get((ENV, linkid)), sample)))
+    print("stand-in read         {u:>8.2f}us per lookup, before any network time".format(
+        u=per_lookup(lambda linkid: Link.get_link_by_id(env=ENV, linkid=linkid), sample[:2000])
+    ))
+
+if __name__ == '__main__':
+    main()
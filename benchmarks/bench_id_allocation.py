@@ -0,0 +1,70 @@
+"""
+Throughput benchmark for concurrent link creates with different ways of allocating the link ID
+
+Each create allocates an ID and writes the link, against the in-memory DynamoDB stand-in with a fixed latency per
+call.  A block size of 1 is the cost of one counter update per create.
+
+Usage: python benchmarks/bench_id_allocation.py [--threads N] [--creates N] [--latency SECONDS]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import dynamo_client
+from fake_dynamodb import FakeDynamoDB, Table
+from link_id_allocator import LinkIdAllocator
+from LinkObject import Link
+from random_string_gen import get_rand_string
+
+ENV = "bench"
+
+def run(name, allocate, threads, creates, latency):
+    """
+    Runs the creates on a pool of threads and prints the throughput
+    """
+    fake = FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id"),
+        Table("{e}_RycCounters".format(e=ENV), "Counter_id")
+    ], latency=latency)
+    dynamo_client.set_client(fake)
+
+    def create(i):
+        link = Link(
+            id="user{n}".format(n=i % threads),
+            linkid=allocate(),
+            url="https://example.com/{n}".format(n=i),
+            creation_date=datetime.utcnow(),
+            modified_date=datetime.utcnow()
+        )
+        link._dh_create_item(env=ENV)
+        return link.linkid
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        ids = list(executor.map(create, range(creates)))
+    elapsed = time.perf_counter() - start
+    print("{n:<24} {r:>10.0f} creates/s {c:>8} counter updates {d:>6} duplicate IDs".format(
+        n=name, r=creates / elapsed, c=fake.calls["update_item"], d=len(ids) - len(set(ids))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks link ID allocation")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--creates", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+    run("random 4 chars", lambda: get_rand_string(4), args.threads, args.creates, args.latency)
+    for block_size in [1, 10, 100, 1000]:
+        allocator = LinkIdAllocator(
+            lease=lambda env, count: Link._dh_get_next_counter(env=env, amount=count),
+            key=b"benchmark",
+            block_size=block_size
+        )
+        run("counter, block {b}".format(b=block_size), lambda: allocator.allocate(ENV), args.threads, args.creates, args.latency)
+
+if __name__ == '__main__':
+    main()
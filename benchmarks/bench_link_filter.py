@@ -0,0 +1,120 @@
+"""
+Benchmark for the link ID Bloom filter
+
+Builds filters for a number of links at a target false positive rate and reports their size, build time, time per
+check and the false positive rate measured with IDs which were not added.  Then serves requests for made up IDs
+through the redirect handler against the in-memory DynamoDB stand-in, with and without a filter, counting the reads.
+
+Usage: python benchmarks/bench_link_filter.py [--links N [N ...]] [--error-rate P] [--probes N] [--requests N]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["environment_name"] = "bench"
+os.environ["click_analytics"] = "off"
+
+# the handlers log at debug level, which would swamp the timings
+logging.disable(logging.CRITICAL)
+
+import dynamo_client
+import redirect_function
+from link_filter import BloomFilter, LinkFilter
+from link_id_allocator import ALPHABET, _encode
+from LinkObject import Link
+from fake_dynamodb import FakeDynamoDB, Table
+
+ENV = "bench"
+
+def link_ids(start, count):
+    """
+    Distinct six character IDs, IDs from different ranges never repeat
+    """
+    return (_encode(n, 6) for n in range(start, start + count))
+
+def measure(count, error_rate, probes):
+    """
+    Builds a filter of count IDs and measures it with IDs which were not added
+    """
+    start = time.perf_counter()
+    bloom = BloomFilter.for_capacity(count, error_rate)
+    for linkid in link_ids(0, count):
+        bloom.add(linkid)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    false_positives = sum(1 for linkid in link_ids(count, probes) if linkid in bloom)
+    checked = time.perf_counter() - start
+    print("{n:>10} {b:>10.2f}MB {k:>7} {t:>8.1f}s {c:>9.2f}us {e:>9.4f} {m:>9.4f}".format(
+        n=count,
+        b=bloom.size() / 1024.0 / 1024.0,
+        k=bloom.hashes,
+        t=built,
+        c=checked / probes * 1000000,
+        e=bloom.expected_error_rate(),
+        m=false_positives / float(probes)
+    ))
+
+def redirect_junk(requests, with_filter):
+    """
+    Serves requests for made up five character IDs, returning how many reads they cost
+    """
+    fake = FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id", indexes={"UrlLinkIdIndex": {"hash": "Link_id"}}),
+        Table("{e}_RycCounters".format(e=ENV), "Counter_id")
+    ])
+    existing = list(link_ids(0, 10000))
+    fake.load("UrlShortenerLinks_{e}".format(e=ENV), [
+        {"User_id": {"S": "user"}, "Link_id": {"S": linkid}, "s_Url": {"S": "https://example.com/"}} for linkid in existing
+    ])
+    fake.load("{e}_RycCounters".format(e=ENV), [{"Counter_id": {"S": "UrlShortenerLinks"}, "CounterVal": {"N": "10000"}}])
+    dynamo_client.set_client(fake)
+    Link._link_cache.clear()
+    Link._link_filter = None
+    if with_filter:
+        bloom = BloomFilter.for_capacity(len(existing), 0.01)
+        for linkid in existing:
+            bloom.add(linkid)
+        path = os.path.join(tempfile.mkdtemp(), "link_filter.bin")
+        LinkFilter(bloom, 10000, 1000000, time.time(), Link._id_allocator.counter_value).save(path)
+        Link._link_filter = LinkFilter.load(path, Link._id_allocator.counter_value, lambda env: Link._dh_get_current_counter(env=env))
+    rnd = random.Random(1)
+    start = time.perf_counter()
+    not_found = 0
+    for i in range(requests):
+        linkid = "".join(rnd.choice(ALPHABET) for c in range(5))
+        response = redirect_function.redirect_handler({"httpMethod": "GET", "path": "/" + linkid}, None)
+        not_found += response["statusCode"] == 404
+    elapsed = time.perf_counter() - start
+    print("{n:<16} {r:>8} requests {f:>8} not found {q:>6} queries {g:>4} counter reads {t:>8.1f}us each".format(
+        n="with filter" if with_filter else "without filter",
+        r=requests,
+        f=not_found,
+        q=fake.calls["query"],
+        g=fake.calls["get_item"],
+        t=elapsed / requests * 1000000
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the link ID Bloom filter")
+    parser.add_argument("--links", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--probes", type=int, default=1000000, help="IDs not in the filter to check")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("{n:>10} {b:>12} {k:>7} {t:>9} {c:>11} {e:>9} {m:>9}".format(
+        n="links", b="size", k="hashes", t="build", c="per check", e="expected", m="measured"
+    ))
+    for count in args.links:
+        measure(count, args.error_rate, args.probes)
+    print("")
+    redirect_junk(args.requests, False)
+    redirect_junk(args.requests, True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark for the list action's handling of a user with many links
+
+The old way makes a Link per link, sorts them, turns each back into a dict and serialises the dicts.  The new way
+reads the links into a LinkResultSet, a column per field, and writes the JSON straight from the columns.  Both read
+the links from the in-memory DynamoDB stand-in, so decoding is included.  Peak memory is measured with tracemalloc in
+a separate run from the timings, as tracing slows everything down.
+
+Usage: python benchmarks/bench_list_results.py [--links N [N ...]] [--repeat N]
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import dynamo_client
+from fake_dynamodb import FakeDynamoDB, Table
+from LinkObject import Link
+from LinkResultSet import _http_date
+
+ENV = "bench"
+USER = "poweruser"
+PAGE_SIZE = 50
+
+def make_items(count):
+    """
+    Generates the stored items for one user's links
+    """
+    start = datetime(2019, 1, 1)
+    items = []
+    for i in range(count):
+        date = (start + timedelta(minutes=i)).isoformat()
+        items.append({
+            "User_id": {"S": USER},
+            "Link_id": {"S": "l{n:07d}".format(n=i)},
+            "s_Url": {"S": "https://example.com/some/path/{n}?utm_source=news".format(n=i)},
+            "dt_CreationDate": {"S": date},
+            "dt_ModifiedDate": {"S": date}
+        })
+    return items
+
+def old_list(page):
+    """
+    The list action as it was, objects then dicts then JSON, optionally cut down to a page
+    """
+    links = Link.get_links_for_user(env=ENV, userid=USER)
+    links.sort(key=lambda x: x.creation_date, reverse=True)
+    link_dicts = [link.__dict__ for link in links]
+    if page:
+        link_dicts = link_dicts[:PAGE_SIZE]
+    # what jsonify does with dates
+    return json.dumps({"links": link_dicts, "total_number": len(links)}, sort_keys=True, default=_http_date)
+
+def new_list(page):
+    """
+    The list action with a result set
+    """
+    links = Link.get_link_results(env=ENV, userid=USER).sorted("creation_date", reverse=True)
+    total = len(links)
+    if page:
+        links = links[:PAGE_SIZE]
+    return '{"links":' + links.to_json() + ',"total_number":' + str(total) + '}'
+
+def timed(f, repeat):
+    best = None
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(f):
+    gc.collect()
+    tracemalloc.start()
+    result = f()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks reading and serialising a user's links")
+    parser.add_argument("--links", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    print("{n:>8} {m:<14} {w:<10} {t:>10} {p:>12}".format(n="links", m="method", w="response", t="time", p="peak memory"))
+    for count in args.links:
+        fake = FakeDynamoDB([Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id")])
+        fake.load("UrlShortenerLinks_{e}".format(e=ENV), make_items(count))
+        dynamo_client.set_client(fake)
+        # warm the stand-in's query cache so only the application's work is measured
+        old_list(True)
+        for page in [False, True]:
+            for (name, f) in [("objects+dicts", old_list), ("result set", new_list)]:
+                elapsed = timed(lambda: f(page), args.repeat)
+                peak = peak_memory(lambda: f(page))
+                print("{n:>8} {m:<14} {w:<10} {t:>8.3f}s {p:>10.1f}MB".format(
+                    n=count,
+                    m=name,
+                    w="one page" if page else "all links",
+                    t=elapsed,
+                    p=peak / 1024.0 / 1024.0
+                ))
+        assert json.loads(old_list(False))["links"][0]["url"] == json.loads(new_list(False))["links"][0]["url"]
+
+if __name__ == '__main__':
+    main()
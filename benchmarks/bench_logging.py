@@ -0,0 +1,122 @@
+"""
+Benchmark for the logging profiles
+
+Sends redirects through the redirect handler and list and add requests through the Flask app, against the in-memory
+DynamoDB stand-in, and reports the CPU time per request under each profile.  The log lines go to /dev/null, so the
+times include building and formatting them but not shipping them to CloudWatch.  "before" is how the functions used
+to log, everything at debug with every request's event dumped in full.
+
+Usage: python benchmarks/bench_logging.py [--requests N]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.update({
+    "environment_name": "bench",
+    "click_analytics": "off",
+    "link_cache_ttl": "0",
+    "link_id_table": "off",
+    "ddb_metrics": "off"
+})
+
+# a handler of our own means configure_logging leaves the root logger's handlers alone
+logging.getLogger().addHandler(logging.StreamHandler(open(os.devnull, "w")))
+
+import dynamo_client
+import log_config
+from fake_dynamodb import FakeDynamoDB, Table
+
+ENV = "bench"
+
+PROFILES = [
+    ("before", {"log_profile": "debug", "log_sample_rate": "1"}),
+    ("debug", {"log_profile": "debug", "log_sample_rate": "100"}),
+    ("standard", {"log_profile": "standard"}),
+    ("redirect", {"log_profile": "redirect"})
+]
+
+def use_profile(settings):
+    os.environ.update(settings)
+    log_config._configured = False
+    log_config._request_sampler = log_config.Sampler(os.environ.get("log_sample_rate", 100))
+    log_config.configure_logging()
+
+def api_event(body, user="user"):
+    return {
+        "httpMethod": "POST",
+        "path": "/",
+        "headers": {"Content-Type": "application/json", "User-Agent": "Mozilla/5.0 (X11; Linux x86_64)"},
+        "body": json.dumps(body),
+        "stageVariables": {"env": ENV},
+        "requestContext": {
+            "authorizer": {"claims": {"cognito:username": user, "email": "{u}@example.com".format(u=user)}},
+            "identity": {"sourceIp": "192.0.2.1", "userAgent": "Mozilla/5.0 (X11; Linux x86_64)"}
+        }
+    }
+
+def use_fresh_tables():
+    """
+    Points the functions at new tables, so each profile starts with the same links
+    """
+    fake = FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id", indexes={
+            "UrlLinkIdIndex": {"hash": "Link_id"},
+            "UserCreationDateIndex": {"hash": "User_id", "range": "dt_CreationDate"}
+        }),
+        Table("UrlShortenerLinkSearch_{e}".format(e=ENV), "Token_id", "Link_id"),
+        Table("{e}_RycCounters".format(e=ENV), "Counter_id")
+    ])
+    fake.load("UrlShortenerLinks_{e}".format(e=ENV), [
+        {"User_id": {"S": "user"}, "Link_id": {"S": "l{n}".format(n=n)}, "s_Url": {"S": "https://example.com/{n}".format(n=n)},
+         "dt_CreationDate": {"S": "2020-01-01T00:00:{n:02d}".format(n=n)}}
+        for n in range(20)
+    ])
+    dynamo_client.set_client(fake)
+
+def cpu_per_request(f, requests, rounds=3):
+    """
+    Best of a few rounds, as other work on the machine only ever adds time
+    """
+    best = None
+    for r in range(rounds):
+        start = time.process_time()
+        for n in range(requests):
+            f(r * requests + n)
+        elapsed = (time.process_time() - start) / requests * 1000000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the logging profiles")
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    use_fresh_tables()
+    import redirect_function
+    from lambda_function import lambda_handler
+    requests = [
+        ("redirect", lambda n: redirect_function.redirect_handler({"httpMethod": "GET", "path": "/l{n}".format(n=n % 20), "headers": {}}, None)),
+        ("api list", lambda n: lambda_handler(api_event({"action": "list"}), None)),
+        # added by another user so the list requests always read the same links
+        ("api add", lambda n: lambda_handler(api_event({"action": "add", "url": "https://example.com/new/{n}".format(n=n)}, user="writer"), None))
+    ]
+
+    print("CPU per request")
+    print("{p:>10} ".format(p="profile") + " ".join("{r:>12}".format(r=name) for (name, f) in requests))
+    baseline = None
+    for (profile, settings) in PROFILES:
+        use_profile(settings)
+        use_fresh_tables()
+        times = [cpu_per_request(f, args.requests) for (name, f) in requests]
+        baseline = baseline or times
+        print("{p:>10} ".format(p=profile) + " ".join("{t:>10.0f}us".format(t=t) for t in times))
+    print("{p:>10} ".format(p="saved") + " ".join("{t:>11.0%}".format(t=1 - t / b) for (t, b) in zip(times, baseline)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark comparing a filtered list served by the search index against reading and filtering every link
+
+A single user with many links is loaded into the in-memory DynamoDB stand-in, then each filter is run both ways.
+Only the posting lists for the grams the filters can use are loaded, as a query never reads any other partition.
+
+Usage: python benchmarks/bench_search.py [--links N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["search_index"] = "on"
+
+import dynamo_client
+from fake_dynamodb import FakeDynamoDB, Table
+from LinkObject import Link
+from LinkSearchIndex import LinkSearchPosting, grams, link_tokens, search_links, URL_FIELD, LINKID_FIELD
+from random_string_gen import get_rand_string
+
+ENV = "bench"
+USER = "poweruser"
+DOMAINS = ["github.com", "example.com", "news.ycombinator.com", "docs.python.org", "aws.amazon.com", "www.youtube.com"]
+WORDS = ["release", "notes", "campaign", "summer", "winter", "launch", "blog", "video", "docs", "guide", "pricing", "signup"]
+
+FILTERS = [
+    {"url": "github", "linkid": ""},
+    {"url": "summer-launch", "linkid": ""},
+    {"url": "utm_source=news", "linkid": ""},
+    {"url": "", "linkid": "aB1"},
+    {"url": "pricing", "linkid": "x"}
+]
+
+def make_links(count):
+    """
+    Generates the user's links, newest last
+    """
+    rnd = random.Random(42)
+    start = datetime(2019, 1, 1)
+    links = []
+    for i in range(count):
+        url = "https://{d}/{a}-{b}/{n}?utm_source={c}".format(
+            d=rnd.choice(DOMAINS),
+            a=rnd.choice(WORDS),
+            b=rnd.choice(WORDS),
+            n=rnd.randint(1, 100000),
+            c=rnd.choice(["news", "mail", "social"])
+        )
+        date = start + timedelta(minutes=i)
+        links.append(Link(id=USER, linkid=get_rand_string(6), url=url, creation_date=date, modified_date=date))
+    return links
+
+def query_tokens():
+    """
+    Gets every token the filters could query
+    """
+    tokens = set()
+    for f in FILTERS:
+        tokens.update(LinkSearchPosting.token(USER, URL_FIELD, g) for g in grams(f["url"]))
+        tokens.update(LinkSearchPosting.token(USER, LINKID_FIELD, g) for g in grams(f["linkid"]))
+    return tokens
+
+def scan_and_filter(f):
+    """
+    The list action without the search index
+    """
+    links = Link.get_links_for_user(env=ENV, userid=USER)
+    links.sort(key=lambda x: x.creation_date, reverse=True)
+    link_dicts = [link.__dict__ for link in links]
+    if len(f["url"]) > 0:
+        link_dicts = [l for l in link_dicts if f["url"] in l["url"]]
+    if len(f["linkid"]) > 0:
+        link_dicts = [l for l in link_dicts if f["linkid"] in l["linkid"]]
+    return link_dicts
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the link search index")
+    parser.add_argument("--links", type=int, default=50000)
+    args = parser.parse_args()
+    fake = FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=ENV), "User_id", "Link_id"),
+        Table("UrlShortenerLinkSearch_{e}".format(e=ENV), "Token_id", "Link_id")
+    ])
+    dynamo_client.set_client(fake)
+    links = make_links(args.links)
+    # one of the filters should find something
+    links[-1].linkid = "aB1" + links[-1].linkid[3:]
+    fake.load("UrlShortenerLinks_{e}".format(e=ENV), [link._dh_prepare_item() for link in links])
+    wanted = query_tokens()
+    postings = []
+    for link in links:
+        for token in link_tokens(link.id, link.linkid, link.url) & wanted:
+            postings.append(LinkSearchPosting(
+                token=token,
+                linkid=link.linkid,
+                url=link.url,
+                creation_date=link.creation_date,
+                modified_date=link.modified_date
+            )._dh_prepare_item())
+    fake.load("UrlShortenerLinkSearch_{e}".format(e=ENV), postings)
+    print("{n} links, {p} postings loaded".format(n=args.links, p=len(postings)))
+    print("{f:<40} {m:>8} {st:>10} {sr:>10} {it:>10} {ir:>10}".format(
+        f="filter", m="matches", st="scan ms", sr="scan read", it="index ms", ir="index read"))
+    for f in FILTERS:
+        fake.reset_counters()
+        start = time.perf_counter()
+        expected = scan_and_filter(f)
+        scan_ms = (time.perf_counter() - start) * 1000
+        scan_read = fake.items_read
+        fake.reset_counters()
+        start = time.perf_counter()
+        matches = search_links(env=ENV, userid=USER, url_filter=f["url"], linkid_filter=f["linkid"])
+        index_ms = (time.perf_counter() - start) * 1000
+        index_read = fake.items_read
+        if matches is None:
+            index_ms, index_read = float("nan"), 0
+        elif [m["linkid"] for m in matches] != [l["linkid"] for l in expected]:
+            raise RuntimeError("Search index returned different links for {f}".format(f=f))
+        print("{f:<40} {m:>8} {st:>10.1f} {sr:>10} {it:>10.1f} {ir:>10}".format(
+            f="url={u!r} linkid={l!r}".format(u=f["url"], l=f["linkid"]),
+            m=len(expected), st=scan_ms, sr=scan_read, it=index_ms, ir=index_read))
+
+if __name__ == '__main__':
+    main()
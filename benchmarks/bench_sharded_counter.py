@@ -0,0 +1,91 @@
+"""
+Load test for a hot counter in the RycCounters table
+
+Several threads add to one counter as fast as they can for a fixed time, against the in-memory DynamoDB stand-in with
+a limit on how many writes a second any one item takes, standing in for a hot partition.  The counter is run first
+as a single item, where writes over the limit are throttled and lost, then with sharding, where a throttled increment
+grows the counter and is tried again on another shard.  At the end the counter's total is checked against the
+increments which succeeded.
+
+Usage: python benchmarks/bench_sharded_counter.py [--threads N] [--seconds N] [--limit N] [--latency SECONDS]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# a throttled increment is logged, which would swamp the output
+logging.disable(logging.CRITICAL)
+
+import dynamo_client
+import DynamoHandler as dynamo_handler
+from DynamoHandler import DynamoHandler
+from fake_dynamodb import FakeDynamoDB, Table
+
+ENV = "bench"
+COUNTER = "LinkClicks_hot"
+
+def run(name, fake, threads, seconds, max_shards):
+    """
+    Increments the counter from every thread until time is up, returning the increments which succeeded
+    """
+    fake.tables["{e}_RycCounters".format(e=ENV)].items.clear()
+    dynamo_handler._counter_shards.clear()
+    fake.reset_counters()
+    DynamoHandler.COUNTER_MAX_SHARDS = max_shards
+    done = []
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def worker():
+        ok = failed = 0
+        while time.monotonic() < stop:
+            try:
+                DynamoHandler._dh_increment_any_counter(env=ENV, counter=COUNTER, return_total=False)
+                ok += 1
+            except fake.exceptions.ProvisionedThroughputExceededException:
+                failed += 1
+        with lock:
+            done.append((ok, failed))
+
+    workers = [threading.Thread(target=worker) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    ok = sum(d[0] for d in done)
+    failed = sum(d[1] for d in done)
+    total = DynamoHandler._dh_get_counter(env=ENV, counter=COUNTER)
+    print("{n:<12} {w:>10.0f}/s {f:>10} {t:>10} {s:>7} {c}".format(
+        n=name,
+        w=ok / float(seconds),
+        f=failed,
+        t=fake.throttled,
+        s=DynamoHandler._dh_counter_shards(env=ENV, counter=COUNTER),
+        c="ok" if total == ok else "MISMATCH {t} != {o}".format(t=total, o=ok)
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load tests a hot counter with and without sharding")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--limit", type=int, default=200, help="writes a second one item takes before it is throttled")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds each DynamoDB call takes")
+    args = parser.parse_args()
+
+    fake = FakeDynamoDB([Table("{e}_RycCounters".format(e=ENV), "Counter_id")], latency=args.latency, item_write_limit=args.limit)
+    dynamo_client.set_client(fake)
+
+    print("{t} threads for {s}s, {l} writes/s per item, {d}ms per DynamoDB call".format(
+        t=args.threads, s=args.seconds, l=args.limit, d=args.latency * 1000
+    ))
+    print("{n:<12} {w:>12} {f:>10} {t:>10} {s:>7} {c}".format(n="counter", w="increments", f="failed", t="throttles", s="shards", c="total"))
+    run("single item", fake, args.threads, args.seconds, 1)
+    run("sharded", fake, args.threads, args.seconds, 64)
+
+if __name__ == '__main__':
+    main()
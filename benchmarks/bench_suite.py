@@ -0,0 +1,282 @@
+"""
+Benchmark suite for the DynamoDB paths, run against the in-memory DynamoDB stand-in so no AWS account is needed
+
+Each benchmark is run for at least --min-time seconds, and the mean, median and 95th percentile time of an operation
+are reported along with the DynamoDB calls and items read per operation.  --latency adds a delay to every DynamoDB
+call, to see how the paths behave once the network is counted.  The results are written as JSON, by default to
+benchmarks/results/<commit>.json, and --compare reads an earlier file and reports the change in each median.  The
+script exits with a non-zero status if any median is more than --tolerance slower than in the earlier file.
+
+Usage: python benchmarks/bench_suite.py [--sizes N [N ...]] [--latency MS] [--min-time S] [--only NAME [NAME ...]]
+                                        [--output PATH] [--compare PATH] [--tolerance F]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_ROOT)
+
+# the links are read from DynamoDB each time rather than from any of the caches in front of it
+os.environ.update({
+    "environment_name": "bench",
+    "link_cache_ttl": "0",
+    "link_id_table": "off",
+    "search_index": "off",
+    "click_analytics": "off",
+    "hot_links": "off",
+    "link_filter_file": "",
+    "ddb_metrics": "off"
+})
+
+logging.disable(logging.CRITICAL)
+
+import dynamo_client
+from fake_dynamodb import FakeDynamoDB, Table
+from LinkIdTable import LinkById
+from LinkObject import Link
+
+ENV = "bench"
+LINKS_TABLE = "UrlShortenerLinks_{e}".format(e=ENV)
+
+def make_fake(latency):
+    return FakeDynamoDB([
+        Table(LINKS_TABLE, "User_id", "Link_id", indexes={
+            "UrlLinkIdIndex": {"hash": "Link_id"},
+            "UserCreationDateIndex": {"hash": "User_id", "range": "dt_CreationDate"}
+        }),
+        Table("UrlShortenerLinkIds_{e}".format(e=ENV), "Link_id"),
+        Table("{e}_RycCounters".format(e=ENV), "Counter_id")
+    ], latency=latency)
+
+def make_links(count, userid="user"):
+    """
+    Links with the fields a created link has, all owned by one user
+    """
+    start = datetime(2020, 1, 1, 12, 0, 0, 123456)
+    return [Link(
+        id=userid,
+        linkid="l{n:07d}".format(n=n),
+        url="https://example.com/some/path/{n}?utm_source=news".format(n=n),
+        creation_date=start + timedelta(seconds=n),
+        modified_date=start + timedelta(seconds=n, microseconds=n % 1000)
+    ) for n in range(count)]
+
+def measure(f, min_time, min_runs=5):
+    """
+    Runs f until min_time has passed and it has run min_runs times, returning the time of each run in seconds
+    """
+    times = []
+    deadline = time.perf_counter() + min_time
+    n = 0
+    while n < min_runs or time.perf_counter() < deadline:
+        start = time.perf_counter()
+        f(n)
+        times.append(time.perf_counter() - start)
+        n += 1
+    return times
+
+def summarise(times, fake=None, per_run=1):
+    """
+    Turns run times into the figures reported for a benchmark, per operation where a run does per_run of them
+    """
+    times = sorted(t / per_run for t in times)
+    result = {
+        "runs": len(times),
+        "mean_us": sum(times) / len(times) * 1e6,
+        "p50_us": times[len(times) // 2] * 1e6,
+        "p95_us": times[min(len(times) - 1, int(len(times) * 0.95))] * 1e6
+    }
+    if fake is not None:
+        operations = len(times) * per_run
+        result["ddb_calls"] = sum(fake.calls.values()) / float(operations)
+        result["items_read"] = fake.items_read / float(operations)
+    return result
+
+def bench_codec(args):
+    """
+    Encoding a link into an item and decoding it back, without DynamoDB
+    """
+    links = make_links(1000)
+    items = [link._dh_prepare_item() for link in links]
+    results = {}
+    results["codec.prepare_item"] = summarise(measure(lambda n: [link._dh_prepare_item() for link in links], args.min_time), per_run=len(links))
+    results["codec.prepare_field"] = summarise(measure(
+        lambda n: [link._dh_prepare_field(field_name="s_Url", field_value=link.url) for link in links], args.min_time
+    ), per_run=len(links))
+    results["codec.flatten_item"] = summarise(measure(lambda n: [Link._dh_flatten_item(item) for item in items], args.min_time), per_run=len(links))
+    return results
+
+def bench_get_link_by_id(args):
+    """
+    Looking links up on their ID through the index, as the redirects do
+    """
+    results = {}
+    for size in args.sizes:
+        fake = make_fake(args.latency)
+        fake.load(LINKS_TABLE, [link._dh_prepare_item() for link in make_links(size)])
+        dynamo_client.set_client(fake)
+        fake.reset_counters()
+        times = measure(lambda n: Link.get_link_by_id(env=ENV, linkid="l{n:07d}".format(n=n * 7919 % size)), args.min_time)
+        results["get_link_by_id.{s}".format(s=size)] = summarise(times, fake)
+    return results
+
+def bench_get_links_for_user(args):
+    """
+    Reading all of a user's links, a page of DEFAULT_ITEM_LIMIT at a time
+    """
+    results = {}
+    for size in args.sizes:
+        fake = make_fake(args.latency)
+        fake.load(LINKS_TABLE, [link._dh_prepare_item() for link in make_links(size)])
+        dynamo_client.set_client(fake)
+        fake.reset_counters()
+        times = measure(lambda n: Link.get_links_for_user(env=ENV, userid="user"), args.min_time, min_runs=3)
+        results["get_links_for_user.{s}".format(s=size)] = summarise(times, fake)
+    return results
+
+def bench_create_link(args):
+    """
+    Creating links, with the uniqueness check on the link ID
+    """
+    fake = make_fake(args.latency)
+    dynamo_client.set_client(fake)
+    times = measure(lambda n: Link.create_link(env=ENV, userid="user", linkid="c{n:07d}".format(n=n), url="https://example.com/{n}".format(n=n)), args.min_time)
+    return {"create_link": summarise(times, fake)}
+
+def bench_update_link(args):
+    """
+    Updating and then deleting links owned by the user, each one conditional write
+    """
+    links = make_links(10000)
+    fake = make_fake(args.latency)
+    fake.load(LINKS_TABLE, [link._dh_prepare_item() for link in links])
+    dynamo_client.set_client(fake)
+    results = {}
+    fake.reset_counters()
+    times = measure(lambda n: Link(id="user", linkid=links[n % len(links)].linkid).update_record(
+        env=ENV,
+        bump_version=True,
+        modified_date=datetime.utcnow(),
+        url="https://example.com/updated/{n}".format(n=n)
+    ), args.min_time)
+    results["update_link"] = summarise(times, fake)
+    # each link can only be deleted once, so a fixed number are deleted rather than running for min_time
+    fake.reset_counters()
+    times = []
+    for link in links[:2000]:
+        start = time.perf_counter()
+        Link(id="user", linkid=link.linkid).delete_record(env=ENV)
+        times.append(time.perf_counter() - start)
+    results["delete_link"] = summarise(times, fake)
+    return results
+
+def bench_resolve(args):
+    """
+    Resolving 100 link IDs at once, with a query each and with BatchGetItem on the link ID table
+    """
+    links = make_links(10000)
+    fake = make_fake(args.latency)
+    fake.load(LINKS_TABLE, [link._dh_prepare_item() for link in links])
+    fake.load("UrlShortenerLinkIds_{e}".format(e=ENV), [
+        LinkById(**{k: v for (k, v) in link.__dict__.items() if k != "_dh_modified_fields"})._dh_prepare_item() for link in links
+    ])
+    dynamo_client.set_client(fake)
+    results = {}
+    for mode in ["off", "on"]:
+        os.environ["link_id_table"] = mode
+        fake.reset_counters()
+        times = measure(lambda n: Link.get_redirects_by_ids(env=ENV, linkids=["l{n:07d}".format(n=(n * 100 + i) % 10000) for i in range(100)]), args.min_time)
+        results["resolve_100.{m}".format(m="batch_get" if mode == "on" else "query")] = summarise(times, fake)
+    os.environ["link_id_table"] = "off"
+    return results
+
+BENCHMARKS = [
+    ("codec", bench_codec),
+    ("get_link_by_id", bench_get_link_by_id),
+    ("get_links_for_user", bench_get_links_for_user),
+    ("create_link", bench_create_link),
+    ("update_link", bench_update_link),
+    ("resolve", bench_resolve)
+]
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results, earlier, tolerance):
+    """
+    Prints the change in each median against an earlier run, returns the names of the benchmarks which got slower
+    """
+    slower = []
+    print("")
+    print("compared with {c}".format(c=earlier.get("commit")))
+    for (name, result) in sorted(results.items()):
+        before = earlier["results"].get(name)
+        if before is None:
+            print("{n:<32} new".format(n=name))
+            continue
+        change = result["p50_us"] / before["p50_us"] - 1
+        flag = ""
+        if change > tolerance:
+            slower.append(name)
+            flag = "  SLOWER"
+        print("{n:<32} {b:12.2f}us -> {a:12.2f}us {c:+7.1%}{f}".format(n=name, b=before["p50_us"], a=result["p50_us"], c=change, f=flag))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the DynamoDB benchmark suite against the in-memory stand-in")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="links in the table")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every DynamoDB call")
+    parser.add_argument("--min-time", type=float, default=1.0, help="seconds each benchmark runs for")
+    parser.add_argument("--only", nargs="+", choices=[name for (name, f) in BENCHMARKS])
+    parser.add_argument("--output", help="where the results are written")
+    parser.add_argument("--compare", help="results from an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown in a median allowed by --compare")
+    args = parser.parse_args()
+    args.latency = args.latency / 1000.0
+
+    commit = current_commit()
+    results = {}
+    for (name, f) in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        for (benchmark, result) in sorted(f(args).items()):
+            print("{n:<32} {m:12.2f}us mean {p:12.2f}us p50 {q:12.2f}us p95 {c:>6} calls".format(
+                n=benchmark,
+                m=result["mean_us"],
+                p=result["p50_us"],
+                q=result["p95_us"],
+                c="{c:.1f}".format(c=result["ddb_calls"]) if "ddb_calls" in result else "-"
+            ))
+            results[benchmark] = result
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "{c}.json".format(c=commit))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "time": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "latency_ms": args.latency * 1000,
+            "results": results
+        }, f, indent=4, sort_keys=True)
+    print("Results written to {o}".format(o=output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        if compare(results, earlier, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,580 @@
+"""
+In-memory stand-in for the DynamoDB client, used to benchmark DynamoHandler without an AWS account
+
+Only the parts of the API DynamoHandler uses are implemented, and only the expression forms it generates are
+understood.  Every call is counted along with the number of items each one reads, as a proxy for capacity used.
+"""
+import functools
+import json
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+
+class ConditionalCheckFailedException(Exception):
+    pass
+
+class ValidationException(Exception):
+    pass
+
+class ProvisionedThroughputExceededException(Exception):
+    pass
+
+class TransactionCanceledException(Exception):
+    def __init__(self, reasons):
+        Exception.__init__(self, "Transaction cancelled")
+        # the same shape botocore gives the error response
+        self.response = {"CancellationReasons": [{"Code": reason} for reason in reasons]}
+
+class _Exceptions(object):
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+    ValidationException = ValidationException
+    TransactionCanceledException = TransactionCanceledException
+    ProvisionedThroughputExceededException = ProvisionedThroughputExceededException
+
+_CONDITION = re.compile(r"^\s*(?P<name>[#\w]+)\s*(?P<op><>|<=|>=|=|<|>)\s*(?P<value>:\w+)\s*$")
+
+_COMPARISONS = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b
+}
+_FUNCTION = re.compile(r"^\s*(?P<function>\w+)\((?P<args>[^)]*)\)\s*$")
+_UPDATE_SECTION = re.compile(r"\b(SET|ADD|REMOVE)\b", re.IGNORECASE)
+
+def _number(attribute):
+    value = attribute["N"]
+    return int(value) if value.lstrip("-").isdigit() else float(value)
+
+def _split_top_level(expression):
+    """
+    Splits on commas which are not inside brackets
+    """
+    parts, depth, current = [], 0, ""
+    for c in expression:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        if c == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += c
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def _sort_value(attribute):
+    """
+    Gets a python value which sorts the same way dynamo sorts the attribute
+    """
+    if "N" in attribute:
+        return float(attribute["N"])
+    return attribute.get("S", "")
+
+_WRITES = set(["put_item", "update_item", "delete_item", "batch_write_item", "transact_write_items"])
+
+def _consumed_capacity(name, kwargs, result):
+    """
+    Estimates the capacity a call would consume, a read unit per two items read (one if consistent), a write unit
+    per item written and double for transactions, ignoring item sizes
+    """
+    if name == "batch_write_item":
+        units = sum(len(requests) for requests in kwargs["RequestItems"].values())
+    elif name == "transact_write_items":
+        units = 2.0 * len(kwargs["TransactItems"])
+    elif name in _WRITES:
+        units = 1.0
+    else:
+        if "Count" in result:
+            items = result.get("ScannedCount", result["Count"])
+        elif "Responses" in result:
+            items = sum(len(found) for found in result["Responses"].values())
+        else:
+            items = 1
+        units = max(items, 1) * (1.0 if kwargs.get("ConsistentRead") else 0.5)
+    if "TableName" in kwargs:
+        return {"TableName": kwargs["TableName"], "CapacityUnits": units}
+    return [{"TableName": ",".join(sorted(kwargs.get("RequestItems", {}))), "CapacityUnits": units}]
+
+def _operation(f):
+    """
+    Counts a call and waits for the configured latency, then runs it under the lock
+
+    The wait happens outside the lock so calls from different threads overlap like real ones do.  Like DynamoDB the
+    consumed capacity is only returned when ReturnConsumedCapacity asks for it.
+    """
+    @functools.wraps(f)
+    def operation(self, *args, **kwargs):
+        with self._lock:
+            self.calls[f.__name__] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            result = f(self, *args, **kwargs)
+        if kwargs.get("ReturnConsumedCapacity", "NONE") != "NONE" and isinstance(result, dict):
+            result = dict(result, ConsumedCapacity=_consumed_capacity(f.__name__, kwargs, result))
+        return result
+    return operation
+
+def _value_key(value):
+    """
+    Gets a hashable form of an attribute value
+    """
+    return json.dumps(value, sort_keys=True)
+
+class _Items(dict):
+    """
+    A table's items, which also keeps them grouped on each attribute they are queried by, so a query only looks at
+    its own partition like it does in DynamoDB
+    """
+    def __init__(self, attributes):
+        dict.__init__(self)
+        self.partitions = {attribute: {} for attribute in attributes}
+
+    def __setitem__(self, key, item):
+        if key in self:
+            self._unindex(key, dict.__getitem__(self, key))
+        dict.__setitem__(self, key, item)
+        for (attribute, partitions) in self.partitions.items():
+            if attribute in item:
+                partitions.setdefault(_value_key(item[attribute]), {})[key] = item
+
+    def __delitem__(self, key):
+        self._unindex(key, dict.__getitem__(self, key))
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._unindex(key, dict.__getitem__(self, key))
+        return dict.pop(self, key, *default)
+
+    def clear(self):
+        dict.clear(self)
+        for partitions in self.partitions.values():
+            partitions.clear()
+
+    def _unindex(self, key, item):
+        for (attribute, partitions) in self.partitions.items():
+            if attribute in item:
+                value = _value_key(item[attribute])
+                partition = partitions.get(value, {})
+                partition.pop(key, None)
+                if not partition:
+                    partitions.pop(value, None)
+
+    def partition(self, attribute, value):
+        """
+        Gets the items whose attribute has the value
+        """
+        return list(self.partitions[attribute].get(_value_key(value), {}).values())
+
+class Table(object):
+    """
+    A table and its indexes
+
+    hash_key/range_key = the names of the primary key attributes
+    indexes = dict of index name to a dict with hash, optional range and optional projection (list of attributes)
+    """
+    def __init__(self, name, hash_key, range_key=None, indexes=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes or {}
+        self.items = _Items(set([hash_key] + [index["hash"] for index in self.indexes.values()]))
+        # bumped on every write so cached query results can be thrown away
+        self.version = 0
+
+    def key_of(self, item):
+        """
+        Gets the dict key for an item or key
+        """
+        key = (item[self.hash_key]["S" if "S" in item[self.hash_key] else "N"],)
+        if self.range_key:
+            key += (item[self.range_key]["S" if "S" in item[self.range_key] else "N"],)
+        return key
+
+    def key_attributes(self, item):
+        """
+        Gets just the primary key attributes of an item
+        """
+        keys = [self.hash_key] + ([self.range_key] if self.range_key else [])
+        return {k: item[k] for k in keys}
+
+class FakeDynamoDB(object):
+    """
+    Stand-in for boto3.client("dynamodb"), pass it to dynamo_client.set_client
+    """
+    exceptions = _Exceptions
+
+    def __init__(self, tables, latency=0, item_write_limit=None):
+        """
+        Constructor, tables is a list of Table and latency is the seconds each call should take
+
+        item_write_limit = most writes a second any one item takes before writes to it are throttled, like a hot
+                           partition, None for no limit
+        """
+        self.tables = {t.name: t for t in tables}
+        self.latency = latency
+        self.item_write_limit = item_write_limit
+        self.calls = Counter()
+        self.items_read = 0
+        self.throttled = 0
+        self._item_writes = {}
+        self._query_cache = {}
+        # calls from several threads must not interleave their read-modify-write
+        self._lock = threading.RLock()
+
+
+    def reset_counters(self):
+        self.calls = Counter()
+        self.items_read = 0
+        self.throttled = 0
+
+    def load(self, table_name, items):
+        """
+        Puts items straight into a table without counting them, for setting up data
+        """
+        table = self.tables[table_name]
+        for item in items:
+            table.items[table.key_of(item)] = item
+        table.version += 1
+
+    # helpers
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise ValidationException("Requested resource not found: {n}".format(n=name))
+        return self.tables[name]
+
+    def _check_write_limit(self, table, key):
+        """
+        Throttles a write if the item has already taken item_write_limit writes in the last second
+        """
+        if not self.item_write_limit:
+            return
+        now = time.monotonic()
+        writes = self._item_writes.setdefault((table.name, key), deque())
+        while writes and writes[0] <= now - 1:
+            writes.popleft()
+        if len(writes) >= self.item_write_limit:
+            self.throttled += 1
+            raise ProvisionedThroughputExceededException("The level of configured provisioned throughput for the table was exceeded")
+        writes.append(now)
+
+    @staticmethod
+    def _name(name, params):
+        return params.get("ExpressionAttributeNames", {}).get(name, name)
+
+    def _matches(self, item, expression, params):
+        """
+        Evaluates a condition or filter expression made of clauses joined by AND, and groups of those joined by OR
+        """
+        if not expression:
+            return True
+        return any(self._matches_all(item, group, params) for group in expression.split(" OR "))
+
+    def _matches_all(self, item, expression, params):
+        """
+        Evaluates clauses joined by AND
+        """
+        values = params.get("ExpressionAttributeValues", {})
+        for clause in expression.split(" AND "):
+            condition = _CONDITION.match(clause)
+            function = _FUNCTION.match(clause)
+            if condition:
+                name = self._name(condition.group("name"), params)
+                value = values[condition.group("value")]
+                if condition.group("op") in ["=", "<>"]:
+                    if not _COMPARISONS[condition.group("op")](item.get(name), value):
+                        return False
+                elif name not in item or not _COMPARISONS[condition.group("op")](_sort_value(item[name]), _sort_value(value)):
+                    return False
+            elif function:
+                args = [a.strip() for a in function.group("args").split(",")]
+                name = self._name(args[0], params)
+                if function.group("function") == "attribute_not_exists":
+                    if name in item:
+                        return False
+                elif function.group("function") == "attribute_exists":
+                    if name not in item:
+                        return False
+                elif function.group("function") == "contains":
+                    needle = values[args[1]]["S"]
+                    if name not in item or needle not in item[name].get("S", ""):
+                        return False
+                else:
+                    raise ValidationException("Unsupported function {f}".format(f=function.group("function")))
+            else:
+                raise ValidationException("Unsupported expression {e}".format(e=clause))
+        return True
+
+    # item operations
+
+    @_operation
+    def put_item(self, TableName, Item, ConditionExpression=None, **kwargs):
+        table = self._table(TableName)
+        key = table.key_of(Item)
+        self._check_write_limit(table, key)
+        existing = table.items.get(key, {})
+        if ConditionExpression and not self._matches(existing, ConditionExpression, kwargs):
+            raise ConditionalCheckFailedException("The conditional request failed")
+        table.items[key] = Item
+        table.version += 1
+        return {}
+
+    @_operation
+    def get_item(self, TableName, Key, ConsistentRead=False, ProjectionExpression=None, **kwargs):
+        table = self._table(TableName)
+        item = table.items.get(table.key_of(Key))
+        if item is None:
+            return {}
+        self.items_read += 1
+        if ProjectionExpression:
+            names = [self._name(n.strip(), kwargs) for n in ProjectionExpression.split(",")]
+            return {"Item": {n: item[n] for n in names if n in item}}
+        return {"Item": item}
+
+    @_operation
+    def delete_item(self, TableName, Key, ConditionExpression=None, ReturnValues="NONE", **kwargs):
+        table = self._table(TableName)
+        key = table.key_of(Key)
+        self._check_write_limit(table, key)
+        old = table.items.get(key)
+        if ConditionExpression and not self._matches(old or {}, ConditionExpression, kwargs):
+            raise ConditionalCheckFailedException("The conditional request failed")
+        table.items.pop(key, None)
+        table.version += 1
+        if ReturnValues == "ALL_OLD" and old:
+            return {"Attributes": old}
+        return {}
+
+    @_operation
+    def update_item(self, TableName, Key, UpdateExpression=None, AttributeUpdates=None, ConditionExpression=None, ReturnValues="NONE", **kwargs):
+        table = self._table(TableName)
+        key = table.key_of(Key)
+        self._check_write_limit(table, key)
+        old = table.items.get(key)
+        if ConditionExpression and not self._matches(old or {}, ConditionExpression, kwargs):
+            raise ConditionalCheckFailedException("The conditional request failed")
+        item = dict(old or Key)
+        updated = set()
+        if AttributeUpdates:
+            for (name, update) in AttributeUpdates.items():
+                if update.get("Action", "PUT") == "DELETE":
+                    item.pop(name, None)
+                else:
+                    item[name] = update["Value"]
+                updated.add(name)
+        if UpdateExpression:
+            updated.update(self._apply_update(item, UpdateExpression, kwargs))
+        table.items[key] = item
+        table.version += 1
+        if ReturnValues == "ALL_NEW":
+            return {"Attributes": item}
+        if ReturnValues == "UPDATED_NEW":
+            return {"Attributes": {k: item[k] for k in updated if k in item}}
+        if ReturnValues == "ALL_OLD" and old:
+            return {"Attributes": old}
+        if ReturnValues == "UPDATED_OLD" and old:
+            return {"Attributes": {k: old[k] for k in updated if k in old}}
+        return {}
+
+    def _operand(self, item, operand, params):
+        """
+        Evaluates a value, attribute name or if_not_exists in an update expression
+        """
+        operand = operand.strip()
+        values = params.get("ExpressionAttributeValues", {})
+        if operand.startswith(":"):
+            return values[operand]
+        function = _FUNCTION.match(operand)
+        if function and function.group("function") == "if_not_exists":
+            name, default = [a.strip() for a in function.group("args").split(",")]
+            name = self._name(name, params)
+            return item[name] if name in item else self._operand(item, default, params)
+        name = self._name(operand, params)
+        if name not in item:
+            raise ValidationException("The provided expression refers to an attribute that does not exist in the item")
+        return item[name]
+
+    def _apply_update(self, item, expression, params):
+        """
+        Applies the SET, ADD and REMOVE clauses of an update expression, returning the names changed
+        """
+        updated = set()
+        sections = _UPDATE_SECTION.split(expression)
+        for (action, body) in zip(sections[1::2], sections[2::2]):
+            for clause in _split_top_level(body):
+                if action.upper() == "SET":
+                    target, value = clause.split("=", 1)
+                    name = self._name(target.strip(), params)
+                    for op in ["+", "-"]:
+                        parts = _split_top_level(value.replace(op, ",", 1)) if op in value else None
+                        if parts and len(parts) == 2:
+                            left, right = [_number(self._operand(item, p, params)) for p in parts]
+                            item[name] = {"N": str(left + right if op == "+" else left - right)}
+                            break
+                    else:
+                        item[name] = self._operand(item, value, params)
+                elif action.upper() == "ADD":
+                    target, value = clause.split(None, 1)
+                    name = self._name(target, params)
+                    amount = _number(self._operand(item, value, params))
+                    current = _number(item[name]) if name in item else 0
+                    item[name] = {"N": str(current + amount)}
+                else:
+                    name = self._name(clause, params)
+                    item.pop(name, None)
+                updated.add(name)
+        return updated
+
+    @_operation
+    def batch_write_item(self, RequestItems, **kwargs):
+        for (table_name, requests) in RequestItems.items():
+            if len(requests) > 25:
+                raise ValidationException("Too many items in the batch")
+            table = self._table(table_name)
+            for request in requests:
+                if "PutRequest" in request:
+                    item = request["PutRequest"]["Item"]
+                    table.items[table.key_of(item)] = item
+                else:
+                    table.items.pop(table.key_of(request["DeleteRequest"]["Key"]), None)
+            table.version += 1
+        return {"UnprocessedItems": {}}
+
+    @_operation
+    def transact_write_items(self, TransactItems, **kwargs):
+        if len(TransactItems) > 25:
+            raise ValidationException("Too many items in the transaction")
+        # check every condition before anything is written, so the transaction is all or nothing
+        reasons = []
+        for operation in TransactItems:
+            (action, params), = operation.items()
+            table = self._table(params["TableName"])
+            key = table.key_of(params["Item"] if action == "Put" else params["Key"])
+            condition = params.get("ConditionExpression")
+            if condition and not self._matches(table.items.get(key, {}), condition, params):
+                reasons.append("ConditionalCheckFailed")
+            else:
+                reasons.append("None")
+        if any(reason != "None" for reason in reasons):
+            raise TransactionCanceledException(reasons)
+        for operation in TransactItems:
+            (action, params), = operation.items()
+            table = self._table(params["TableName"])
+            if action == "Put":
+                table.items[table.key_of(params["Item"])] = params["Item"]
+            elif action == "Delete":
+                table.items.pop(table.key_of(params["Key"]), None)
+            elif action == "Update":
+                key = table.key_of(params["Key"])
+                item = dict(table.items.get(key) or params["Key"])
+                self._apply_update(item, params["UpdateExpression"], params)
+                table.items[key] = item
+            table.version += 1
+        return {}
+
+    # reads
+
+    @_operation
+    def batch_get_item(self, RequestItems, **kwargs):
+        if sum(len(request["Keys"]) for request in RequestItems.values()) > 100:
+            raise ValidationException("Too many items requested for the BatchGetItem call")
+        responses = {}
+        for (table_name, request) in RequestItems.items():
+            table = self._table(table_name)
+            found = [table.items[table.key_of(key)] for key in request["Keys"] if table.key_of(key) in table.items]
+            self.items_read += len(found)
+            responses[table_name] = found
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    @_operation
+    def scan(self, TableName, Limit=None, ExclusiveStartKey=None, FilterExpression=None, Segment=0, TotalSegments=1, **kwargs):
+        table = self._table(TableName)
+        cache_key = ("scan", TableName, Segment, TotalSegments)
+        cached = self._query_cache.get(cache_key)
+        if cached is None or cached[0] != table.version:
+            # items are spread over the segments by a hash of their key, like dynamo spreads them over partitions
+            candidates = sorted(
+                (item for item in table.items.values()
+                 if zlib.crc32(json.dumps(table.key_of(item)).encode("utf-8")) % TotalSegments == Segment),
+                key=table.key_of
+            )
+            positions = {table.key_of(item): i for (i, item) in enumerate(candidates)}
+            cached = (table.version, candidates, positions)
+            self._query_cache[cache_key] = cached
+        version, candidates, positions = cached
+        return self._page(table, candidates, positions, Limit, ExclusiveStartKey, FilterExpression, kwargs, None, [])
+
+
+    @_operation
+    def query(self, TableName, KeyConditionExpression, Limit=None, ExclusiveStartKey=None, IndexName=None, ScanIndexForward=True, FilterExpression=None, **kwargs):
+        table = self._table(TableName)
+        hash_key, range_key, projection = table.hash_key, table.range_key, None
+        if IndexName:
+            index = table.indexes[IndexName]
+            hash_key, range_key, projection = index["hash"], index.get("range"), index.get("projection")
+        # sorting the whole table for every page would make paging quadratic, so results are kept until a write
+        cache_key = (TableName, IndexName, KeyConditionExpression, ScanIndexForward, json.dumps(kwargs.get("ExpressionAttributeValues"), sort_keys=True))
+        cached = self._query_cache.get(cache_key)
+        if cached is None or cached[0] != table.version:
+            # only the items in the partition are looked at, the full expression is evaluated for each of them
+            hash_value = None
+            for clause in KeyConditionExpression.split(" AND "):
+                condition = _CONDITION.match(clause)
+                if condition and condition.group("op") == "=" and self._name(condition.group("name"), kwargs) == hash_key:
+                    hash_value = kwargs["ExpressionAttributeValues"][condition.group("value")]
+            candidates = [
+                item for item in table.items.partition(hash_key, hash_value)
+                if (not range_key or range_key in item) and self._matches(item, KeyConditionExpression, kwargs)
+            ]
+            candidates.sort(
+                key=lambda i: (_sort_value(i[range_key]) if range_key else "", table.key_of(i)),
+                reverse=not ScanIndexForward
+            )
+            positions = {table.key_of(item): i for (i, item) in enumerate(candidates)}
+            cached = (table.version, candidates, positions)
+            if len(self._query_cache) >= 10000:
+                # lookups of many different keys would otherwise keep growing it
+                self._query_cache.clear()
+            self._query_cache[cache_key] = cached
+        version, candidates, positions = cached
+        return self._page(table, candidates, positions, Limit, ExclusiveStartKey, FilterExpression, kwargs, projection, [hash_key, range_key])
+
+    def _page(self, table, candidates, positions, limit, start_key, filter_expression, params, projection, extra_keys):
+        """
+        Cuts a page out of the ordered candidates, the way query and scan page their results
+        """
+        start = 0
+        if start_key:
+            start = positions.get(table.key_of(start_key), -1) + 1
+        evaluated = candidates[start:start + limit] if limit else candidates[start:]
+        self.items_read += len(evaluated)
+        response = {
+            "Items": [
+                self._project(table, item, projection, extra_keys)
+                for item in evaluated if self._matches(item, filter_expression, params)
+            ]
+        }
+        response["Count"] = len(response["Items"])
+        response["ScannedCount"] = len(evaluated)
+        if limit and start + limit < len(candidates):
+            last = evaluated[-1]
+            last_key = table.key_attributes(last)
+            last_key.update({k: last[k] for k in extra_keys if k})
+            response["LastEvaluatedKey"] = last_key
+        return response
+
+    @staticmethod
+    def _project(table, item, projection, extra_keys):
+        if projection is None:
+            return item
+        keep = set(projection) | set(k for k in extra_keys if k) | set(table.key_attributes(item).keys())
+        return {k: v for (k, v) in item.items() if k in keep}
@@ -0,0 +1,132 @@
+"""
+Generates synthetic API Gateway proxy events for the load test, one JSON event per line
+
+Redirects are spread over the links with a Zipf distribution, so a few links get most of the clicks the way real
+traffic does, which is what the link cache and the hot link snapshot depend on.  --missing of the redirects are for
+link IDs which do not exist.  The rest of the events are API actions from the links' owners, in the proportions given
+by --mix.  The links themselves are not in the file, load_test.py creates the same --links links before replaying it.
+
+Usage: python benchmarks/generate_events.py [--events N] [--links N] [--users N] [--skew S] [--missing F]
+                                            [--mix ACTION=WEIGHT,...] [--env ENV] [--seed N] [--output PATH]
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+
+DEFAULT_MIX = "redirect=90,list=5,add=3,update=2"
+
+def link_id(n):
+    """
+    Gets the ID of the nth link, the most popular link is 0
+    """
+    return "l{n:07d}".format(n=n)
+
+def missing_link_id(n):
+    return "m{n:07d}".format(n=n)
+
+def owner_of(n, users):
+    """
+    Gets the user who owns the nth link
+    """
+    return "user{u}".format(u=n % users)
+
+def link_url(n):
+    return "https://example.com/articles/{n}?utm_source=short".format(n=n)
+
+def redirect_event(env, linkid):
+    return {
+        "resource": "/{proxy+}",
+        "path": "/{l}".format(l=linkid),
+        "httpMethod": "GET",
+        "headers": {"Accept": "text/html", "User-Agent": "Mozilla/5.0 (X11; Linux x86_64)"},
+        "queryStringParameters": None,
+        "pathParameters": {"proxy": linkid},
+        "stageVariables": {"env": env},
+        "requestContext": {"stage": "api", "identity": {"sourceIp": "192.0.2.1"}},
+        "body": None,
+        "isBase64Encoded": False
+    }
+
+def api_event(env, user, body):
+    return {
+        "resource": "/",
+        "path": "/",
+        "httpMethod": "POST",
+        "headers": {"Content-Type": "application/json", "User-Agent": "Mozilla/5.0 (X11; Linux x86_64)"},
+        "queryStringParameters": None,
+        "pathParameters": None,
+        "stageVariables": {"env": env},
+        "requestContext": {
+            "stage": "api",
+            "identity": {"sourceIp": "192.0.2.1"},
+            "authorizer": {"claims": {"cognito:username": user}}
+        },
+        "body": json.dumps(body),
+        "isBase64Encoded": False
+    }
+
+def parse_mix(value):
+    """
+    Parses action=weight pairs separated by commas
+    """
+    mix = []
+    for pair in value.split(","):
+        action, sep, weight = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError("Expecting action=weight, got '{p}'".format(p=pair))
+        mix.append((action.strip(), float(weight)))
+    return mix
+
+def generate(count, links, users, skew, missing, mix, env, seed):
+    """
+    Generator of count events
+    """
+    rnd = random.Random(seed)
+    popularity = list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(links)))
+    actions = [action for (action, weight) in mix]
+    action_weights = list(itertools.accumulate(weight for (action, weight) in mix))
+    for n in range(count):
+        action = rnd.choices(actions, cum_weights=action_weights)[0]
+        if action == "redirect":
+            if rnd.random() < missing:
+                yield redirect_event(env, missing_link_id(rnd.randrange(links)))
+            else:
+                yield redirect_event(env, link_id(rnd.choices(range(links), cum_weights=popularity)[0]))
+        elif action == "list":
+            yield api_event(env, owner_of(rnd.randrange(users), users), {"action": "list"})
+        elif action == "add":
+            yield api_event(env, owner_of(rnd.randrange(users), users), {"action": "add", "url": link_url(links + n)})
+        elif action in ["update", "delete"]:
+            target = rnd.randrange(links)
+            body = {"action": action, "linkid": link_id(target)}
+            if action == "update":
+                body["url"] = link_url(target) + "&v={n}".format(n=n)
+            yield api_event(env, owner_of(target, users), body)
+        else:
+            raise ValueError("Unknown action '{a}'".format(a=action))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates API Gateway events for the load test")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of link popularity")
+    parser.add_argument("--missing", type=float, default=0.01, help="share of redirects to links which do not exist")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="weights of redirect, list, add, update and delete")
+    parser.add_argument("--env", default="load")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="-")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for event in generate(args.events, args.links, args.users, args.skew, args.missing, args.mix, args.env, args.seed):
+            out.write(json.dumps(event) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == '__main__':
+    main()
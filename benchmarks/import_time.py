@@ -0,0 +1,81 @@
+"""
+Startup benchmark which reports the module initialisation cost of each Lambda entry point
+
+Each entry point is imported in a fresh interpreter with python -X importtime, the best of several runs is reported
+along with the most expensive modules.  The script exits with a non-zero status if an entry point goes over the budget
+(in microseconds) configured in import_budget.json.
+
+Usage: python benchmarks/import_time.py [--runs N] [--top N] [--budget FILE]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+ENTRY_POINTS = {
+    "redirect": "import redirect_function",
+    "api": "import lambda_function"
+}
+
+def measure(statement):
+    """
+    Runs statement in a fresh interpreter and returns the total import time along with the cost of each module
+    imported directly by a top level module
+    """
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+    env.setdefault("environment_name", "bench")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError("'{s}' failed:\n{e}".format(s=statement, e=proc.stderr))
+    total = 0
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative_us)
+            modules["{m} (self)".format(m=name.strip())] = int(self_us)
+        elif depth == 1:
+            modules[name.strip()] = int(cumulative_us)
+    return total, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports import time per Lambda entry point")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json"))
+    args = parser.parse_args()
+    with open(args.budget) as f:
+        budget = json.load(f)
+    over_budget = []
+    for name, statement in ENTRY_POINTS.items():
+        runs = [measure(statement) for i in range(args.runs)]
+        total, best = min(runs, key=lambda r: r[0])
+        limit = budget.get(name)
+        status = "ok"
+        if limit is not None and total > limit:
+            status = "OVER BUDGET"
+            over_budget.append(name)
+        print("{n}: {t} us (budget {b} us) {s}".format(n=name, t=total, b=limit, s=status))
+        for module, cost in sorted(best.items(), key=lambda m: m[1], reverse=True)[:args.top]:
+            print("    {c:>10} us  {m}".format(c=cost, m=module))
+    if over_budget:
+        print("Entry points over budget: {n}".format(n=", ".join(over_budget)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Load test which replays API Gateway proxy events through the Lambda handler in-process
+
+The events are read from a file with one JSON event per line, as written by generate_events.py or captured from API
+Gateway, and fed to the Flask app's lambda_handler (or with --entry redirect to redirect_function.redirect_handler,
+which serves redirects itself) from --workers threads at once.  DynamoDB is the in-memory stand-in, seeded with the
+--links links generate_events.py refers to, and --latency adds a delay to every DynamoDB call.  The threads share one
+interpreter, so with no latency the run mostly measures CPU, while latency shows how the handlers overlap waiting
+on DynamoDB.
+
+Throughput is reported along with the p50, p95 and p99 latency of each route and action, then the DynamoDB calls
+made per event and the counters of the link cache.  The features under test are set through the usual environment
+variables, e.g. link_cache_ttl=0 or link_id_table=on, and --json writes the report to a file.
+
+Usage: python benchmarks/load_test.py EVENTS [--entry api|redirect] [--workers N] [--links N] [--users N]
+                                             [--latency MS] [--warmup N] [--json PATH]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from generate_events import link_id, link_url, owner_of
+
+def make_fake(env, latency):
+    from fake_dynamodb import FakeDynamoDB, Table
+    return FakeDynamoDB([
+        Table("UrlShortenerLinks_{e}".format(e=env), "User_id", "Link_id", indexes={
+            "UrlLinkIdIndex": {"hash": "Link_id", "projection": ["s_Url"]},
+            "LinkIdRedirectIndex": {"hash": "Link_id", "projection": ["s_Url", "n_RedirectStatus", "n_CacheTtl", "n_Version", "ttl_ExpiresAt"]},
+            "UserCreationDateIndex": {"hash": "User_id", "range": "dt_CreationDate"}
+        }),
+        Table("UrlShortenerLinkSearch_{e}".format(e=env), "Token_id", "Link_id"),
+        Table("UrlShortenerLinkIds_{e}".format(e=env), "Link_id"),
+        Table("UrlShortenerLinkStats_{e}".format(e=env), "Link_id", "Bucket_id"),
+        Table("UrlShortenerLinkChanges_{e}".format(e=env), "Day_id", "Change_id"),
+        Table("{e}_RycCounters".format(e=env), "Counter_id")
+    ], latency=latency)
+
+def seed_links(fake, env, links, users):
+    """
+    Puts the links the events refer to straight into the tables
+    """
+    from LinkIdTable import LinkById, link_id_table_mode
+    from LinkObject import Link
+    start = datetime(2020, 1, 1)
+    items = []
+    by_id = []
+    for n in range(links):
+        fields = {
+            "id": owner_of(n, users),
+            "linkid": link_id(n),
+            "url": link_url(n),
+            "creation_date": start + timedelta(seconds=n),
+            "modified_date": start + timedelta(seconds=n)
+        }
+        items.append(Link(**fields)._dh_prepare_item())
+        if link_id_table_mode() != "off":
+            by_id.append(LinkById(**fields)._dh_prepare_item())
+    fake.load("UrlShortenerLinks_{e}".format(e=env), items)
+    fake.load("UrlShortenerLinkIds_{e}".format(e=env), by_id)
+
+def route_of(event):
+    """
+    Gets the route and action an event is reported under
+    """
+    method = event.get("httpMethod")
+    path = event.get("path") or "/"
+    if method == "GET" and path != "/" and "/" not in path[1:] and path != "/_triggerlogin":
+        return "redirect"
+    if method == "POST" and path == "/":
+        try:
+            return "api {a}".format(a=json.loads(event.get("body") or "{}").get("action"))
+        except (ValueError, AttributeError):
+            return "api"
+    return "{m} {p}".format(m=method, p=path)
+
+def percentile(ordered, p):
+    """
+    Nearest rank percentile of a sorted list
+    """
+    return ordered[max(0, min(len(ordered) - 1, int(math.ceil(p / 100.0 * len(ordered))) - 1))]
+
+def replay(handler, events, workers):
+    """
+    Sends the events through the handler from several threads, returning the route, status and seconds of each
+    """
+    results = []
+    position = [0]
+    lock = threading.Lock()
+
+    def work():
+        done = []
+        while True:
+            with lock:
+                n = position[0]
+                position[0] += 1
+            if n >= len(events):
+                break
+            event = events[n]
+            start = time.perf_counter()
+            try:
+                status = handler(event, None).get("statusCode", 0)
+            except Exception:
+                status = "exception"
+            done.append((route_of(event), status, time.perf_counter() - start))
+        with lock:
+            results.extend(done)
+
+    threads = [threading.Thread(target=work, name="load-{n}".format(n=n)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def report(results, elapsed):
+    """
+    Summarises the results per route
+    """
+    by_route = defaultdict(list)
+    statuses = defaultdict(Counter)
+    for (route, status, seconds) in results:
+        by_route[route].append(seconds)
+        statuses[route][status] += 1
+    routes = {}
+    for (route, times) in sorted(by_route.items()):
+        times.sort()
+        routes[route] = {
+            "count": len(times),
+            "per_second": len(times) / elapsed,
+            "p50_ms": percentile(times, 50) * 1000,
+            "p95_ms": percentile(times, 95) * 1000,
+            "p99_ms": percentile(times, 99) * 1000,
+            "max_ms": times[-1] * 1000,
+            "statuses": {str(s): c for (s, c) in statuses[route].items()}
+        }
+    return {
+        "events": len(results),
+        "seconds": elapsed,
+        "per_second": len(results) / elapsed,
+        "routes": routes
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays API Gateway events through the Lambda handler")
+    parser.add_argument("events", help="file of API Gateway events, one JSON event per line")
+    parser.add_argument("--entry", choices=["api", "redirect"], default="api", help="handler the events are sent to")
+    parser.add_argument("--workers", type=int, default=8, help="events handled at once")
+    parser.add_argument("--links", type=int, default=10000, help="links to create, as given to generate_events.py")
+    parser.add_argument("--users", type=int, default=100, help="users owning them, as given to generate_events.py")
+    parser.add_argument("--env", default="load")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every DynamoDB call")
+    parser.add_argument("--warmup", type=int, default=0, help="events sent first and left out of the report")
+    parser.add_argument("--json", help="where to write the report")
+    args = parser.parse_args()
+
+    os.environ["environment_name"] = args.env
+    # the request metrics assume one request at a time, as in lambda
+    os.environ.setdefault("ddb_metrics", "off")
+    logging.disable(logging.CRITICAL)
+
+    import dynamo_client
+    fake = make_fake(args.env, args.latency / 1000.0)
+    seed_links(fake, args.env, args.links, args.users)
+    dynamo_client.set_client(fake)
+
+    if args.entry == "redirect":
+        from redirect_function import redirect_handler as handler
+    else:
+        from lambda_function import lambda_handler as handler
+    from LinkObject import Link
+
+    with open(args.events) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if args.warmup:
+        replay(handler, events[:args.warmup], args.workers)
+        events = events[args.warmup:]
+    fake.reset_counters()
+
+    start = time.perf_counter()
+    results = replay(handler, events, args.workers)
+    summary = report(results, time.perf_counter() - start)
+    summary.update({
+        "workers": args.workers,
+        "entry": args.entry,
+        "latency_ms": args.latency,
+        "ddb_calls": dict(fake.calls),
+        "ddb_calls_per_event": sum(fake.calls.values()) / float(max(len(results), 1)),
+        "link_cache": Link.get_cache_stats()
+    })
+
+    print("{n} events in {s:.2f}s from {w} workers, {r:.0f} events/s".format(n=summary["events"], s=summary["seconds"], w=args.workers, r=summary["per_second"]))
+    print("{r:<16} {c:>8} {t:>9} {p50:>9} {p95:>9} {p99:>9} {m:>9}  statuses".format(
+        r="route", c="events", t="per sec", p50="p50 ms", p95="p95 ms", p99="p99 ms", m="max ms"
+    ))
+    for (route, figures) in sorted(summary["routes"].items()):
+        print("{r:<16} {c:>8} {t:>9.0f} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {m:>9.2f}  {s}".format(
+            r=route,
+            c=figures["count"],
+            t=figures["per_second"],
+            p50=figures["p50_ms"],
+            p95=figures["p95_ms"],
+            p99=figures["p99_ms"],
+            m=figures["max_ms"],
+            s=" ".join("{k}:{v}".format(k=k, v=v) for (k, v) in sorted(figures["statuses"].items()))
+        ))
+    print("DynamoDB calls per event {c:.2f}, {d}".format(
+        c=summary["ddb_calls_per_event"],
+        d=", ".join("{k} {v}".format(k=k, v=v) for (k, v) in sorted(fake.calls.items()))
+    ))
+    print("link cache {s}".format(s=summary["link_cache"]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=4, sort_keys=True, default=str)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Module to count clicks in memory and write them to the database in batches, off the redirect path
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+def minute_of(timestamp):
+    """
+    Gets the UTC minute a unix timestamp falls in, as used for the click histograms
+    """
+    return time.strftime("%Y-%m-%dT%H:%M", time.gmtime(timestamp))
+
+class ClickAggregator(object):
+    """
+    Adds up clicks per link per minute in memory until they are due to be written
+
+    Clicks are written by the first request which ends once the oldest one has waited flush_interval seconds or
+    max_links different links and minutes have been clicked.  Lambda freezes a container between requests, so clicks
+    wait for the next request however long it takes, and are lost if the container is recycled first.  Clicks which
+    fail to be written are dropped and counted.
+    """
+    def __init__(self, write, flush_interval=10, max_links=100, background=True, clock=time.time):
+        """
+        Constructor
+
+        write = function taking a dict of (env, linkid) to a dict of minute to clicks, returning how many clicks it
+                could not write
+        background = write on a separate thread so the request which triggers it does not wait, only for hosts which
+                     keep running between requests as Lambda would freeze the thread part way through the write
+        """
+        self._write = write
+        self.flush_interval = flush_interval
+        self.max_links = max_links
+        self.background = background
+        self._clock = clock
+        self._pending = Counter()
+        self._oldest = None
+        self._lock = threading.Lock()
+        # only one flush runs at a time, a flush which finds one running leaves the clicks for the next
+        self._flushing = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def record(self, env, linkid):
+        """
+        Counts a click on a link, this never touches the database
+        """
+        now = self._clock()
+        with self._lock:
+            self._pending[(env, linkid, minute_of(now))] += 1
+            self.recorded += 1
+            if self._oldest is None:
+                self._oldest = now
+
+    def due(self):
+        """
+        Returns True if the pending clicks have reached either threshold
+        """
+        with self._lock:
+            if self._oldest is None:
+                return False
+            return len(self._pending) >= self.max_links or self._clock() - self._oldest >= self.flush_interval
+
+    def flush_if_due(self):
+        """
+        Writes the pending clicks if they are due, intended to be called once a response has been built
+        """
+        if not self.due():
+            return
+        if self.background:
+            threading.Thread(target=self.flush, name="click-flush", daemon=True).start()
+        else:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all the pending clicks now, with one update per link per minute
+        """
+        if not self._flushing.acquire(False):
+            return
+        try:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._oldest = None
+            if not pending:
+                return
+            deltas = {}
+            for ((env, linkid, minute), clicks) in pending.items():
+                deltas.setdefault((env, linkid), {})[minute] = clicks
+            total = sum(pending.values())
+            try:
+                failed = self._write(deltas)
+            except Exception as err:
+                logger.error("Could not write clicks: {e}".format(e=err))
+                failed = total
+            with self._lock:
+                self.flushes += 1
+                self.written += total - failed
+                self.dropped += failed
+            if failed:
+                logger.warning("Dropped {n} clicks which could not be written".format(n=failed))
+        finally:
+            self._flushing.release()
+
+    def stats(self):
+        """
+        Returns the aggregator's counters
+        """
+        with self._lock:
+            return {
+                "pending": sum(self._pending.values()),
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "flushes": self.flushes
+            }
+
+def analytics_enabled():
+    """
+    Returns True if clicks should be counted
+    """
+    return os.environ.get("click_analytics", "off").lower() == "on"
+
+def aggregator_from_environment(write):
+    """
+    Creates a ClickAggregator using the thresholds configured in the environment
+    """
+    return ClickAggregator(
+        write=write,
+        flush_interval=float(os.environ.get("click_flush_interval", 10)),
+        max_links=int(os.environ.get("click_flush_max_links", 100)),
+        background=os.environ.get("click_flush_background", "false").lower() == "true"
+    )
@@ -0,0 +1,250 @@
+"""
+Module to measure the DynamoDB calls each request makes and write a summary of them as a CloudWatch embedded metric
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "UrlShortener"
+
+READ_OPERATIONS = set(["get_item", "query", "scan", "batch_get_item", "transact_get_items"])
+WRITE_OPERATIONS = set(["put_item", "update_item", "delete_item", "batch_write_item", "transact_write_items"])
+
+# the metrics in each summary, with their units
+_METRICS = [
+    ("RequestTime", "Milliseconds"),
+    ("DynamoDBCalls", "Count"),
+    ("DynamoDBTime", "Milliseconds"),
+    ("DynamoDBItems", "Count"),
+    ("ReadCapacityUnits", "Count"),
+    ("WriteCapacityUnits", "Count"),
+    ("DynamoDBErrors", "Count"),
+    ("LinkCacheHits", "Count"),
+    ("LinkCacheMisses", "Count"),
+    ("HotLinkHits", "Count"),
+    ("HotLinkMisses", "Count")
+]
+
+def metrics_enabled():
+    """
+    Returns True if DynamoDB calls should be measured
+    """
+    return os.environ.get("ddb_metrics", "on").lower() == "on"
+
+def _tables(operation, params):
+    """
+    Gets the table and index a call is made against, calls across tables list them all
+    """
+    if "TableName" in params:
+        return params["TableName"], params.get("IndexName")
+    if "RequestItems" in params:
+        return ",".join(sorted(params["RequestItems"])), None
+    if "TransactItems" in params:
+        return ",".join(sorted(set(
+            action["TableName"] for item in params["TransactItems"] for action in item.values()
+        ))), None
+    return None, None
+
+def _items(response):
+    """
+    Gets how many items a call returned
+    """
+    if "Count" in response:
+        return response["Count"]
+    if "Item" in response:
+        return 1
+    if "Responses" in response:
+        responses = response["Responses"]
+        if isinstance(responses, dict):
+            return sum(len(items) for items in responses.values())
+        return len(responses)
+    return 0
+
+def _capacity(response):
+    """
+    Gets the capacity units a call consumed, single table calls give a dict and the others a list
+    """
+    consumed = response.get("ConsumedCapacity")
+    if consumed is None:
+        return 0.0
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(c.get("CapacityUnits", 0.0) for c in consumed)
+
+class RequestMetrics(object):
+    """
+    The DynamoDB calls made while serving one request, added up per operation, table and index
+    """
+    def __init__(self, route, action=None, clock=time.perf_counter, counters=None):
+        """
+        Constructor
+
+        counters = function returning running totals named after metrics, the request's share of them is reported
+        """
+        self.route = route
+        self.action = action
+        self._clock = clock
+        self.started = clock()
+        self._counters = counters
+        self._counters_start = counters() if counters is not None else {}
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def add(self, operation, table, index, elapsed, items, capacity, error=False):
+        """
+        Adds one call, a query or scan call reads one page
+        """
+        key = (operation, table, index)
+        with self._lock:
+            totals = self._operations.get(key)
+            if totals is None:
+                totals = self._operations[key] = [0, 0.0, 0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] += items
+            totals[3] += capacity
+            totals[4] += error
+
+    def summary(self, status=None, env=None):
+        """
+        Builds the embedded metric format document for the request
+        """
+        operations = []
+        values = dict((name, 0) for (name, unit) in _METRICS)
+        with self._lock:
+            for ((operation, table, index), (calls, elapsed, items, capacity, errors)) in sorted(self._operations.items(), key=lambda entry: [part or "" for part in entry[0]]):
+                operations.append({
+                    "operation": operation,
+                    "table": table,
+                    "index": index,
+                    "calls": calls,
+                    "time_ms": round(elapsed * 1000, 3),
+                    "items": items,
+                    "capacity_units": capacity,
+                    "errors": errors
+                })
+                values["DynamoDBCalls"] += calls
+                values["DynamoDBTime"] += elapsed * 1000
+                values["DynamoDBItems"] += items
+                values["DynamoDBErrors"] += errors
+                if operation in READ_OPERATIONS:
+                    values["ReadCapacityUnits"] += capacity
+                else:
+                    values["WriteCapacityUnits"] += capacity
+        if self._counters is not None:
+            for (name, total) in self._counters().items():
+                values[name] = total - self._counters_start.get(name, 0)
+        values["RequestTime"] = (self._clock() - self.started) * 1000
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Environment", "Route", "Action"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for (name, unit) in _METRICS]
+                }]
+            },
+            "Environment": env or os.environ.get("environment_name", ""),
+            "Route": self.route,
+            "Action": self.action or "none",
+            "StatusCode": status,
+            "Operations": operations
+        }
+        document.update(values)
+        return document
+
+# the request being served by each thread, worker threads only count towards a request they are bound to
+_local = threading.local()
+
+def _current():
+    """
+    Gets the request the calling thread's calls belong to, None if it is not serving one
+    """
+    return getattr(_local, "metrics", None)
+
+def start_request(route, action=None, counters=None):
+    """
+    Starts measuring the calls for a request on the calling thread, counters is as for RequestMetrics
+    """
+    _local.metrics = RequestMetrics(route, action, counters=counters) if metrics_enabled() else None
+
+def set_action(action):
+    """
+    Sets the action of the request being measured, once it is known
+    """
+    metrics = _current()
+    if metrics is not None:
+        metrics.action = action
+
+def finish_request(status=None, out=None):
+    """
+    Stops measuring and writes the summary to stdout as one line, where CloudWatch picks it up from the logs
+    """
+    metrics, _local.metrics = _current(), None
+    if metrics is None:
+        return None
+    document = metrics.summary(status=status)
+    try:
+        (out or sys.stdout).write(json.dumps(document, separators=(",", ":")) + "\n")
+    except Exception as err:
+        logger.warning("Could not write request metrics: {e}".format(e=err))
+    return document
+
+def bind(function):
+    """
+    Wraps function so the calls it makes on a worker thread count towards the request being served when it is wrapped
+    """
+    metrics = _current()
+    def bound(*args, **kwargs):
+        previous = _current()
+        _local.metrics = metrics
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.metrics = previous
+    return bound
+
+def record_call(operation, method, params):
+    """
+    Makes a DynamoDB call, measuring it if a request is being measured
+    """
+    metrics = _current()
+    if metrics is None:
+        return method(**params)
+    if "ReturnConsumedCapacity" not in params:
+        params = dict(params, ReturnConsumedCapacity="TOTAL")
+    table, index = _tables(operation, params)
+    start = time.perf_counter()
+    try:
+        response = method(**params)
+    except Exception:
+        metrics.add(operation, table, index, time.perf_counter() - start, 0, 0.0, error=True)
+        raise
+    metrics.add(operation, table, index, time.perf_counter() - start, _items(response), _capacity(response))
+    return response
+
+class InstrumentedClient(object):
+    """
+    Wraps a DynamoDB client so every call is measured, anything other than a call is passed straight through
+    """
+    def __init__(self, client):
+        """
+        Constructor
+        """
+        self._client = client
+        self.exceptions = client.exceptions
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if name not in READ_OPERATIONS and name not in WRITE_OPERATIONS:
+            return method
+        def call(**params):
+            return record_call(name, method, params)
+        # kept so the wrapper is only made once per operation
+        setattr(self, name, call)
+        return call
@@ -0,0 +1,106 @@
+"""
+Module to manage the DynamoDB clients shared by the container
+"""
+import logging
+import os
+import threading
+
+from ddb_metrics import InstrumentedClient, metrics_enabled
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_injected_client = None
+_instrumented = {}
+_lock = threading.Lock()
+
+def _client_config():
+    """
+    Builds the botocore configuration from the environment
+    """
+    from botocore.config import Config
+    retries = {
+        "max_attempts": int(os.environ.get("ddb_max_attempts", 3))
+    }
+    if os.environ.get("ddb_retry_mode"):
+        # retry modes need botocore 1.15 or later
+        retries.update({
+            "mode": os.environ["ddb_retry_mode"]
+        })
+    return Config(
+        connect_timeout=float(os.environ.get("ddb_connect_timeout", 1)),
+        read_timeout=float(os.environ.get("ddb_read_timeout", 3)),
+        max_pool_connections=int(os.environ.get("ddb_max_pool_connections", 10)),
+        retries=retries
+    )
+
+def get_client(region=None, endpoint_url=None):
+    """
+    Gets the DynamoDB client for the region and endpoint, creating it the first time it is needed
+
+    The region defaults to the one boto3 resolves, the endpoint defaults to ddb_endpoint_url if it is set.  Unless
+    ddb_metrics is off the client is wrapped so its calls are counted in the request metrics.
+    """
+    client = _get_raw_client(region=region, endpoint_url=endpoint_url)
+    if not metrics_enabled():
+        return client
+    instrumented = _instrumented.get(id(client))
+    if instrumented is None or instrumented._client is not client:
+        instrumented = _instrumented[id(client)] = InstrumentedClient(client)
+    return instrumented
+
+def _get_raw_client(region=None, endpoint_url=None):
+    """
+    Gets the client without the metrics wrapper
+    """
+    if _injected_client is not None:
+        return _injected_client
+    if endpoint_url is None:
+        endpoint_url = os.environ.get("ddb_endpoint_url")
+    key = (region, endpoint_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        # another thread may have created it while we waited for the lock
+        client = _clients.get(key)
+        if client is None:
+            logger.info("Creating DynamoDB client", extra={"region": region, "endpoint_url": endpoint_url})
+            # boto3 is only imported once a client is actually needed
+            import boto3
+            # sessions are not thread safe, so each client gets its own
+            session = boto3.session.Session()
+            client = session.client(
+                "dynamodb",
+                region_name=region,
+                endpoint_url=endpoint_url,
+                config=_client_config()
+            )
+            _clients[key] = client
+    return client
+
+def prewarm(region=None, endpoint_url=None):
+    """
+    Creates the client ahead of the first request, intended to be called while the container initialises
+    """
+    try:
+        get_client(region=region, endpoint_url=endpoint_url)
+    except Exception as err:
+        # the first real call will try again and surface the error
+        logger.warning("Could not prewarm DynamoDB client: {e}".format(e=err))
+
+def set_client(client):
+    """
+    Injects a client which will be returned for every region and endpoint, pass None to remove it
+    """
+    global _injected_client
+    with _lock:
+        _injected_client = client
+
+def reset_clients():
+    """
+    Drops all the cached clients so they are created again on next use
+    """
+    with _lock:
+        _clients.clear()
+        _instrumented.clear()
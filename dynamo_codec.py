@@ -0,0 +1,190 @@
+"""
+Module to compile the field mappings of a DynamoHandler class into encoder and decoder functions
+
+The type of each attribute is worked out from its name once, when the class is created, rather than for every value.
+"""
+import calendar
+import re
+from datetime import datetime
+
+# the form datetime.isoformat gives a naive datetime, which is how DynamoHandler saves dates
+_ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{6})?$")
+
+# python 3.7 and later parse that form in C
+_fromisoformat = getattr(datetime, "fromisoformat", None)
+
+def parse_datetime(string):
+    """
+    Parses a saved date, only falling back to dateutil for strings DynamoHandler did not write
+    """
+    if _ISO_DATETIME.match(string):
+        if _fromisoformat is not None:
+            return _fromisoformat(string)
+        return datetime(
+            int(string[0:4]),
+            int(string[5:7]),
+            int(string[8:10]),
+            int(string[11:13]),
+            int(string[14:16]),
+            int(string[17:19]),
+            int(string[20:26]) if len(string) > 19 else 0
+        )
+    # only pay for dateutil when a date is in some other form
+    import dateutil.parser
+    return dateutil.parser.parse(string)
+
+def to_epoch(date):
+    """
+    Turns a date into whole seconds since the unix epoch, the form DynamoDB's time to live reads, naive dates are
+    taken to be UTC
+    """
+    return calendar.timegm(date.utctimetuple())
+
+def from_epoch(string):
+    """
+    Turns a saved number of seconds since the unix epoch back into a naive UTC date
+    """
+    return datetime.utcfromtimestamp(_parse_number(string))
+
+def _parse_number(string):
+    """
+    Parses a saved number as an int if it is one, otherwise as a float
+    """
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+def _wrap(value):
+    """
+    Wraps a value whose type is not given by its name, the same way as DynamoHandler._dh_wrap_field
+    """
+    if isinstance(value, str):
+        return {"S": value}
+    return {"N": str(value)}
+
+class Schema(object):
+    """
+    The compiled encoders and decoders for the attributes of one DynamoHandler class
+
+    encoders = dict of attribute name to a function turning a python value into a dynamo value
+    decoders = dict of attribute name to a tuple of the python name and a function turning a dynamo value back
+    """
+    def __init__(self, encoders, decoders):
+        """
+        Constructor
+        """
+        self.encoders = encoders
+        self.decoders = decoders
+
+class _NotCompilable(Exception):
+    pass
+
+def compile_schema(field_mapping, id_fields, sub_obj_mapping, general_decoder):
+    """
+    Builds the Schema for a class, attributes which cannot be compiled are left out so they use the general code
+
+    general_decoder = function taking an attribute name and dynamo value, used for key values which are not S or N
+    """
+    encoders = {}
+    decoders = {}
+    for (attribute, name) in field_mapping.items():
+        try:
+            encoders[attribute] = _compile_encoder(attribute, sub_obj_mapping)
+        except _NotCompilable:
+            pass
+        if attribute in id_fields:
+            decoders[attribute] = (name, _id_decoder(attribute, general_decoder))
+            continue
+        try:
+            decoders[attribute] = (name, _compile_decoder(attribute, sub_obj_mapping))
+        except _NotCompilable:
+            pass
+    return Schema(encoders, decoders)
+
+def _compile_encoder(attribute, sub_obj_mapping, parent_name=None):
+    """
+    Builds the encoder for one attribute, following the same rules as DynamoHandler._dh_prepare_field
+    """
+    parts = attribute.split("_")
+    field_type = parts[0].lower()
+    if field_type == "s":
+        return lambda value: {"S": value}
+    if field_type == "n":
+        return lambda value: {"N": str(value)}
+    if field_type == "dt":
+        return lambda value: {"S": value.isoformat()}
+    if field_type == "ttl":
+        return lambda value: {"N": str(to_epoch(value))}
+    if field_type == "l":
+        if len(parts) < 2:
+            raise _NotCompilable(attribute)
+        if parts[1].lower() == "m":
+            entry = _compile_encoder(attribute[2:], sub_obj_mapping, parent_name=attribute)
+        else:
+            entry = _compile_encoder(attribute[2:], sub_obj_mapping)
+        return lambda value: {"L": [entry(v) for v in value]}
+    if field_type == "m":
+        sub_name = parent_name or attribute
+        if sub_name not in sub_obj_mapping:
+            raise _NotCompilable(attribute)
+        fields = {
+            name: (sub_attribute, _compile_encoder(sub_attribute, sub_obj_mapping))
+            for (sub_attribute, name) in sub_obj_mapping[sub_name].items()
+        }
+        def encode_map(value):
+            encoded = {}
+            for (key, v) in value.items():
+                sub_attribute, encode = fields[key]
+                encoded[sub_attribute] = encode(v)
+            return {"M": encoded}
+        return encode_map
+    return _wrap
+
+def _compile_decoder(attribute, sub_obj_mapping, field_type=None):
+    """
+    Builds the decoder for one attribute, following the same rules as DynamoHandler._dh_flatten_single_item
+    """
+    parts = attribute.split("_")
+    field_type = field_type or parts[0].lower()
+    if field_type == "n":
+        return lambda value: _parse_number(value["N"])
+    if field_type == "s":
+        return lambda value: value["S"]
+    if field_type == "dt":
+        return lambda value: parse_datetime(value["S"])
+    if field_type == "ttl":
+        return lambda value: from_epoch(value["N"])
+    if field_type == "l":
+        if len(parts) < 2 or parts[1].lower() == "l":
+            raise _NotCompilable(attribute)
+        # the entries of a list of maps use the mapping of the list itself
+        entry = _compile_decoder(attribute, sub_obj_mapping, field_type=parts[1].lower())
+        return lambda value: [entry(v) for v in value["L"]]
+    if field_type == "m":
+        if attribute not in sub_obj_mapping:
+            raise _NotCompilable(attribute)
+        fields = {
+            sub_attribute: (name, _compile_decoder(sub_attribute, sub_obj_mapping))
+            for (sub_attribute, name) in sub_obj_mapping[attribute].items()
+        }
+        def decode_map(value):
+            decoded = {}
+            for (key, v) in value["M"].items():
+                name, decode = fields[key]
+                decoded[name] = decode(v)
+            return decoded
+        return decode_map
+    raise _NotCompilable(attribute)
+
+def _id_decoder(attribute, general_decoder):
+    """
+    Builds the decoder for a key attribute, which is read by its dynamo type rather than its name when it can be
+    """
+    def decode_id(value):
+        if "N" in value:
+            return int(value["N"])
+        if "S" in value:
+            return value["S"]
+        return general_decoder(attribute, value)
+    return decode_id
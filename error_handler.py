@@ -1,6 +1,7 @@
+import json
 from functools import wraps
-from flask import request, make_response, jsonify, g
-from LinkObject import LinkNotFoundException
+from LinkObject import LinkNotFoundException, MultipleRecordsFoundException
+from DynamoHandler import ConflictException, IntegrityException, InvalidCursorException
 
 class BadRequestException(Exception):
     """Class for BadRequestException"""
@@ -16,6 +17,7 @@ def exception_to_json_response(exception, code):
     """
     Turns an exception into a JSON payload to respond to a service call
     """
+    from flask import make_response, jsonify
     
     payload = {
         "error": type(exception).__name__,
@@ -30,6 +32,7 @@ def generic_exception_json_response(code):
     """
     Turns an unhandled exception into a JSON payload to respond to a service call
     """
+    from flask import make_response, jsonify
     
     payload = {
         "error": "TechnicalException",
@@ -40,6 +43,27 @@ def generic_exception_json_response(code):
     resp.headers["Content-type"] = "application/json"
     return resp
 
+def exception_to_proxy_response(exception, code):
+    """
+    Turns an exception into an API Gateway proxy response, for handlers which do not go through Flask
+    """
+    
+    payload = {
+        "error": type(exception).__name__,
+        "message": str(exception),
+        "code": code
+    }
+    # matches the body jsonify produces
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n"
+    return {
+        "statusCode": code,
+        "headers": {
+            "Content-type": "application/json",
+            "Content-Length": str(len(body))
+        },
+        "body": body
+    }
+
 def error_handler(f):
     """
     Function to manage errors coming back to webservice calls
@@ -55,10 +79,47 @@ def error_handler(f):
             return f(*args, **kwargs)
         except BadRequestException as err:
             return exception_to_json_response(err, 400)
+        except InvalidCursorException as err:
+            return exception_to_json_response(err, 400)
         except UnauthorisedException as err:
             return exception_to_json_response(err, 403)
         except LinkNotFoundException as err:
             return exception_to_json_response(err, 404)
+        except ConflictException as err:
+            return exception_to_json_response(err, 409)
+        except IntegrityException as err:
+            return exception_to_json_response(err, 409)
+        except MultipleRecordsFoundException as err:
+            return exception_to_json_response(err, 500)
         #except Exception as err:
         #    return generic_exception_json_response(500)
-    return error_decorator
\ No newline at end of file
+    return error_decorator
+
+def proxy_error_handler(f):
+    """
+    Function to manage errors coming back to lambda handlers which do not go through Flask
+    """
+
+    @wraps(f)
+    def error_decorator(*args, **kwargs):
+        """
+        Function to manage errors coming back to lambda handlers which do not go through Flask
+        """
+        
+        try:
+            return f(*args, **kwargs)
+        except BadRequestException as err:
+            return exception_to_proxy_response(err, 400)
+        except InvalidCursorException as err:
+            return exception_to_proxy_response(err, 400)
+        except UnauthorisedException as err:
+            return exception_to_proxy_response(err, 403)
+        except LinkNotFoundException as err:
+            return exception_to_proxy_response(err, 404)
+        except ConflictException as err:
+            return exception_to_proxy_response(err, 409)
+        except IntegrityException as err:
+            return exception_to_proxy_response(err, 409)
+        except MultipleRecordsFoundException as err:
+            return exception_to_proxy_response(err, 500)
+    return error_decorator
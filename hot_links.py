@@ -0,0 +1,259 @@
+"""
+Module providing a memory mapped snapshot of the most clicked links, so they redirect without a database read
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from redirect_policy import Redirect
+
+logger = logging.getLogger(__name__)
+
+# magic, length of the environment name, snapshot time in unix milliseconds, number of links
+_HEADER = struct.Struct(">4sHQI")
+_MAGIC = b"LHS2"
+# link IDs are padded with zero bytes to this width in the index, which keeps them in the same order
+KEY_WIDTH = 16
+# an index entry is a padded link ID and the offset of its record
+_ENTRY = struct.Struct(">{w}sI".format(w=KEY_WIDTH))
+# a record is the redirect status, cache TTL, version, expiry time or 0 and length of the url, followed by the url
+_RECORD = struct.Struct(">HIIIH")
+
+# changes logged this close before the last check are read again, in case they were logged late
+CHANGE_OVERLAP = 60
+
+def write_snapshot(path, env, stamp, redirects):
+    """
+    Writes a snapshot file
+
+    stamp = unix time the links were read from, changes logged from then on are applied to the snapshot
+    redirects = dict of link ID to Redirect
+    """
+    linkids = sorted(linkid for linkid in redirects if len(linkid.encode("utf-8")) <= KEY_WIDTH)
+    env_bytes = env.encode("utf-8")
+    index_start = _HEADER.size + len(env_bytes)
+    offset = index_start + _ENTRY.size * len(linkids)
+    index = []
+    records = []
+    for linkid in linkids:
+        redirect = redirects[linkid]
+        url = redirect.url.encode("utf-8")
+        index.append(_ENTRY.pack(linkid.encode("utf-8"), offset))
+        records.append(_RECORD.pack(redirect.status, redirect.cache_ttl, redirect.version, redirect.expires_at or 0, len(url)) + url)
+        offset += _RECORD.size + len(url)
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(env_bytes), int(stamp * 1000), len(linkids)))
+        f.write(env_bytes)
+        f.write(b"".join(index))
+        f.write(b"".join(records))
+    return len(linkids)
+
+class HotLinkSnapshot(object):
+    """
+    Read only view of a snapshot file, the links are found by binary search on the memory mapped index
+    """
+    def __init__(self, path):
+        """
+        Constructor, maps the file
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, env_length, stamp, count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError("{p} is not a hot link snapshot".format(p=path))
+        self.env = self._map[_HEADER.size:_HEADER.size + env_length].decode("utf-8")
+        self.stamp = stamp / 1000.0
+        self.count = count
+        self._index_start = _HEADER.size + env_length
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, linkid):
+        """
+        Gets the offset of a link's record, None if it is not in the snapshot
+        """
+        key = linkid.encode("utf-8")
+        if len(key) > KEY_WIDTH:
+            return None
+        key = key.ljust(KEY_WIDTH, b"\0")
+        data = self._map
+        start = self._index_start
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = start + middle * _ENTRY.size
+            found = data[position:position + KEY_WIDTH]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return _ENTRY.unpack_from(data, position)[1]
+        return None
+
+    def __contains__(self, linkid):
+        return self._find(linkid) is not None
+
+    def get(self, linkid):
+        """
+        Gets the Redirect for a link, None if it is not in the snapshot
+        """
+        offset = self._find(linkid)
+        if offset is None:
+            return None
+        status, cache_ttl, version, expires_at, url_length = _RECORD.unpack_from(self._map, offset)
+        start = offset + _RECORD.size
+        return Redirect(
+            url=self._map[start:start + url_length].decode("utf-8"),
+            status=status,
+            cache_ttl=cache_ttl,
+            version=version,
+            expires_at=expires_at or None
+        )
+
+    def close(self):
+        self._map.close()
+
+class HotLinks(object):
+    """
+    A snapshot plus the links changed since it was taken, which are not served from it
+
+    The change log is read every refresh_interval seconds on a background thread, so a link changed in another
+    container is served from the snapshot for at most that long, as with the link cache.  If the log has not been
+    read for max_staleness seconds the snapshot is not used at all until it has been.
+    """
+    def __init__(self, snapshot, changes_since, refresh_interval=5, max_staleness=30, background=True, clock=time.time):
+        """
+        Constructor
+
+        changes_since = function taking env and two unix times, returning the IDs of links changed between them
+        """
+        self.snapshot = snapshot
+        self._changes_since = changes_since
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.background = background
+        self._clock = clock
+        self._tombstones = set()
+        self._since = snapshot.stamp
+        self._refreshed = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.tombstoned = 0
+        self.bypassed = 0
+
+    def get(self, env, linkid):
+        """
+        Gets the Redirect for a link from the snapshot, None if it has to be looked up
+        """
+        if env != self.snapshot.env:
+            return None
+        now = self._clock()
+        if self._refreshed is None or now - self._refreshed >= self.max_staleness:
+            # the snapshot cannot be trusted until the change log has been read
+            self.refresh()
+            if self._refreshed is None or self._clock() - self._refreshed >= self.max_staleness:
+                self.bypassed += 1
+                return None
+        elif now - self._refreshed >= self.refresh_interval:
+            self.refresh_if_due()
+        if linkid in self._tombstones:
+            self.tombstoned += 1
+            return None
+        redirect = self.snapshot.get(linkid)
+        if redirect is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return redirect
+
+    def __contains__(self, linkid):
+        return linkid in self.snapshot
+
+    def tombstone(self, linkid):
+        """
+        Stops a link being served from the snapshot in this container, for links changed here
+        """
+        if linkid in self.snapshot:
+            with self._lock:
+                self._tombstones = self._tombstones | set([linkid])
+
+    def refresh_if_due(self):
+        """
+        Reads the change log if it is due, on another thread if background is set
+        """
+        if self._refreshed is not None and self._clock() - self._refreshed < self.refresh_interval:
+            return
+        if self.background:
+            threading.Thread(target=self.refresh, name="hot-links", daemon=True).start()
+        else:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Reads the links changed since the last read and tombstones the ones in the snapshot
+        """
+        if not self._refreshing.acquire(False):
+            return
+        try:
+            started = self._clock()
+            try:
+                changed = self._changes_since(self.snapshot.env, self._since, started)
+            except Exception as err:
+                logger.error("Could not read the link change log: {e}".format(e=err))
+                return
+            changed = set(linkid for linkid in changed if linkid in self.snapshot)
+            with self._lock:
+                # a new set rather than adding to the old one, so readers never see it change under them
+                self._tombstones = self._tombstones | changed
+                self._since = max(self.snapshot.stamp, started - CHANGE_OVERLAP)
+                self._refreshed = started
+        finally:
+            self._refreshing.release()
+
+    def stats(self):
+        """
+        Returns the snapshot's counters, the hit rate is the share of lookups served from it
+        """
+        lookups = self.hits + self.misses + self.tombstoned + self.bypassed
+        return {
+            "links": len(self.snapshot),
+            "stamp": self.snapshot.stamp,
+            "tombstones": len(self._tombstones),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tombstoned": self.tombstoned,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / float(lookups) if lookups else 0.0
+        }
+
+def hot_links_from_environment(changes_since, max_age=None):
+    """
+    Maps the hot link snapshot named in the environment, returns None if there is no snapshot
+
+    max_age = seconds after which a snapshot is not used, as the changes made since it was taken are no longer logged
+    """
+    path = os.environ.get("hot_links_file", os.path.join(os.path.dirname(os.path.abspath(__file__)), "hot_links.bin"))
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = HotLinkSnapshot(path)
+    except (IOError, ValueError, struct.error) as err:
+        logger.error("Could not load the hot link snapshot: {e}".format(e=err))
+        return None
+    if max_age is not None and time.time() - snapshot.stamp > max_age:
+        logger.error("Hot link snapshot from {s} is older than the change log, export a new one".format(s=snapshot.stamp))
+        snapshot.close()
+        return None
+    logger.info("Mapped hot link snapshot", extra={"links": len(snapshot), "stamp": snapshot.stamp})
+    return HotLinks(
+        snapshot,
+        changes_since=changes_since,
+        refresh_interval=float(os.environ.get("hot_links_refresh", 5))
+    )
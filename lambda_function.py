@@ -3,33 +3,109 @@ from flask_lambda import FlaskLambda
 from flask import request, jsonify, make_response, g
 from flask_cors import CORS
 from error_handler import error_handler, BadRequestException, UnauthorisedException
-from random_string_gen import get_rand_string
 from LinkObject import Link
-from datetime import datetime
+from LinkResultSet import LinkResultSet
+from DynamoHandler import IntegrityException
+from LinkSearchIndex import search_enabled, search_links
+from LinkStats import MAX_STATS_MINUTES, flush_clicks_if_due, get_link_stats, record_click
+from dynamo_client import prewarm
+from dynamo_codec import parse_datetime
+from ddb_metrics import finish_request, start_request
+from log_config import configure_logging, log_request, sample_request
+from redirect_policy import MAX_CACHE_TTL, REDIRECT_STATUSES, cache_headers
+from datetime import datetime, timezone
 import json
 import os
+import time
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s [%(levelname)s] (%(threadName)-10s) %(message)s')
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# most links a single bulk action can work on
+MAX_BULK_ITEMS = 1000
+# largest page which can be asked for in cursor mode
+MAX_PAGE_SIZE = 1000
+# times a new link is tried with a fresh ID when the ID turns out to be taken
+MAX_CREATE_ATTEMPTS = 3
 
 lambda_handler = FlaskLambda(__name__)
 CORS(lambda_handler)
 
+# create the dynamodb client while the container initialises rather than on the first request
+prewarm()
+
 def success_json_response(payload):
     """Turns payload into a JSON HTTP200 response"""
     response = make_response(jsonify(payload), 200)
     response.headers["Content-type"] = "application/json"
     return response
 
+def get_redirect_policy(body):
+    """Gets the redirect status and cache TTL given in a request, only the ones given are returned"""
+    policy = {}
+    if body.get("redirect_status") is not None:
+        if body["redirect_status"] not in REDIRECT_STATUSES:
+            raise BadRequestException("'redirect_status' must be one of {s}".format(s=", ".join(str(s) for s in REDIRECT_STATUSES)))
+        policy.update({"redirect_status": body["redirect_status"]})
+    if body.get("cache_ttl") is not None:
+        ttl = body["cache_ttl"]
+        if isinstance(ttl, bool) or not isinstance(ttl, int) or ttl < 0 or ttl > MAX_CACHE_TTL:
+            raise BadRequestException("'cache_ttl' must be a whole number of seconds between 0 and {n}".format(n=MAX_CACHE_TTL))
+        policy.update({"cache_ttl": ttl})
+    return policy
+
+def get_date(body, field):
+    """Gets a date given in a request as a naive UTC date, None if it was not given"""
+    if body.get(field) is None:
+        return None
+    if not isinstance(body[field], str):
+        raise BadRequestException("'{f}' must be a date in ISO 8601 form or as returned by 'list'".format(f=field))
+    try:
+        date = parse_datetime(body[field])
+    except (ValueError, OverflowError):
+        raise BadRequestException("'{f}' must be a date in ISO 8601 form or as returned by 'list'".format(f=field))
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+def get_expires_at(body):
+    """Gets when a new link should expire, None if it should not"""
+    expires_at = get_date(body, "expires_at")
+    if expires_at is not None and expires_at <= datetime.utcnow():
+        raise BadRequestException("'expires_at' must be in the future")
+    return expires_at
+
+def success_links_response(links, **fields):
+    """Turns a LinkResultSet and other fields into a JSON HTTP200 response, without making a dict per link"""
+    others = json.dumps(fields, sort_keys=True)
+    body = '{"links":' + links.to_json() + ("," + others[1:] if fields else "}")
+    response = make_response(body + "\n", 200)
+    response.headers["Content-type"] = "application/json"
+    return response
+
+@lambda_handler.before_request
+def start_metrics():
+    g.started = time.perf_counter()
+    body = request.get_json(silent=True) if request.method == "POST" else None
+    g.action = body.get("action") if isinstance(body, dict) and isinstance(body.get("action"), str) else None
+    start_request(
+        route = request.endpoint or "unknown",
+        action = g.action,
+        counters = Link.get_lookup_counters
+    )
+
 @lambda_handler.before_request
 def get_user_details():
     #g.username = "rjk"
     try:
         g.username = request.aws_event["requestContext"]["authorizer"]["claims"]["cognito:username"]
     except KeyError as err:
-        print("No username found")
+        logger.debug("No username found")
         g.username = None
     g.env = request.aws_event["stageVariables"]["env"]
-    print("Full request context {c}".format(c=json.dumps(request.aws_event)))
+    # the whole event is large, so it is only built for the requests which are sampled
+    if logger.isEnabledFor(logging.DEBUG) and sample_request():
+        logger.debug("Full request context %s", json.dumps(request.aws_event))
 
 @lambda_handler.route('/', methods=['GET'])
 def root():
@@ -40,12 +116,31 @@ def root():
 @lambda_handler.route('/<link_id>', methods=['GET'])
 @error_handler
 def redirect(link_id):
-    link = Link.get_link_by_id(
+    link_redirect = Link.get_redirect_by_id(
         env = os.environ.get('environment_name'),
         linkid = link_id
     )
-    response = make_response("", 301)
-    response.headers["Location"] = link.url
+    record_click(
+        env = os.environ.get('environment_name'),
+        linkid = link_id
+    )
+    # flask_lambda cannot send a 304 as werkzeug gives it no body, so revalidations always get the full redirect
+    response = make_response("", link_redirect.status)
+    response.headers["Location"] = link_redirect.url
+    response.headers.extend(cache_headers(link_id, link_redirect))
+    return response
+
+@lambda_handler.after_request
+def write_clicks(response):
+    # clicks are written before the function returns, as Lambda freezes the container until the next request
+    flush_clicks_if_due()
+    return response
+
+@lambda_handler.after_request
+def write_metrics(response):
+    # after_request functions run in reverse, so this runs before the clicks are flushed and they are not counted
+    finish_request(status = response.status_code)
+    log_request(request.method, request.path, response.status_code, time.perf_counter() - g.started, action = g.action)
     return response
 
 @lambda_handler.route('/', methods=['POST'])
@@ -58,20 +153,123 @@ def api():
     if "action" not in request.json:
         raise BadRequestException("Expecting 'action' field, but not found")
     action = request.json["action"]
-    if action not in ["list", "add", "update", "delete"]:
-        raise BadRequestException("Action must be one of 'list', 'add', 'update', 'delete'")
+    if action not in ["list", "add", "update", "delete", "bulk_add", "bulk_delete", "stats", "resolve"]:
+        raise BadRequestException("Action must be one of 'list', 'add', 'update', 'delete', 'bulk_add', 'bulk_delete', 'stats', 'resolve'")
     if action == "add":
         # add a URL to the table
         # check we have the mandatory fields
         if "url" not in request.json:
             raise BadRequestException("When action is 'add' the 'url' field must be present")
-        link = Link.create_link(
+        expires_at = get_expires_at(request.json)
+        for attempt in range(MAX_CREATE_ATTEMPTS):
+            try:
+                link = Link.create_link(
+                    env = os.environ.get('environment_name'),
+                    userid = g.username,
+                    linkid = Link.new_link_ids(env = os.environ.get('environment_name'))[0],
+                    url = request.json["url"],
+                    expires_at = expires_at,
+                    **get_redirect_policy(request.json)
+                )
+                break
+            except IntegrityException:
+                # the link ID table found the ID already in use, so try again with the next one
+                if attempt == MAX_CREATE_ATTEMPTS - 1:
+                    raise
+                logger.info("Link ID already in use, trying another")
+        return success_json_response(link.__dict__)
+    if action == "bulk_add":
+        # add many URLs to the table in one go
+        urls = request.json.get("urls")
+        if not isinstance(urls, list) or len(urls) == 0 or not all(isinstance(url, str) for url in urls):
+            raise BadRequestException("When action is 'bulk_add' the 'urls' field must be a non-empty list of URLs")
+        if len(urls) > MAX_BULK_ITEMS:
+            raise BadRequestException("No more than {n} links can be added at once".format(n=MAX_BULK_ITEMS))
+        results = Link.create_links(
             env = os.environ.get('environment_name'),
             userid = g.username,
-            linkid = get_rand_string(4),
-            url = request.json["url"]
+            links = [{"linkid": linkid, "url": url} for (linkid, url) in zip(
+                Link.new_link_ids(env = os.environ.get('environment_name'), count = len(urls)),
+                urls
+            )]
+        )
+        return success_json_response({
+            "results": results
+        })
+    if action == "bulk_delete":
+        # delete many of the user's URLs in one go
+        linkids = request.json.get("linkids")
+        if not isinstance(linkids, list) or len(linkids) == 0 or not all(isinstance(linkid, str) for linkid in linkids):
+            raise BadRequestException("When action is 'bulk_delete' the 'linkids' field must be a non-empty list of link IDs")
+        if len(linkids) > MAX_BULK_ITEMS:
+            raise BadRequestException("No more than {n} links can be deleted at once".format(n=MAX_BULK_ITEMS))
+        results = Link.delete_links(
+            env = os.environ.get('environment_name'),
+            userid = g.username,
+            linkids = linkids
+        )
+        return success_json_response({
+            "results": results
+        })
+    if action == "resolve":
+        # where many links redirect to, as a redirect would see them, whoever owns them
+        linkids = request.json.get("linkids")
+        if not isinstance(linkids, list) or len(linkids) == 0 or not all(isinstance(linkid, str) for linkid in linkids):
+            raise BadRequestException("When action is 'resolve' the 'linkids' field must be a non-empty list of link IDs")
+        if len(linkids) > MAX_BULK_ITEMS:
+            raise BadRequestException("No more than {n} links can be resolved at once".format(n=MAX_BULK_ITEMS))
+        found, missing = Link.get_redirects_by_ids(
+            env = os.environ.get('environment_name'),
+            linkids = linkids
+        )
+        return success_json_response({
+            "found": {linkid: {
+                "url": redirect.url,
+                "redirect_status": redirect.status,
+                "cache_ttl": redirect.cache_ttl,
+                "version": redirect.version
+            } for (linkid, redirect) in found.items()},
+            "missing": missing
+        })
+    if action == "stats":
+        # click counts for one of the user's links
+        if "linkid" not in request.json:
+            raise BadRequestException("When action is 'stats' the 'linkid' field must be present")
+        minutes = request.json.get("minutes", 60)
+        if isinstance(minutes, bool) or not isinstance(minutes, int) or minutes < 1 or minutes > MAX_STATS_MINUTES:
+            raise BadRequestException("'minutes' must be a whole number between 1 and {n}".format(n=MAX_STATS_MINUTES))
+        # only the owner can see the stats, this raises LinkNotFoundException for anyone else
+        Link.get_link_by_id(
+            env = os.environ.get('environment_name'),
+            linkid = request.json["linkid"],
+            id = g.username
+        )
+        return success_json_response(get_link_stats(
+            env = os.environ.get('environment_name'),
+            linkid = request.json["linkid"],
+            minutes = minutes
+        ))
+    if action == "list" and "cursor" in request.json:
+        # cursor mode, read just the page wanted straight from dynamo, newest first
+        if "page_size" not in request.json:
+            raise BadRequestException("When 'cursor' is specified, 'page_size' should also specified")
+        if "filter" in request.json:
+            raise BadRequestException("'filter' cannot be used with 'cursor', use 'page' instead")
+        page_size = request.json["page_size"]
+        if isinstance(page_size, bool) or not isinstance(page_size, int) or page_size < 1 or page_size > MAX_PAGE_SIZE:
+            raise BadRequestException("'page_size' must be an integer between 1 and {n}".format(n=MAX_PAGE_SIZE))
+        links, next_cursor = Link.get_links_page(
+            env = os.environ.get('environment_name'),
+            userid = g.username,
+            page_size = page_size,
+            cursor = request.json["cursor"]
+        )
+        return success_links_response(
+            links,
+            page_size = page_size,
+            next_cursor = next_cursor,
+            filtered = False
         )
-        return success_json_response(link.__dict__)
     if action == "list":
         # check if we have pagination instructions
         page = None
@@ -81,25 +279,31 @@ def api():
             if "page_size" not in request.json:
                 raise BadRequestException("When 'page' is specified, 'page_size' should also specified")
             page_size = request.json["page_size"]
-        # get list of links from DDB
-        links = Link.get_links_for_user(
-            env = os.environ.get('environment_name'),
-            userid = g.username
-        )
-        links.sort(key=lambda x: x.creation_date, reverse=True)
-        link_dicts = []
-        for link in links:
-            link_dicts = link_dicts + [link.__dict__]
-        total_length = len(link_dicts)
-        # we need to filter the list if we were asked to
+        links = None
         filtered = False
-        if "filter" in request.json:
-            if len(request.json["filter"]["url"]) > 0:
-                link_dicts = [l for l in link_dicts if request.json["filter"]["url"] in l["url"]]
-            if len(request.json["filter"]["linkid"]) > 0:
-                link_dicts = [l for l in link_dicts if request.json["filter"]["linkid"] in l["linkid"]]
-            total_length = len(link_dicts)
-            filtered = True
+        if "filter" in request.json and search_enabled():
+            # use the search index, this returns None if the filters are too short for it
+            matches = search_links(
+                env = os.environ.get('environment_name'),
+                userid = g.username,
+                url_filter = request.json["filter"]["url"],
+                linkid_filter = request.json["filter"]["linkid"]
+            )
+            if matches is not None:
+                links = LinkResultSet.from_dicts(matches, id = g.username)
+                filtered = True
+        if links is None:
+            # get list of links from DDB, held a column per field rather than an object per link
+            links = Link.get_link_results(
+                env = os.environ.get('environment_name'),
+                userid = g.username
+            ).sorted("creation_date", reverse=True)
+            # we need to filter the list if we were asked to
+            if "filter" in request.json:
+                links = links.filter_contains("url", request.json["filter"]["url"])
+                links = links.filter_contains("linkid", request.json["filter"]["linkid"])
+                filtered = True
+        total_length = len(links)
         # if we are in pagination mode, need to get and return only the page wanted
         if page is not None:
             start_index = int(page) * int(page_size)
@@ -108,45 +312,47 @@ def api():
             end_index = start_index + int(page_size)
             if end_index > total_length:
                 end_index = total_length
-            # now return slice of the array
-            return success_json_response({
-                "links": link_dicts[start_index:end_index],
-                "total_number": total_length,
-                "page": page,
-                "filtered": filtered
-            })
+            # now return slice of the results
+            return success_links_response(
+                links[start_index:end_index],
+                total_number = total_length,
+                page = page,
+                filtered = filtered
+            )
         else:
-            return success_json_response({
-                "links": link_dicts,
-                "total_number": total_length,
-                "filtered": filtered
-            })
+            return success_links_response(
+                links,
+                total_number = total_length,
+                filtered = filtered
+            )
     if action == "update":
-        # change existing URL, assuming the current user is the owner
+        # change existing URL or redirect policy, assuming the current user is the owner
         # check we have the mandatory fields
-        if "url" not in request.json or "linkid" not in request.json:
-            raise BadRequestException("When action is 'update' the 'url' and 'linkid' fields must be present")
-        link = Link.get_link_by_id(
-            env = os.environ.get('environment_name'),
-            linkid = request.json["linkid"],
-            id = g.username
-        )
+        policy = get_redirect_policy(request.json)
+        if "linkid" not in request.json or ("url" not in request.json and not policy):
+            raise BadRequestException("When action is 'update' the 'linkid' field and 'url', 'redirect_status' or 'cache_ttl' must be present")
+        if "url" in request.json:
+            policy.update({"url": request.json["url"]})
+        # the user is part of the key, so only their own link can be updated
+        link = Link(id = g.username, linkid = request.json["linkid"])
+        # a new version makes caches holding the old redirect fetch it again
         link.update_record(
             env = os.environ.get('environment_name'),
-            url = request.json["url"],
-            modified_date = datetime.utcnow()
+            bump_version = True,
+            expected_modified = get_date(request.json, "modified_date"),
+            modified_date = datetime.utcnow(),
+            **policy
         )
         return success_json_response(link.__dict__)
     if action == "delete":
         # delete existing URL, assuming the current user is the owner
         if "linkid" not in request.json:
             raise BadRequestException("When action is 'delete' the 'linkid' field must be present")
-        link = Link.get_link_by_id(
+        link = Link(id = g.username, linkid = request.json["linkid"])
+        link.delete_record(
             env = os.environ.get('environment_name'),
-            linkid = request.json["linkid"],
-            id = g.username
+            expected_modified = get_date(request.json, "modified_date")
         )
-        link.delete_record(env = os.environ.get('environment_name'))
         return success_json_response({
             "status": "deleted"
         })
@@ -0,0 +1,109 @@
+"""
+Module providing an in-process cache for resolved links
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class LinkCache(object):
+    """
+    Bounded TTL/LRU cache which lives for the lifetime of the container
+
+    Found links are kept for ttl seconds, links which were not found are kept for negative_ttl seconds.
+    When the cache is full the least recently used entry is evicted.
+    """
+    NOT_FOUND = object()
+
+    def __init__(self, max_size=1024, ttl=60, negative_ttl=10, clock=time.monotonic):
+        """
+        Constructor
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key, NOT_FOUND for a cached miss or None if nothing is cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires = entry
+            if expires <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Caches value for key, pass NOT_FOUND to cache a missing link
+        """
+        if self.max_size <= 0:
+            return
+        ttl = self.negative_ttl if value is LinkCache.NOT_FOUND else self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Removes key from the cache if it is present
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Empties the cache, the counters are kept
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters so the cache can be sized
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+def cache_from_environment():
+    """
+    Creates a LinkCache using the sizes configured in the environment
+    """
+    cache = LinkCache(
+        max_size=int(os.environ.get("link_cache_size", 1024)),
+        ttl=float(os.environ.get("link_cache_ttl", 60)),
+        negative_ttl=float(os.environ.get("link_cache_negative_ttl", 10))
+    )
+    logger.info("Created link cache", extra={"max_size": cache.max_size, "ttl": cache.ttl, "negative_ttl": cache.negative_ttl})
+    return cache
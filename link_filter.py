@@ -0,0 +1,200 @@
+"""
+Module providing a Bloom filter of the link IDs which exist, so IDs which do not can be turned away without a read
+"""
+import hashlib
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# magic, hash count, bit count, links added, counter watermark, headroom, build time
+_HEADER = struct.Struct(">4sIQQQQd")
+_MAGIC = b"LBF1"
+
+class BloomFilter(object):
+    """
+    Set of strings which can say an item is definitely not in it, or that it probably is
+
+    The k bit positions for an item come from one 128 bit blake2b hash split in two and combined as h1 + i * h2.
+    """
+    def __init__(self, bits, hashes, data=None):
+        """
+        Constructor, data is the bit array from a saved filter
+        """
+        self.bits = bits
+        self.hashes = hashes
+        self._data = data if data is not None else bytearray((bits + 7) // 8)
+        self.count = 0
+
+    @staticmethod
+    def for_capacity(capacity, error_rate):
+        """
+        Static method which creates a filter sized to hold capacity items with a false positive rate of error_rate
+        """
+        capacity = max(capacity, 1)
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, int(round(bits / float(capacity) * math.log(2))))
+        return BloomFilter(bits, hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, item):
+        """
+        Adds an item to the filter
+        """
+        data = self._data
+        for position in self._positions(item):
+            data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        data = self._data
+        return all(data[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def size(self):
+        """
+        Gets the size of the bit array in bytes
+        """
+        return len(self._data)
+
+    def expected_error_rate(self):
+        """
+        Gets the false positive rate expected for the number of items added
+        """
+        return (1 - math.exp(-self.hashes * self.count / float(self.bits))) ** self.hashes
+
+class LinkFilter(object):
+    """
+    Says whether a link ID might exist, from a Bloom filter built from a scan and the counter watermark of the scan
+
+    The builder waits for every block leased up to the watermark to expire before it scans, so IDs from values at or
+    below it are all in the filter if they exist.  IDs from later values were allocated after the build and are
+    looked up if they are within headroom of the watermark.  Made up IDs mostly decode to values far beyond that,
+    those are only looked up if a read of the counter, at most every refresh_interval seconds, shows the counter
+    has got that far.  Once the headroom is used up a link clicked within refresh_interval of being created can be
+    turned away, so the filter should be rebuilt before then.
+    """
+    def __init__(self, bloom, watermark, headroom, built_at, counter_value, current_counter=None, refresh_interval=1):
+        """
+        Constructor
+
+        counter_value = function turning a link ID back into the counter value it was allocated from, or None
+        current_counter = function taking env which reads the counter's latest value
+        """
+        self.bloom = bloom
+        self.watermark = watermark
+        self.headroom = headroom
+        self.built_at = built_at
+        self._counter_value = counter_value
+        self._current_counter = current_counter
+        self.refresh_interval = refresh_interval
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.refreshes = 0
+
+    def might_exist(self, env, linkid):
+        """
+        Returns False if the link definitely does not exist, True if it has to be looked up
+        """
+        if linkid in self.bloom:
+            return True
+        value = self._counter_value(linkid)
+        if value is not None and value > self.watermark and value <= self._highest_allocated(env, value):
+            return True
+        self.rejected += 1
+        return False
+
+    def _highest_allocated(self, env, value):
+        """
+        Gets the highest counter value known to have been leased, reading the counter if value is beyond it
+        """
+        with self._lock:
+            counter, read_at = self._counters.get(env, (0, None))
+            known = max(self.watermark + self.headroom, counter)
+            if value <= known or self._current_counter is None:
+                return known
+            if read_at is not None and time.monotonic() - read_at < self.refresh_interval:
+                return known
+            # set before reading so other threads do not read it too
+            self._counters[env] = (counter, time.monotonic())
+        try:
+            counter = self._current_counter(env)
+        except Exception as err:
+            logger.error("Could not read the link ID counter, looking the link up: {e}".format(e=err))
+            return value
+        with self._lock:
+            self._counters[env] = (counter, time.monotonic())
+            self.refreshes += 1
+        if counter > self.watermark + self.headroom:
+            logger.warning("The link filter's headroom is used up, it should be rebuilt")
+        return max(self.watermark + self.headroom, counter)
+
+    def save(self, path):
+        """
+        Writes the filter to a file
+        """
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self.bloom.hashes, self.bloom.bits, self.bloom.count, self.watermark, self.headroom, self.built_at))
+            f.write(self.bloom._data)
+
+    @staticmethod
+    def load(path, counter_value, current_counter=None, refresh_interval=1):
+        """
+        Static method which reads a filter written by save
+        """
+        with open(path, "rb") as f:
+            magic, hashes, bits, count, watermark, headroom, built_at = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError("{p} is not a link filter".format(p=path))
+            # the bits are only read, so they can stay immutable bytes
+            bloom = BloomFilter(bits, hashes, data=f.read())
+        bloom.count = count
+        if len(bloom._data) != (bits + 7) // 8:
+            raise ValueError("{p} is truncated".format(p=path))
+        return LinkFilter(bloom, watermark, headroom, built_at, counter_value, current_counter, refresh_interval)
+
+    def stats(self):
+        """
+        Returns the filter's sizes and counters
+        """
+        return {
+            "links": self.bloom.count,
+            "bytes": self.bloom.size(),
+            "hashes": self.bloom.hashes,
+            "expected_error_rate": self.bloom.expected_error_rate(),
+            "watermark": self.watermark,
+            "headroom": self.headroom,
+            "age": time.time() - self.built_at,
+            "rejected": self.rejected,
+            "refreshes": self.refreshes
+        }
+
+def filter_from_environment(counter_value, current_counter):
+    """
+    Loads the link filter named in the environment, returns None if there is no filter so every ID is looked up
+    """
+    path = os.environ.get("link_filter_file", os.path.join(os.path.dirname(os.path.abspath(__file__)), "link_filter.bin"))
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        link_filter = LinkFilter.load(
+            path,
+            counter_value=counter_value,
+            current_counter=current_counter,
+            refresh_interval=float(os.environ.get("link_filter_refresh", 1))
+        )
+    except (IOError, ValueError, struct.error) as err:
+        logger.error("Could not load the link filter, every ID will be looked up: {e}".format(e=err))
+        return None
+    logger.info("Loaded link filter", extra=link_filter.stats())
+    return link_filter
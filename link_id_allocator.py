@@ -0,0 +1,178 @@
+"""
+Module to allocate short link IDs from blocks of a shared counter
+"""
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# the old random IDs are all 4 characters, starting at 5 means allocated IDs can never clash with them
+MIN_LENGTH = 5
+
+FEISTEL_ROUNDS = 4
+
+# longest a leased block is used for, so every value up to the counter is used or abandoned within this time
+BLOCK_MAX_AGE = 600
+
+def _encode(number, length):
+    """
+    Writes number in base62, padded to length characters
+    """
+    chars = []
+    for i in range(length):
+        number, digit = divmod(number, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+def _decode(code):
+    """
+    Reads a base62 code back into a number, returns None if it has characters outside the alphabet
+    """
+    number = 0
+    for c in code:
+        digit = ALPHABET.find(c)
+        if digit < 0:
+            return None
+        number = number * len(ALPHABET) + digit
+    return number
+
+def _round(key, length, r, value, mask):
+    """
+    The round function of the Feistel network
+    """
+    digest = hmac.new(key, "{l}:{r}:{v}".format(l=length, r=r, v=value).encode("ascii"), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], "big") & mask
+
+def _permute(value, size, key, length, inverse=False):
+    """
+    Keyed bijection of [0, size) onto itself, inverse undoes it
+
+    A balanced Feistel network permutes the smallest even-width power of two which covers size, values which land
+    outside [0, size) are put through it again until they come back inside (cycle walking).
+    """
+    bits = (size - 1).bit_length()
+    if bits % 2:
+        bits += 1
+    half = bits // 2
+    mask = (1 << half) - 1
+    while True:
+        left, right = value >> half, value & mask
+        if inverse:
+            for r in reversed(range(FEISTEL_ROUNDS)):
+                left, right = right ^ _round(key, length, r, left, mask), left
+        else:
+            for r in range(FEISTEL_ROUNDS):
+                left, right = right, left ^ _round(key, length, r, right, mask)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+def scramble(number, key, min_length=MIN_LENGTH):
+    """
+    Turns a counter value into a non-guessable code
+
+    Counter values fill all the codes of min_length characters first, then all the codes one character longer and
+    so on, within each length the order is scrambled.  Different numbers always give different codes.
+    """
+    length = min_length
+    while number >= len(ALPHABET) ** length:
+        number -= len(ALPHABET) ** length
+        length += 1
+    size = len(ALPHABET) ** length
+    return _encode(_permute(number, size, key, length), length)
+
+def unscramble(code, key, min_length=MIN_LENGTH):
+    """
+    Turns a code back into the counter value it was made from, returns None if no counter value gives the code
+    """
+    length = len(code)
+    value = _decode(code)
+    if length < min_length or value is None:
+        return None
+    number = _permute(value, len(ALPHABET) ** length, key, length, inverse=True)
+    for shorter in range(min_length, length):
+        number += len(ALPHABET) ** shorter
+    return number
+
+class LinkIdAllocator(object):
+    """
+    Hands out link IDs from blocks of counter values leased from the counters table
+
+    Each block costs one counter update, values left in a block when the container goes away are never used.  A
+    block is abandoned once it is max_age seconds old, so an ID never turns up long after its value was leased.
+    """
+    def __init__(self, lease, key, block_size=100, min_length=MIN_LENGTH, max_age=BLOCK_MAX_AGE, clock=time.monotonic):
+        """
+        Constructor
+
+        lease = function taking env and a count, returning the last value of a newly reserved block of that size
+        key = secret for the scramble, it must never change once IDs have been allocated
+        """
+        self._lease = lease
+        self._key = key
+        self.block_size = block_size
+        self.min_length = min_length
+        self.max_age = max_age
+        self._clock = clock
+        self._blocks = {}
+        self._lock = threading.Lock()
+        self.leases = 0
+
+    def allocate(self, env):
+        """
+        Gets a single new link ID
+        """
+        return self.allocate_many(env, 1)[0]
+
+    def allocate_many(self, env, count):
+        """
+        Gets count new link IDs, at most one counter update is needed
+        """
+        with self._lock:
+            next_value, end, leased = self._blocks.get(env, (1, 0, None))
+            if leased is not None and self._clock() - leased >= self.max_age:
+                next_value, end = 1, 0
+            available = end - next_value + 1
+            numbers = list(range(next_value, next_value + min(available, count)))
+            if len(numbers) < count:
+                # lease one block big enough for the rest of the request
+                size = max(self.block_size, count - len(numbers))
+                end = self._lease(env, size)
+                leased = self._clock()
+                next_value = end - size + 1
+                self.leases += 1
+                logger.info("Leased link ID block %d-%d", next_value, end)
+                needed = count - len(numbers)
+                numbers.extend(range(next_value, next_value + needed))
+                next_value += needed
+            else:
+                next_value += count
+            self._blocks[env] = (next_value, end, leased)
+        return [scramble(n, self._key, self.min_length) for n in numbers]
+
+    def counter_value(self, code):
+        """
+        Gets the counter value an ID was allocated from, None if it was not allocated by an allocator
+        """
+        return unscramble(code, self._key, self.min_length)
+
+def allocator_from_environment(lease):
+    """
+    Creates a LinkIdAllocator using the block size and secret configured in the environment
+    """
+    secret = os.environ.get("link_id_secret")
+    if not secret:
+        logger.warning("link_id_secret is not set, link IDs will be easier to guess")
+        secret = "url-shortener"
+    return LinkIdAllocator(
+        lease=lease,
+        key=secret.encode("utf-8"),
+        block_size=int(os.environ.get("link_id_block_size", 100)),
+        max_age=float(os.environ.get("link_id_block_max_age", BLOCK_MAX_AGE))
+    )
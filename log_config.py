@@ -0,0 +1,96 @@
+"""
+Module to set up logging from the environment, so the hot paths only pay for the log lines which are kept
+"""
+import itertools
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+FORMAT = '%(asctime)s [%(levelname)s] (%(threadName)-10s) %(message)s'
+
+# levels per logger for each profile, "" is the root logger
+PROFILES = {
+    # what the functions have always logged, without the libraries' debug output
+    "standard": {"": "INFO", "botocore": "WARNING", "boto3": "WARNING", "urllib3": "WARNING"},
+    # one access line per request plus anything which goes wrong
+    "redirect": {"": "WARNING", "access": "INFO"},
+    # everything, including a dump of every sampled request
+    "debug": {"": "DEBUG"}
+}
+
+access_logger = logging.getLogger("access")
+
+_configured = False
+
+def parse_levels(value):
+    """
+    Parses levels given as logger=LEVEL pairs separated by commas, e.g. DynamoHandler=DEBUG,botocore=INFO
+    """
+    levels = {}
+    for pair in (value or "").split(","):
+        if not pair.strip():
+            continue
+        name, sep, level = pair.partition("=")
+        level = level.strip().upper()
+        if not sep or not isinstance(logging.getLevelName(level), int):
+            logger.warning("Ignoring log level '{p}'".format(p=pair))
+            continue
+        levels[name.strip()] = level
+    return levels
+
+def configure_logging(default_profile="standard"):
+    """
+    Sets the log levels from the environment, only the first call in a container has any effect
+
+    log_profile picks the profile, log_level overrides the root level and log_levels sets the level of any logger.
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    profile = os.environ.get("log_profile", default_profile).lower()
+    if profile not in PROFILES:
+        logger.warning("Unknown log profile '{p}', using '{d}'".format(p=profile, d=default_profile))
+        profile = default_profile
+    levels = dict(PROFILES[profile])
+    if os.environ.get("log_level"):
+        levels.update(parse_levels("={l}".format(l=os.environ["log_level"])))
+    levels.update(parse_levels(os.environ.get("log_levels")))
+    # does nothing in lambda, where the runtime has already given the root logger a handler
+    logging.basicConfig(format=FORMAT)
+    for (name, level) in levels.items():
+        logging.getLogger(name or None).setLevel(level)
+
+class Sampler(object):
+    """
+    Picks one in every rate calls, a rate of 0 picks none
+    """
+    def __init__(self, rate):
+        """
+        Constructor
+        """
+        self.rate = max(int(rate), 0)
+        self._calls = itertools.count()
+
+    def sample(self):
+        """
+        Returns True if this call is picked
+        """
+        # next on a count is atomic, so threads need no lock
+        return self.rate > 0 and next(self._calls) % self.rate == 0
+
+_request_sampler = Sampler(os.environ.get("log_sample_rate", 100))
+
+def sample_request():
+    """
+    Returns True if this request should be dumped in full, one in log_sample_rate requests are
+    """
+    return _request_sampler.sample()
+
+def log_request(method, path, status, elapsed, action=None):
+    """
+    Logs the one line access entry for a request, elapsed is in seconds
+    """
+    if access_logger.isEnabledFor(logging.INFO):
+        access_logger.info("%s %s %s %s %.1fms", method, path, action or "-", status, elapsed * 1000)
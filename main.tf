@@ -18,6 +18,8 @@ provider "aws" {
 
 provider "archive" {}
 
+provider "random" {}
+
 data "aws_caller_identity" "current" {}
 
 data "aws_route53_zone" "root_zone" {
@@ -38,6 +40,18 @@ resource "null_resource" "lambda_packager" {
     provisioner "local-exec" {
         command = "cp -R ${path.module}/*.py ${path.module}/target_lambda/."
     }
+    /*
+        The link ID filter from tools/build_link_filter.py goes in the package if one has been built
+    */
+    provisioner "local-exec" {
+        command = "if [ -f ${path.module}/link_filter.bin ]; then cp ${path.module}/link_filter.bin ${path.module}/target_lambda/.; fi"
+    }
+    /*
+        The hot link snapshot from tools/export_hot_links.py goes in the package if one has been exported
+    */
+    provisioner "local-exec" {
+        command = "if [ -f ${path.module}/hot_links.bin ]; then cp ${path.module}/hot_links.bin ${path.module}/target_lambda/.; fi"
+    }
 }
 
 data "archive_file" "zip" {
@@ -81,7 +95,8 @@ data "aws_iam_policy_document" "lambda_permissions" {
             "logs:PutLogEvents"
         ]
         resources   = [
-            "arn:aws:logs:${var.region}:${data.aws_caller_identity.current.account_id}:log-group:/aws/lambda/UrlShortener-${var.env}:*"
+            "arn:aws:logs:${var.region}:${data.aws_caller_identity.current.account_id}:log-group:/aws/lambda/UrlShortener-${var.env}:*",
+            "arn:aws:logs:${var.region}:${data.aws_caller_identity.current.account_id}:log-group:/aws/lambda/UrlShortener-${var.env}-redirect:*"
         ]
     }
 
@@ -93,11 +108,21 @@ data "aws_iam_policy_document" "lambda_permissions" {
             "dynamodb:GetItem",
             "dynamodb:UpdateItem",
             "dynamodb:Query",
-            "dynamodb:DeleteItem"
+            "dynamodb:DeleteItem",
+            "dynamodb:BatchWriteItem",
+            "dynamodb:BatchGetItem",
+            "dynamodb:Scan",
+            "dynamodb:TransactWriteItems",
+            "dynamodb:ConditionCheckItem"
         ]
         resources   = [
             "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinks_${var.env}",
-            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinks_${var.env}/index/*"
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinks_${var.env}/index/*",
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinkSearch_${var.env}",
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinkIds_${var.env}",
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinkStats_${var.env}",
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/UrlShortenerLinkChanges_${var.env}",
+            "arn:aws:dynamodb:${var.region}:${data.aws_caller_identity.current.account_id}:table/${var.env}_RycCounters"
         ]
     }
 }
@@ -131,11 +156,61 @@ resource "aws_lambda_function" "lambda" {
 
     environment {
         variables = {
-            environment_name    = var.env
-            cog_client_id       = aws_cognito_user_pool_client.app_client.id
-            cog_client_secret   = aws_cognito_user_pool_client.app_client.client_secret
-            cog_domain          = "${var.authdomain}-${var.env}"
-            region              = var.region
+            environment_name     = var.env
+            cog_client_id        = aws_cognito_user_pool_client.app_client.id
+            cog_client_secret    = aws_cognito_user_pool_client.app_client.client_secret
+            cog_domain           = "${var.authdomain}-${var.env}"
+            region               = var.region
+            search_index         = var.search_index
+            link_id_table        = var.link_id_table
+            link_id_index        = var.link_id_index
+            click_analytics      = var.click_analytics
+            click_flush_interval = var.click_flush_interval
+            redirect_cache_ttl   = var.redirect_cache_ttl
+            hot_links            = var.hot_links
+            ddb_metrics          = var.ddb_metrics
+            log_profile          = var.log_profile
+            log_levels           = var.log_levels
+            log_sample_rate      = var.log_sample_rate
+            link_id_secret       = random_password.link_id_secret.result
+        }
+    }
+}
+
+/*
+    This second function uses the same package but a handler which serves redirects without going through Flask
+*/
+resource "aws_lambda_function" "redirect_lambda" {
+    function_name       = "UrlShortener-${var.env}-redirect"
+
+    filename            = data.archive_file.zip.output_path
+    source_code_hash    = data.archive_file.zip.output_base64sha256
+
+    role                = aws_iam_role.iam_for_lambda.arn
+    handler             = "redirect_function.redirect_handler"
+    runtime             = "python3.6"
+    memory_size         = "256"
+    timeout             = "10"
+
+    environment {
+        variables = {
+            environment_name     = var.env
+            cog_client_id        = aws_cognito_user_pool_client.app_client.id
+            cog_client_secret    = aws_cognito_user_pool_client.app_client.client_secret
+            cog_domain           = "${var.authdomain}-${var.env}"
+            region               = var.region
+            search_index         = var.search_index
+            link_id_table        = var.link_id_table
+            link_id_index        = var.link_id_index
+            click_analytics      = var.click_analytics
+            click_flush_interval = var.click_flush_interval
+            redirect_cache_ttl   = var.redirect_cache_ttl
+            hot_links            = var.hot_links
+            ddb_metrics          = var.ddb_metrics
+            log_profile          = var.redirect_log_profile
+            log_levels           = var.log_levels
+            log_sample_rate      = var.log_sample_rate
+            link_id_secret       = random_password.link_id_secret.result
         }
     }
 }
@@ -164,7 +239,7 @@ resource "aws_api_gateway_integration" "lambda" {
 
     integration_http_method = "POST"
     type                    = "AWS_PROXY"
-    uri                     = aws_lambda_function.lambda.invoke_arn
+    uri                     = var.fast_redirect ? aws_lambda_function.redirect_lambda.invoke_arn : aws_lambda_function.lambda.invoke_arn
 }
 
 /* 
@@ -220,6 +295,13 @@ resource "aws_lambda_permission" "lambda_permission" {
     source_arn = "${aws_api_gateway_rest_api.apigw.execution_arn}/*/*/*"
 }
 
+resource "aws_lambda_permission" "redirect_lambda_permission" {
+    action        = "lambda:InvokeFunction"
+    function_name = aws_lambda_function.redirect_lambda.function_name
+    principal     = "apigateway.amazonaws.com"
+    source_arn = "${aws_api_gateway_rest_api.apigw.execution_arn}/*/*/*"
+}
+
 resource "aws_api_gateway_deployment" "apigwdeploy" {
     depends_on = [
         aws_api_gateway_integration.lambda,
@@ -293,16 +375,153 @@ resource "aws_dynamodb_table" "links_table" {
         type = "S"
     }
 
+    attribute {
+        name = "dt_CreationDate"
+        type = "S"
+    }
+
     point_in_time_recovery {
         enabled = true
     }
 
+    # links with an expiry are deleted by DynamoDB some time after it passes
+    ttl {
+        attribute_name = "ttl_ExpiresAt"
+        enabled        = true
+    }
+
+    # a projection cannot be changed in place, so the policy fields are projected by a second index and this one is
+    # removed once every environment has link_id_index set to LinkIdRedirectIndex
     global_secondary_index {
         name               = "UrlLinkIdIndex"
         hash_key           = "Link_id"
         projection_type    = "INCLUDE"
         non_key_attributes = ["s_Url"]
   }
+
+    global_secondary_index {
+        name               = "LinkIdRedirectIndex"
+        hash_key           = "Link_id"
+        projection_type    = "INCLUDE"
+        non_key_attributes = ["s_Url", "n_RedirectStatus", "n_CacheTtl", "n_Version", "ttl_ExpiresAt"]
+    }
+
+    global_secondary_index {
+        name               = "UserCreationDateIndex"
+        hash_key           = "User_id"
+        range_key          = "dt_CreationDate"
+        projection_type    = "ALL"
+    }
+}
+
+resource "aws_dynamodb_table" "link_search_table" {
+    name            = "UrlShortenerLinkSearch_${var.env}"
+    billing_mode    = "PAY_PER_REQUEST"
+    hash_key        = "Token_id"
+    range_key       = "Link_id"
+
+    attribute {
+        name = "Token_id"
+        type = "S"
+    }
+
+    attribute {
+        name = "Link_id"
+        type = "S"
+    }
+
+    ttl {
+        attribute_name = "ttl_ExpiresAt"
+        enabled        = true
+    }
+}
+
+/*
+    Copy of the links table keyed on the link ID alone, used for strongly consistent lookups and unique IDs
+*/
+resource "aws_dynamodb_table" "link_id_table" {
+    name            = "UrlShortenerLinkIds_${var.env}"
+    billing_mode    = "PAY_PER_REQUEST"
+    hash_key        = "Link_id"
+
+    attribute {
+        name = "Link_id"
+        type = "S"
+    }
+
+    ttl {
+        attribute_name = "ttl_ExpiresAt"
+        enabled        = true
+    }
+}
+
+/*
+    Click counts for each link, per minute and in total
+*/
+resource "aws_dynamodb_table" "link_stats_table" {
+    name            = "UrlShortenerLinkStats_${var.env}"
+    billing_mode    = "PAY_PER_REQUEST"
+    hash_key        = "Link_id"
+    range_key       = "Bucket_id"
+
+    attribute {
+        name = "Link_id"
+        type = "S"
+    }
+
+    attribute {
+        name = "Bucket_id"
+        type = "S"
+    }
+}
+
+/*
+    Log of the links changed or deleted, a partition per day, used to keep hot link snapshots current
+*/
+resource "aws_dynamodb_table" "link_changes_table" {
+    name            = "UrlShortenerLinkChanges_${var.env}"
+    billing_mode    = "PAY_PER_REQUEST"
+    hash_key        = "Day_id"
+    range_key       = "Change_id"
+
+    attribute {
+        name = "Day_id"
+        type = "S"
+    }
+
+    attribute {
+        name = "Change_id"
+        type = "S"
+    }
+
+    # changes are deleted once snapshots old enough to need them are no longer used
+    ttl {
+        attribute_name = "ttl_ExpiresAt"
+        enabled        = true
+    }
+}
+
+resource "aws_dynamodb_table" "counters_table" {
+    name            = "${var.env}_RycCounters"
+    billing_mode    = "PAY_PER_REQUEST"
+    hash_key        = "Counter_id"
+
+    attribute {
+        name = "Counter_id"
+        type = "S"
+    }
+}
+
+/*
+    Key for scrambling link IDs, it must never change once links have been created as IDs could then repeat
+*/
+resource "random_password" "link_id_secret" {
+    length  = 32
+    special = false
+
+    lifecycle {
+        prevent_destroy = true
+    }
 }
 
 resource "aws_cognito_user_pool" "user_pool" {
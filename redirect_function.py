@@ -0,0 +1,101 @@
+"""
+Lambda entry point for short link redirects, kept free of Flask so cold starts stay small
+"""
+import logging
+import os
+import time
+
+from error_handler import proxy_error_handler
+from LinkObject import Link
+from LinkStats import flush_clicks_if_due, record_click
+from dynamo_client import prewarm
+from ddb_metrics import finish_request, start_request
+from log_config import configure_logging, log_request
+from redirect_policy import cache_headers, not_modified
+
+# redirects log a line each unless log_profile asks for more
+configure_logging(default_profile="redirect")
+
+# create the dynamodb client while the container initialises rather than on the first request
+prewarm()
+
+def get_redirect_link_id(event):
+    """
+    Works out the link ID from an API Gateway proxy event, returns None if the event is not a redirect
+    """
+    if event.get("httpMethod") != "GET":
+        return None
+    path = event.get("path") or ""
+    if not path.startswith("/"):
+        return None
+    link_id = path[1:]
+    if not link_id or "/" in link_id or link_id == "_triggerlogin":
+        return None
+    return link_id
+
+def get_header(event, name):
+    """
+    Gets a request header from an API Gateway proxy event, header names are not case sensitive
+    """
+    for (header, value) in (event.get("headers") or {}).items():
+        if header.lower() == name.lower():
+            return value
+    return None
+
+@proxy_error_handler
+def redirect_response(link_id, if_none_match=None):
+    """
+    Builds the API Gateway proxy response for a redirect, matching the response from the redirect route
+
+    A cache revalidating a redirect it holds gets a 304 if the link has not changed since.
+    """
+    redirect = Link.get_redirect_by_id(
+        env = os.environ.get('environment_name'),
+        linkid = link_id
+    )
+    record_click(
+        env = os.environ.get('environment_name'),
+        linkid = link_id
+    )
+    headers = cache_headers(link_id, redirect)
+    if not_modified(if_none_match, link_id, redirect):
+        return {
+            "statusCode": 304,
+            "headers": headers,
+            "body": ""
+        }
+    headers.update({
+        "Content-Type": "text/html; charset=utf-8",
+        "Content-Length": "0",
+        "Location": redirect.url
+    })
+    return {
+        "statusCode": redirect.status,
+        "headers": headers,
+        "body": ""
+    }
+
+def redirect_handler(event, context):
+    """
+    Lambda entry point for redirects which skips Flask, anything which is not a redirect is passed to the Flask app
+    """
+    link_id = get_redirect_link_id(event)
+    if link_id is None:
+        # only now do we need flask
+        from lambda_function import lambda_handler
+        return lambda_handler(event, context)
+    started = time.perf_counter()
+    start_request(route="redirect", counters=Link.get_lookup_counters)
+    response = None
+    try:
+        response = redirect_response(link_id, if_none_match=get_header(event, "If-None-Match"))
+    finally:
+        # errors are turned into responses, so there is only no response if something unexpected went wrong
+        status = response["statusCode"] if response else 500
+        finish_request(status=status)
+        log_request("GET", "/" + link_id, status, time.perf_counter() - started)
+    # the header the CORS extension adds to the Flask responses
+    response["headers"]["Access-Control-Allow-Origin"] = "*"
+    # clicks are written before the function returns, as Lambda freezes the container until the next request
+    flush_clicks_if_due()
+    return response
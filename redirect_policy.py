@@ -0,0 +1,88 @@
+"""
+Module for how a short link redirects and how long the redirect can be cached for
+"""
+import os
+import time
+from collections import namedtuple
+from email.utils import formatdate
+
+from dynamo_codec import to_epoch
+
+# 301 is permanent, 302 and 307 are temporary, 307 keeps the request method
+REDIRECT_STATUSES = [301, 302, 307]
+DEFAULT_STATUS = 301
+# longest a redirect can be cached for, a year
+MAX_CACHE_TTL = 31536000
+
+# what a redirect needs, this is what the link cache holds
+# expires_at is the unix time the link stops redirecting, None for links which do not expire
+Redirect = namedtuple("Redirect", ["url", "status", "cache_ttl", "version", "expires_at"])
+Redirect.__new__.__defaults__ = (None,)
+
+def default_cache_ttl():
+    """
+    Gets how long the redirects of links without their own cache TTL can be cached for, in seconds
+    """
+    return int(os.environ.get("redirect_cache_ttl", 300))
+
+def redirect_from_link(link):
+    """
+    Gets the redirect for a dict of a link's fields, filling in the defaults for any policy it does not have
+    """
+    cache_ttl = link.get("cache_ttl")
+    expires_at = link.get("expires_at")
+    return Redirect(
+        url=link["url"],
+        status=link.get("redirect_status") or DEFAULT_STATUS,
+        cache_ttl=default_cache_ttl() if cache_ttl is None else cache_ttl,
+        version=link.get("version") or 0,
+        expires_at=to_epoch(expires_at) if expires_at else None
+    )
+
+def expired(redirect, now=None):
+    """
+    Returns True if the link of a redirect has expired, DynamoDB can take a while to delete expired links so they
+    have to be checked for when they are read
+    """
+    if not redirect.expires_at:
+        return False
+    return redirect.expires_at <= (time.time() if now is None else now)
+
+def etag(linkid, version):
+    """
+    Gets the entity tag of a link's redirect, it changes whenever the link's version is bumped
+    """
+    return '"{l}-{v}"'.format(l=linkid, v=version)
+
+def cache_headers(linkid, redirect, now=None):
+    """
+    Gets the headers which let browsers and caches in front of the API keep the redirect for its cache TTL
+
+    A TTL of 0 lets a cache keep the redirect but it has to check it is still current with the ETag every time.
+    """
+    now = time.time() if now is None else now
+    cache_ttl = redirect.cache_ttl
+    if redirect.expires_at:
+        # the redirect must not be kept after the link expires
+        cache_ttl = max(0, min(cache_ttl, int(redirect.expires_at - now)))
+    if cache_ttl > 0:
+        cache_control = "public, max-age={t}".format(t=cache_ttl)
+    else:
+        cache_control = "no-cache"
+    return {
+        "Cache-Control": cache_control,
+        "Expires": formatdate(now + cache_ttl, usegmt=True),
+        "ETag": etag(linkid, redirect.version)
+    }
+
+def not_modified(if_none_match, linkid, redirect):
+    """
+    Returns True if the If-None-Match header of a request names the redirect's current ETag
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = etag(linkid, redirect.version)
+    # weak and strong tags compare the same for If-None-Match
+    return any(tag.strip().replace("W/", "", 1) == current for tag in if_none_match.split(","))
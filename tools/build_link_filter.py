@@ -0,0 +1,61 @@
+"""
+Builds the Bloom filter of link IDs which lets the redirect path turn away IDs which do not exist
+
+The link ID counter is read first and recorded in the filter as its watermark.  IDs from later counter values, up to
+--headroom past it or as far as the counter has got, are always looked up, which is how links created after the
+build are found.  IDs from values up to the watermark may
+come from blocks containers leased before the build, so the scan only starts once all those blocks have expired,
+--wait seconds later.  The filter is written to link_filter.bin next to the function code, where the packager picks
+it up, unless --output says otherwise.
+
+Usage: python tools/build_link_filter.py <env> [--error-rate P] [--headroom N] [--segments N] [--wait SECONDS] [--output PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from link_filter import BloomFilter, LinkFilter
+from link_id_allocator import BLOCK_MAX_AGE
+from LinkObject import Link
+
+logger = logging.getLogger(__name__)
+
+# time for a create which had its ID just before a block expired to finish writing, the function timeout
+CREATE_MARGIN = 10
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the link ID Bloom filter")
+    parser.add_argument("env")
+    parser.add_argument("--error-rate", type=float, default=0.01, help="false positive rate the filter is sized for")
+    parser.add_argument("--headroom", type=int, default=1000000, help="link IDs which can be allocated after the build without the counter being read")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--wait", type=float, default=BLOCK_MAX_AGE + CREATE_MARGIN, help="seconds between reading the counter and scanning, at least the block max age")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "link_filter.bin"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    built_at = time.time()
+    watermark = Link._dh_get_current_counter(env=args.env)
+    print("Counter is at {w}, waiting {s}s for blocks leased before now to expire".format(w=watermark, s=args.wait))
+    time.sleep(args.wait)
+
+    linkids = [link.linkid for link in Link.iter_all_links(env=args.env, segments=args.segments)]
+    bloom = BloomFilter.for_capacity(len(linkids), args.error_rate)
+    for linkid in linkids:
+        bloom.add(linkid)
+    link_filter = LinkFilter(bloom, watermark, args.headroom, built_at, Link._id_allocator.counter_value)
+    link_filter.save(args.output)
+    print("Finished, {n} links in {b} bytes with {k} hashes, expected false positive rate {e:.4f}, written to {p}".format(
+        n=bloom.count,
+        b=bloom.size(),
+        k=bloom.hashes,
+        e=bloom.expected_error_rate(),
+        p=args.output
+    ))
+
+if __name__ == '__main__':
+    main()
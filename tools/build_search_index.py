@@ -0,0 +1,46 @@
+"""
+Backfills the link search index from the links table
+
+Safe to run while the application is live with search_index set to 'write', links which change during the run are
+indexed by the application as well.
+
+Usage: python tools/build_search_index.py <env> [--segments N] [--batch N]
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# the index is always written by this tool, whatever the environment says
+os.environ["search_index"] = "write"
+
+from LinkObject import Link
+from LinkSearchIndex import index_links
+
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfills the link search index")
+    parser.add_argument("env")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=100, help="links indexed per batch")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    batch = []
+    count = 0
+    for link in Link.iter_all_links(env=args.env, segments=args.segments):
+        batch.append(link)
+        if len(batch) >= args.batch:
+            index_links(env=args.env, links=batch)
+            count += len(batch)
+            batch = []
+            print("Indexed {n} links".format(n=count))
+    if batch:
+        index_links(env=args.env, links=batch)
+        count += len(batch)
+    print("Finished, indexed {n} links".format(n=count))
+
+if __name__ == '__main__':
+    main()
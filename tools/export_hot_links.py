@@ -0,0 +1,80 @@
+"""
+Writes the snapshot of the most clicked links which the redirect path serves without reading DynamoDB
+
+Links are ranked on their clicks over the last --days days, from the per minute counts in the link stats table.  The
+snapshot is stamped with the time before the links are read, so every change logged after a link was read is also
+after the stamp, and redirects stop serving that link from the snapshot once they have read the change log.  The
+share of the period's clicks which went to the links in the snapshot is printed as the expected hit rate.  The file
+is written to hot_links.bin next to the function code, where the packager picks it up, unless --output says
+otherwise.
+
+Usage: python tools/export_hot_links.py <env> [--top N] [--days N] [--segments N] [--workers N] [--output PATH]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from click_analytics import minute_of
+from hot_links import write_snapshot
+from LinkObject import Link, LinkNotFoundException
+from LinkStats import LinkClickCount
+from redirect_policy import expired, redirect_from_link
+
+logger = logging.getLogger(__name__)
+
+def count_clicks(env, since, segments):
+    """
+    Adds up each link's clicks in the minutes from since onwards
+    """
+    clicks = Counter()
+    for bucket in LinkClickCount._dh_scan_iter(env=env, segments=segments):
+        if bucket["bucket"] >= since:
+            clicks[bucket["linkid"]] += bucket["clicks"]
+    return clicks
+
+def read_redirect(env, linkid):
+    """
+    Reads the current redirect of a link, None if it has been deleted or has expired
+    """
+    try:
+        redirect = redirect_from_link(Link.get_link_by_id(env=env, linkid=linkid).__dict__)
+    except LinkNotFoundException:
+        return None
+    return None if expired(redirect) else redirect
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes the hot link snapshot")
+    parser.add_argument("env")
+    parser.add_argument("--top", type=int, default=5000, help="links in the snapshot")
+    parser.add_argument("--days", type=float, default=7, help="days of clicks the links are ranked on")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=8, help="links read at once")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hot_links.bin"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    clicks = count_clicks(args.env, minute_of(time.time() - args.days * 86400), args.segments)
+    top = [linkid for (linkid, count) in clicks.most_common(args.top)]
+    stamp = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        redirects = dict(zip(top, executor.map(lambda linkid: read_redirect(args.env, linkid), top)))
+    redirects = {linkid: redirect for (linkid, redirect) in redirects.items() if redirect is not None}
+    written = write_snapshot(args.output, args.env, stamp, redirects)
+    total = sum(clicks.values())
+    covered = sum(clicks[linkid] for linkid in redirects)
+    print("Finished, {n} of {l} clicked links written to {p}, expected hit rate {h:.1%} of {c} clicks".format(
+        n=written,
+        l=len(clicks),
+        p=args.output,
+        h=covered / float(total) if total else 0.0,
+        c=total
+    ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Copies the existing links into the table keyed on link ID
+
+Safe to run while the application is live with link_id_table set to 'dual'.  Each link is copied in a transaction
+which only goes ahead if the link still exists, and only fills in attributes the application has not already
+written, so links created, changed or deleted during the run are left as the application wrote them.
+
+Usage: python tools/migrate_link_id_table.py <env> [--segments N] [--workers N] [--batch N]
+"""
+import argparse
+import logging
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from DynamoHandler import IntegrityException
+from LinkObject import Link
+from LinkIdTable import LinkById
+
+logger = logging.getLogger(__name__)
+
+def copy_operations(env, link):
+    """
+    Builds the transaction items which copy one link, without overwriting anything already in the link ID table
+    """
+    mirror = LinkById.from_link(link)
+    item = mirror._dh_prepare_item()
+    attributes = [a for a in item if a not in LinkById._dh_id_fields]
+    condition, values = LinkById.owner_condition(link.id)
+    names = {}
+    set_bits = []
+    for (i, attribute) in enumerate(attributes):
+        names.update({"#a{i}".format(i=i): attribute})
+        values.update({":a{i}".format(i=i): item[attribute]})
+        set_bits.append("#a{i} = if_not_exists(#a{i}, :a{i})".format(i=i))
+    update = {
+        "TableName": mirror._dh_table(env),
+        "Key": mirror._dh_item_keys(),
+        "UpdateExpression": "SET " + ", ".join(set_bits)
+    }
+    return [
+        # skip links which have been deleted since the scan read them
+        link._dh_condition_check_operation(env=env, condition="attribute_exists(Link_id)"),
+        {"Update": LinkById._dh_with_condition(update, condition, values, names)}
+    ]
+
+def copy_link(env, link):
+    """
+    Copies one link, returning 'copied', 'skipped' if it was deleted or the ID is owned by someone else, or 'failed'
+    """
+    try:
+        Link._dh_transact_write(copy_operations(env, link))
+        return "copied"
+    except IntegrityException:
+        return "skipped"
+    except Exception as err:
+        logger.error("Could not copy link {l}: {e}".format(l=link.linkid, e=err))
+        return "failed"
+
+def main():
+    parser = argparse.ArgumentParser(description="Copies links into the table keyed on link ID")
+    parser.add_argument("env")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=8, help="links copied at the same time")
+    parser.add_argument("--batch", type=int, default=1000, help="links read ahead of the copies")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    counts = Counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        batch = []
+        for link in Link.iter_all_links(env=args.env, segments=args.segments):
+            batch.append(link)
+            if len(batch) >= args.batch:
+                counts.update(executor.map(lambda l: copy_link(args.env, l), batch))
+                batch = []
+                print("Processed {n} links".format(n=sum(counts.values())))
+        counts.update(executor.map(lambda l: copy_link(args.env, l), batch))
+    print("Finished, copied {c}, skipped {s}, failed {f}".format(
+        c=counts["copied"],
+        s=counts["skipped"],
+        f=counts["failed"]
+    ))
+    if counts["failed"]:
+        print("Run again to retry the links which failed")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -18,3 +18,68 @@ variable "env" {
 variable "authdomain" {
     description = "Name of cognito domain for hosted UI"
 }
+
+variable "fast_redirect" {
+    description = "Serve short link redirects from the handler which does not use Flask"
+    default     = true
+}
+
+variable "search_index" {
+    description = "How the link search index is used: off, write (maintain it only) or on (maintain it and use it to filter lists)"
+    default     = "off"
+}
+
+variable "link_id_table" {
+    description = "How the table of links keyed on link ID is used: off, dual (keep it in step only) or on (keep it in step and use it to look up links)"
+    default     = "dual"
+}
+
+variable "link_id_index" {
+    description = "The index links are looked up on by ID when the link ID table is not on: UrlLinkIdIndex or LinkIdRedirectIndex once it has been backfilled"
+    default     = "UrlLinkIdIndex"
+}
+
+variable "click_analytics" {
+    description = "Should clicks on short links be counted: on or off"
+    default     = "on"
+}
+
+variable "click_flush_interval" {
+    description = "Longest time in seconds clicks are held in memory before they are written, this bounds the clicks lost if a container goes away"
+    default     = 10
+}
+
+variable "redirect_cache_ttl" {
+    description = "Seconds browsers and caches can keep the redirect of a link which does not set its own cache TTL"
+    default     = 300
+}
+
+variable "hot_links" {
+    description = "Should the most clicked links be served from a snapshot packaged with the functions: on or off.  When on, changes to links are logged so the snapshot is kept current"
+    default     = "off"
+}
+
+variable "ddb_metrics" {
+    description = "Should each request log a CloudWatch embedded metric summary of its DynamoDB calls: on or off"
+    default     = "on"
+}
+
+variable "log_profile" {
+    description = "Logging profile of the API function: standard, redirect (one line per request) or debug"
+    default     = "standard"
+}
+
+variable "redirect_log_profile" {
+    description = "Logging profile of the redirect function: standard, redirect (one line per request) or debug"
+    default     = "redirect"
+}
+
+variable "log_levels" {
+    description = "Levels for individual loggers on top of the profile, e.g. DynamoHandler=DEBUG,botocore=INFO"
+    default     = ""
+}
+
+variable "log_sample_rate" {
+    description = "At the debug level, one in this many API requests has its whole event logged, 0 for none"
+    default     = 100
+}